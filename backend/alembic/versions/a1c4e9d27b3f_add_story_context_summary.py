@@ -0,0 +1,31 @@
+"""Add rolling context summary to story sessions
+
+Revision ID: a1c4e9d27b3f
+Revises: 3eef5252479d
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c4e9d27b3f'
+down_revision: Union[str, Sequence[str], None] = '3eef5252479d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'story_sessions',
+        sa.Column('context_summary', sa.Text(), nullable=False, server_default=''),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('story_sessions', 'context_summary')
@@ -0,0 +1,113 @@
+"""Add append-only story_segments table and backfill it
+
+Revision ID: b7d2f05c8e61
+Revises: a1c4e9d27b3f
+Create Date: 2026-10-17 09:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2f05c8e61'
+down_revision: Union[str, Sequence[str], None] = 'a1c4e9d27b3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 500
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'story_segments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(),
+                  sa.ForeignKey('story_sessions.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('context_token', sa.String(), nullable=False),
+        sa.Column('story_text', sa.Text(), nullable=False),
+        sa.Column('choices', sa.JSON(), nullable=False),
+        sa.Column('audio_path', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('session_id', 'seq', name='uq_story_segments_session_seq'),
+    )
+    op.create_index('ix_story_segments_context_token', 'story_segments',
+                    ['context_token'], unique=True)
+    op.add_column(
+        'story_sessions',
+        sa.Column('current_seq', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    _backfill()
+
+
+def _backfill() -> None:
+    """One row per token in context_history; only the last turn's text is known."""
+    conn = op.get_bind()
+    sessions = sa.table(
+        'story_sessions',
+        sa.column('id', sa.Integer), sa.column('current_story', sa.String),
+        sa.column('current_choices', sa.JSON), sa.column('audio_path', sa.String),
+        sa.column('created_at', sa.DateTime), sa.column('context_history', sa.JSON),
+        sa.column('current_seq', sa.Integer),
+    )
+    segments = sa.table(
+        'story_segments',
+        sa.column('session_id', sa.Integer), sa.column('seq', sa.Integer),
+        sa.column('context_token', sa.String), sa.column('story_text', sa.Text),
+        sa.column('choices', sa.JSON), sa.column('audio_path', sa.String),
+        sa.column('created_at', sa.DateTime),
+    )
+
+    # Tokens already given a row. ix_story_segments_context_token is unique
+    # across the whole table, so this spans every batch, not just one.
+    seen = set()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(sessions)
+            .where(sessions.c.id > last_id)
+            .order_by(sessions.c.id)
+            .limit(BACKFILL_BATCH)
+        ).mappings().all()
+        if not rows:
+            break
+
+        batch = []
+        for row in rows:
+            # dict.fromkeys: a token repeated within one history gets one row too
+            history = [
+                t for t in dict.fromkeys(row['context_history'] or []) if t and t not in seen
+            ]
+            seen.update(history)
+            for seq, token in enumerate(history, start=1):
+                latest = seq == len(history)
+                batch.append({
+                    'session_id': row['id'],
+                    'seq': seq,
+                    'context_token': token,
+                    'story_text': row['current_story'] if latest else '',
+                    'choices': row['current_choices'] if latest else {},
+                    'audio_path': row['audio_path'] if latest else '',
+                    'created_at': row['created_at'],
+                })
+            if history:
+                conn.execute(
+                    sessions.update()
+                    .where(sessions.c.id == row['id'])
+                    .values(current_seq=len(history))
+                )
+        if batch:
+            conn.execute(segments.insert(), batch)
+        last_id = rows[-1]['id']
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('story_sessions', 'current_seq')
+    op.drop_index('ix_story_segments_context_token', table_name='story_segments')
+    op.drop_table('story_segments')
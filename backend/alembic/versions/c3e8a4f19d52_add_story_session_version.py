@@ -0,0 +1,31 @@
+"""Add optimistic-concurrency version to story sessions
+
+Revision ID: c3e8a4f19d52
+Revises: b7d2f05c8e61
+Create Date: 2026-10-17 13:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a4f19d52'
+down_revision: Union[str, Sequence[str], None] = 'b7d2f05c8e61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'story_sessions',
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('story_sessions', 'version')
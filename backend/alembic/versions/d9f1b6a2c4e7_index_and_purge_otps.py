@@ -0,0 +1,42 @@
+"""Partial index on unused OTPs and expiry index for purging
+
+Revision ID: d9f1b6a2c4e7
+Revises: c3e8a4f19d52
+Create Date: 2026-10-17 15:05:00.000000
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f1b6a2c4e7'
+down_revision: Union[str, Sequence[str], None] = 'c3e8a4f19d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Used and long-expired codes are dead weight; drop them before indexing.
+    # expires_at is naive UTC (datetime.utcnow()), so the cutoff is too.
+    otps = sa.table('otps', sa.column('is_used', sa.Boolean), sa.column('expires_at', sa.DateTime))
+    cutoff = datetime.utcnow() - timedelta(days=1)
+    op.execute(
+        sa.delete(otps).where(sa.or_(otps.c.is_used.is_(True), otps.c.expires_at < cutoff))
+    )
+    op.create_index(
+        'ix_otps_email_code_unused', 'otps', ['email', 'otp_code'],
+        postgresql_where=sa.text('is_used = false'),
+        sqlite_where=sa.text('is_used = 0'),
+    )
+    op.create_index('ix_otps_expires_at', 'otps', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_otps_expires_at', table_name='otps')
+    op.drop_index('ix_otps_email_code_unused', table_name='otps')
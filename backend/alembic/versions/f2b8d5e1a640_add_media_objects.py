@@ -0,0 +1,39 @@
+"""Add media_objects reference counts and index segment audio paths
+
+Revision ID: f2b8d5e1a640
+Revises: e4a7c2d9b813
+Create Date: 2026-10-17 18:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d5e1a640'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c2d9b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing files get no rows; media_gc checks them against
+    # users.profile_picture / story_segments.audio_path before deleting.
+    op.create_table(
+        'media_objects',
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('refcount', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('path'),
+    )
+    op.create_index('ix_story_segments_audio_path', 'story_segments', ['audio_path'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_story_segments_audio_path', table_name='story_segments')
+    op.drop_table('media_objects')
@@ -0,0 +1,197 @@
+"""
+src/audio_cache.py
+
+Content-addressed store for synthesized speech.
+
+Blobs are named by a SHA-256 of the filtered text plus the voice settings,
+so identical segments (fallback text, replays, retries) are synthesized once
+and then hard-linked to every segment path that needs them.
+
+ • size-bounded LRU eviction (TTS_CACHE_MAX_BYTES); media_gc also discards
+   the blob behind a published audio/<key>.mp3 it collects
+
+ • JSON index next to the blobs, so LRU order survives restarts
+ • blobs are written to a temp file and os.replace()d into place, and
+   concurrent requests for one key wait on a per-key lock instead of
+   synthesizing the same text twice
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "audio_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Persist LRU order after this many hits even if nothing was added or evicted.
+_INDEX_FLUSH_EVERY = 64
+
+
+def cache_key(text: str, **voice: object) -> str:
+    """Stable key for `text` rendered with the given voice settings."""
+    settings = json.dumps(voice, sort_keys=True)
+    return hashlib.sha256(f"{settings}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, root: str | Path = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._index_path = self.root / "index.json"
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, LRU first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._unsaved_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    # ───────────── public API ─────────────
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.mp3"
+
+    def get_or_create(self, key: str, synthesize: Callable[[Path], None]) -> Path:
+        """Return the blob for `key`, calling `synthesize(tmp_path)` on a miss."""
+        blob = self._lookup(key)
+        if blob is not None:
+            return blob
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Someone else may have produced it while we waited.
+                blob = self._lookup(key)
+                if blob is not None:
+                    return blob
+                return self._create(key, synthesize)
+        finally:
+            with self._lock:
+                if not key_lock.locked():
+                    self._key_locks.pop(key, None)
+
+    def link_to(self, blob: Path, target: str | Path) -> None:
+        """Atomically expose `blob` at `target`, sharing the file when possible."""
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            os.link(blob, tmp)
+        except OSError:  # cross-device or no hard-link support
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, target)
+
+    def discard(self, key: str) -> None:
+        """Forget and delete the blob for `key` (its published file is gone)."""
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)
+            self.path_for(key).unlink(missing_ok=True)
+            self._save_index()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # ───────────── internals ─────────────
+    def _lookup(self, key: str) -> Path | None:
+        blob = self.path_for(key)
+        with self._lock:
+            if key in self._entries:
+                if blob.exists():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._unsaved_hits += 1
+                    if self._unsaved_hits >= _INDEX_FLUSH_EVERY:
+                        self._save_index()
+                    return blob
+                self._total -= self._entries.pop(key)
+            elif blob.exists():
+                # Written by another worker process sharing the directory.
+                self._add(key, blob.stat().st_size)
+                self.hits += 1
+                self._save_index()
+                return blob
+        return None
+
+    def _create(self, key: str, synthesize: Callable[[Path], None]) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        blob = self.path_for(key)
+        tmp = self.root / f".{key}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            synthesize(tmp)
+            os.replace(tmp, blob)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        with self._lock:
+            self.misses += 1
+            self._add(key, blob.stat().st_size)
+            self._evict()
+            self._save_index()
+        return blob
+
+    def _add(self, key: str, size: int) -> None:
+        if key in self._entries:
+            self._total -= self._entries[key]
+        self._entries[key] = size
+        self._entries.move_to_end(key)
+        self._total += size
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.path_for(key).unlink(missing_ok=True)
+            logger.info("Evicted TTS blob %s (%d bytes)", key, size)
+
+    def _load_index(self) -> None:
+        try:
+            raw = json.loads(self._index_path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable TTS cache index %s: %s", self._index_path, e)
+            return
+
+        # Stored as [key, size] pairs, least recently used first.
+        for key, size in raw.get("entries", []):
+            if self.path_for(key).exists():
+                self._add(key, int(size))
+        self._evict()
+
+    def _save_index(self) -> None:
+        """Write the index atomically; caller holds self._lock."""
+        self._unsaved_hits = 0
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self._index_path.with_name(f".index.{uuid.uuid4().hex[:8]}.tmp")
+            tmp.write_text(json.dumps({
+                "saved_at": time.time(),
+                "entries": [[k, s] for k, s in self._entries.items()],
+            }))
+            os.replace(tmp, self._index_path)
+        except OSError as e:
+            logger.warning("Could not persist TTS cache index: %s", e)
+
+
+cache = AudioCache()
@@ -2,38 +2,31 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request,File, Upl
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
+import asyncio
 import requests
 import os
 from src.crud import get_user_by_id
 import pyotp
-from PIL import Image 
 import jwt  # PyJWT
 from jwt.exceptions import PyJWTError
 import logging
-import smtplib
 import uuid
-import ssl
 from typing import Annotated
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.utils import formataddr
 from pydantic import BaseModel
 from typing import Optional
-import time  # For retry logic
 import secrets  # For generating secure tokens
-from src.email_templete import render_email_template
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from src.security import verify_password , get_password_hash
+from src.security import PasswordHasherBusy, hasher, verify_password_async
 from src.database import get_db
-from src.schemas import UserCreate, User, Token, PasswordReset, NewPassword , LoginRequest , UserUpdate
+from src.schemas import UserCreate, User, UserInDB, Token, PasswordReset, NewPassword , LoginRequest , UserUpdate
+from src import google_certs, mailer, principal_cache, profile_images
 from src.auth_utils import create_access_token, decode_token, authenticate_user
 from src.crud import (
     get_user_by_email, create_user, update_user_password,
-    create_otp, mark_otp_as_used, get_otp_by_email_and_code,
+    create_otp, consume_otp, get_latest_otp, enqueue_email,
     update_user_verified,
     get_user_by_identifier,
-    get_user_by_username,update_reset_password_otp_verified,
+    get_user_by_username,update_reset_password_otp_verified, set_password_hash,
+    set_reset_password_otp_verified_by_email,
     update_user
 )
 from src.utils import generate_unique_username
@@ -55,19 +48,6 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 200))
 
-# SMTP configuration - Updated for better reliability
-SMTP_SERVER = os.getenv("SMTP_SERVER", "mail.alphanetwork.com.pk")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))  # Changed to 587 for STARTTLS
-SMTP_USERNAME = os.getenv("SMTP_USERNAME", "no-reply@alphanetwork.com.pk")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "Hang1122@123")
-SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
-SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
-SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
-
-# Ensure SMTP credentials are loaded
-if not SMTP_USERNAME or not SMTP_PASSWORD:
-    logger.error("SMTP credentials (username or password) not found. Please set SMTP_USERNAME and SMTP_PASSWORD environment variables.")
-
 # OTP Settings
 OTP_EXPIRY_MINUTES = 10
 
@@ -75,156 +55,21 @@ OTP_EXPIRY_MINUTES = 10
 def generate_otp():
     return pyotp.TOTP(pyotp.random_base32()).now()
 
-# Enhanced SMTP email sending function
-def send_otp_email_via_smtp(to_email: str, otp: str) -> bool:
-    """
-    Send OTP email via SMTP with improved error handling and multiple configuration options
-    """
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg["From"] = formataddr(("LingoFlow", SMTP_USERNAME))
-        msg["To"] = to_email
-        msg["Subject"] = "Your LingoFlow Verification Code"
-        msg.attach(MIMEText(render_email_template(otp, otp_expiry_minutes=10), "html"))
-
-        # Try different SMTP configurations
-        smtp_configs = [
-            # Configuration 1: STARTTLS (most common)
-            {
-                "server": SMTP_SERVER,
-                "port": 587,
-                "use_tls": True,
-                "use_ssl": False
-            },
-            # Configuration 2: SSL/TLS
-            {
-                "server": SMTP_SERVER,
-                "port": 465,
-                "use_tls": False,
-                "use_ssl": True
-            },
-            # Configuration 3: Plain (not recommended but sometimes needed)
-            {
-                "server": SMTP_SERVER,
-                "port": 25,
-                "use_tls": False,
-                "use_ssl": False
-            },
-            # Configuration 4: User-defined port with TLS
-            {
-                "server": SMTP_SERVER,
-                "port": SMTP_PORT,
-                "use_tls": SMTP_USE_TLS,
-                "use_ssl": SMTP_USE_SSL
-            }
-        ]
+async def queue_otp_email(
+    db: AsyncSession, email: str, template: str = "verification", commit: bool = True
+) -> str:
+    """Store a fresh OTP and queue its email in the same transaction.
 
-        last_error = None
-        
-        for config in smtp_configs:
-            try:
-                logger.info(f"Attempting SMTP connection to {config['server']}:{config['port']} (TLS: {config['use_tls']}, SSL: {config['use_ssl']})")
-                
-                if config['use_ssl']:
-                    # Use SMTP_SSL for SSL connections
-                    context = ssl.create_default_context()
-                    server = smtplib.SMTP_SSL(config['server'], config['port'], timeout=SMTP_TIMEOUT, context=context)
-                else:
-                    # Use regular SMTP
-                    server = smtplib.SMTP(config['server'], config['port'], timeout=SMTP_TIMEOUT)
-                    
-                    if config['use_tls']:
-                        server.starttls()
-                
-                # Login and send
-                server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                server.send_message(msg)
-                server.quit()
-                
-                logger.info(f"OTP email sent successfully to {to_email} via {config['server']}:{config['port']}")
-                return True
-                
-            except Exception as config_error:
-                last_error = config_error
-                logger.warning(f"SMTP config {config['server']}:{config['port']} failed: {str(config_error)}")
-                continue
-        
-        # If all configurations failed
-        logger.error(f"All SMTP configurations failed. Last error: {str(last_error)}")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Critical SMTP error: {str(e)}")
-        return False
-
-# Email delivery function with retry logic
-def deliver_otp(email: str, otp: str, max_retries: int = 3) -> bool:
-    """
-    Deliver OTP with retry logic
-    """
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempting to send OTP to {email} (attempt {attempt + 1}/{max_retries})")
-            
-            if send_otp_email_via_smtp(email, otp):
-                return True
-            
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                
-        except Exception as e:
-            logger.error(f"Delivery attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-    
-    logger.error(f"Failed to deliver OTP to {email} after {max_retries} attempts. OTP: {otp}")
-    return False
-
-# Test SMTP connection function
-def test_smtp_connection() -> dict:
-    """
-    Test SMTP connection and return status
+    Delivery happens in the email_outbox worker, so SMTP trouble never
+    blocks the request.
     """
-    test_configs = [
-        {"server": SMTP_SERVER, "port": 587, "use_tls": True, "use_ssl": False},
-        {"server": SMTP_SERVER, "port": 465, "use_tls": False, "use_ssl": True},
-        {"server": SMTP_SERVER, "port": 25, "use_tls": False, "use_ssl": False},
-    ]
-    
-    results = []
-    
-    for config in test_configs:
-        try:
-            if config['use_ssl']:
-                context = ssl.create_default_context()
-                server = smtplib.SMTP_SSL(config['server'], config['port'], timeout=10, context=context)
-            else:
-                server = smtplib.SMTP(config['server'], config['port'], timeout=10)
-                if config['use_tls']:
-                    server.starttls()
-            
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.quit()
-            
-            results.append({
-                "config": f"{config['server']}:{config['port']}",
-                "tls": config['use_tls'],
-                "ssl": config['use_ssl'],
-                "status": "SUCCESS"
-            })
-            
-        except Exception as e:
-            results.append({
-                "config": f"{config['server']}:{config['port']}",
-                "tls": config['use_tls'],
-                "ssl": config['use_ssl'],
-                "status": f"FAILED: {str(e)}"
-            })
-    
-    return {"smtp_tests": results}
+    otp = generate_otp()
+    expires_at = datetime.utcnow() + timedelta(minutes=OTP_EXPIRY_MINUTES)
+    await create_otp(db, email, otp, expires_at, commit=False)
+    await enqueue_email(
+        db, email, template, {"otp": otp, "otp_expiry_minutes": OTP_EXPIRY_MINUTES}, commit=commit
+    )
+    return otp
 
 # Pydantic Model for Verify Email Request
 class VerifyEmailRequest(BaseModel):
@@ -240,19 +85,15 @@ async def verify_email(
     email = request.email
     otp_code = request.otp
 
-    # Validate OTP
-    otp = await get_otp_by_email_and_code(db, email, otp_code)
-    if not otp or otp.expires_at < datetime.utcnow() or otp.is_used:
+    # Validate and consume the OTP, then mark the user verified – one transaction
+    if not await consume_otp(db, email, otp_code, commit=False):
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired OTP"
         )
-
-    # Mark OTP as used
-    await mark_otp_as_used(db, otp.id)
-
-    # Mark user as verified
-    await update_user_verified(db, email)
+    await update_user_verified(db, email, commit=False)
+    await db.commit()
 
     return {"message": "Email verified successfully"}
 
@@ -269,22 +110,8 @@ async def resend_otp(request: ResendOTPRequest, db: AsyncSession = Depends(get_d
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    # Generate a new OTP
-    otp = generate_otp()
-    expires_at = datetime.utcnow() + timedelta(minutes=OTP_EXPIRY_MINUTES)
-
-    # Store the new OTP in the database
-    await create_otp(db, email, otp, expires_at)
-
-    # Send OTP via email with improved error handling
-    if not deliver_otp(email, otp):
-        # Don't fail the request, but log the issue
-        logger.error(f"Failed to send OTP email to {email}, but OTP was stored in database")
-        # You might want to implement a fallback notification mechanism here
-        return {
-            "message": "OTP generated successfully. If email delivery fails, please contact support.",
-            "otp_for_testing": otp if os.getenv("DEBUG", "false").lower() == "true" else None
-        }
+    # Store a new OTP and queue its email
+    await queue_otp_email(db, email)
 
     return {"message": "OTP resent successfully"}
 
@@ -297,7 +124,7 @@ async def test_smtp():
     if os.getenv("DEBUG", "false").lower() != "true":
         raise HTTPException(status_code=404, detail="Not found")
     
-    return test_smtp_connection()
+    return await asyncio.to_thread(mailer.test_smtp_connection)
 
 # ─────────── SIGN-UP ───────────
 @router.post("/signup", response_model=User, status_code=status.HTTP_201_CREATED)
@@ -312,30 +139,18 @@ async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)) -> User:
     username = user.username or await generate_unique_username(db)
 
     try:
-        # send OTP
-        otp = generate_otp()
-        expires_at = datetime.utcnow() + timedelta(minutes=OTP_EXPIRY_MINUTES)
-        
-        await create_otp(db, user.email, otp, expires_at)
+        # OTP, its email and the user are committed together by create_user
+        await queue_otp_email(db, user.email, commit=False)
 
-        # Try to send email, but don't fail signup if it fails
-        email_sent = deliver_otp(user.email, otp)
-        
         # persist user
         user_data = user.model_dump()
         user_data["username"] = username
         created_user = await create_user(db, user_data)
-        
-        response_data = {
-            "user": created_user,
-            "email_sent": email_sent
-        }
-        
-        if not email_sent and os.getenv("DEBUG", "false").lower() == "true":
-            response_data["otp_for_testing"] = otp
-        
+
         return created_user
 
+    except PasswordHasherBusy:
+        raise  # main.py answers 503 + Retry-After; not a failed signup
     except Exception as e:
         logger.error(f"Signup failed for {user.email}: {e}")
         raise HTTPException(status_code=500, detail="Registration failed, please try again")
@@ -344,10 +159,16 @@ async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)) -> User:
 @router.post("/login")
 async def login(data: LoginRequest, db: AsyncSession = Depends(get_db)):
     user: User = await get_user_by_identifier(db, data.identifier)
-    
-    if not user or not verify_password(data.password, user.hashed_password):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    valid, new_hash = await hasher.verify_and_update(data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made
+        await set_password_hash(db, user.id, new_hash)
+
     access_token = create_access_token({"sub": str(user.id)})
 
     return {
@@ -366,18 +187,9 @@ async def forgot_password(
     if not user:
         return {"message": "If the email exists, an OTP will be sent"}
 
-    otp = generate_otp()
-    expires_at = datetime.utcnow() + timedelta(minutes=OTP_EXPIRY_MINUTES)
+    await queue_otp_email(db, reset.email, template="password_reset")
 
-    await create_otp(db, reset.email, otp, expires_at)
-    
-    email_sent = deliver_otp(reset.email, otp)
-    
-    response = {"message": "OTP for password reset sent"}
-    if not email_sent and os.getenv("DEBUG", "false").lower() == "true":
-        response["otp_for_testing"] = otp
-
-    return response
+    return {"message": "OTP for password reset sent"}
 
 class NewPassword(BaseModel):
     email: str
@@ -413,26 +225,22 @@ async def verify_reset_otp(
     email = request.email
     otp_code = request.otp
 
-    # Fetch OTP from the database using the provided email and OTP code
-    otp = await get_otp_by_email_and_code(db, email, otp_code)
-    
-    if not otp:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP not found")
-    
-    if otp.expires_at < datetime.utcnow():
+    # Consume the OTP and allow the reset in one transaction
+    if not await consume_otp(db, email, otp_code, commit=False):
+        await db.rollback()
+        # Failure path only: look the code up again to say why it was refused
+        otp = await get_latest_otp(db, email, otp_code)
+        if not otp:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP not found")
+        if otp.is_used:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP has already been used")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP has expired")
-    
-    if otp.is_used:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP has already been used")
 
-    # OTP is valid, update the user's `reset_password_otp_verified` field
-    user = await get_user_by_email(db, email)
-    
+    user = await set_reset_password_otp_verified_by_email(db, email, True, commit=False)
     if not user:
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
-    # Update the reset_password_otp_verified field
-    await update_reset_password_otp_verified(db, user.id, True)
+    await db.commit()
     
     return {"message": "OTP successfully verified and password reset allowed"}
 
@@ -455,10 +263,9 @@ async def google_login(
         )
 
     try:
-        # Verify the ID token with Google's public keys
-        idinfo = id_token.verify_oauth2_token(
+        # Verify the ID token locally against Google's cached public keys
+        idinfo = await google_certs.cache.verify(
             google_request.id_token,
-            google_requests.Request(),
             audience=os.getenv("GOOGLE_CLIENT_ID")
         )
         
@@ -488,6 +295,12 @@ async def google_login(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid ID token: {str(e)}"
         )
+    except requests.RequestException as e:
+        logger.error(f"Could not fetch Google signing certs: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google sign-in is temporarily unavailable"
+        )
 
     # Check if user exists
     existing_user = await get_user_by_email(db, email)
@@ -546,11 +359,11 @@ async def google_login(
         }
     }
 
-# Dependency to get the current user from the JWT token
+# Dependency to get the current user from the JWT token (cached, read-only)
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
-) -> User:
+) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -563,10 +376,14 @@ async def get_current_user(
             raise credentials_exception
     except Exception:
         raise credentials_exception
+
+    principal = principal_cache.cache.get(int(user_id))
+    if principal is not None:
+        return principal
     user = await get_user_by_id(db, user_id)
     if user is None:
         raise credentials_exception
-    return user
+    return principal_cache.cache.put(user)
 
 # GET /me route
 @router.get("/me", response_model=User)
@@ -590,23 +407,21 @@ async def change_password(
     - Current password must be valid.
     - New password must be different and meet minimum requirements.
     """
-    # Fetch the user from the database
+    # current_user may be a cached principal; credentials come from the primary
     user = await get_user_by_id(db, current_user.id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
     # Verify current password
-    if not verify_password(request.current_password, user.hashed_password):
+    if not await verify_password_async(request.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
 
-    # Prevent using the same password
-    if verify_password(request.new_password, user.hashed_password):
+    # Prevent using the same password (the hash just matched current_password,
+    # so comparing the plain texts saves a second bcrypt round)
+    if request.new_password == request.current_password:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from the current password"
@@ -639,17 +454,16 @@ async def change_password(
             detail="New password must contain at least one special character"
         )
 
-    # Hash and update the new password
-    hashed_password = get_password_hash(request.new_password)
-    await update_user_password(db, user.email, hashed_password)
+    # update_user_password hashes the new password itself
+    await update_user_password(db, user.email, request.new_password)
     return {"message": "Password changed successfully"}
 
 
-UPLOAD_DIR = "media/profile_pics"
+UPLOAD_DIR = profile_images.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Allowed file extensions
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -668,7 +482,7 @@ async def upload_profile_picture(
     if not allowed_file(file.filename):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid file type. Only images (jpg, jpeg, png, gif) are allowed."
+            detail="Invalid file type. Only images (jpg, jpeg, png, gif, webp) are allowed."
         )
 
     # Validate file size (e.g., max 5MB)
@@ -681,35 +495,29 @@ async def upload_profile_picture(
         )
     file.file.seek(0)  # Reset pointer
 
-    # Generate unique filename to avoid conflicts
-    ext = file.filename.split(".")[-1]
-    filename = f"{current_user.id}_{uuid.uuid4().hex[:8]}.{ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-
-    # Optional: Resize image (e.g., to 300x300)
+    # Decode, rotate, crop and resize in the image worker pool; files are
+    # named by content, so a re-upload reuses them
     try:
-        image = Image.open(file.file) # <-- This line needs 'from PIL import Image'
-        image = image.convert("RGB")  # Ensure format consistency
-        image = image.resize((300, 300), Image.Resampling.LANCZOS) # <-- This line needs 'from PIL import Image'
-        image.save(file_path, "JPEG", quality=85)
-    except Exception as e:
+        data = await file.read()
+        variants = await profile_images.processor.process(data)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Failed to process image: {str(e)}"
         )
     finally:
-        file.file.close()
+        await file.close()
 
     # Update user's profile_picture field in DB
-    current_user.profile_picture = f"/media/profile_pics/{filename}"
-    await db.commit()
-    await db.refresh(current_user)
+    updated_user = await update_user(
+        db, current_user.id, {"profile_picture": profile_images.primary_url(variants)}
+    )
 
     return {
         "message": "Profile picture uploaded successfully",
-        # --- Fix the typo here ---
-        "profile_picture": current_user.profile_picture # <-- Was profile_profile_picture
-        # --- End fix ---
+        "profile_picture": updated_user.profile_picture,
+        "variants": variants,
+        "srcset": profile_images.format_srcset(variants),
     }
 # --- End of your existing code ---
 @router.patch("/api/users/me") # Ensure this path matches your OpenAPI spec
@@ -724,13 +532,8 @@ async def update_user_profile(
     Only fields provided in the request will be updated.
     Email and username updates have additional validation.
     """
-    # Get the current user from DB (fresh data)
-    db_user = await get_user_by_id(db, current_user.id)
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+    # The principal is a fresh-enough snapshot; crud invalidates it on writes
+    db_user = current_user
 
     # Prepare update data, filtering out None values (using Pydantic's exclude_unset)
     update_data = user_update.model_dump(exclude_unset=True)
@@ -741,7 +544,7 @@ async def update_user_profile(
     if not update_data:
         return {
             "message": "No data provided for update.",
-            "user": db_user
+            "user": User.model_validate({f: getattr(db_user, f) for f in User.model_fields})
         }
 
     # Validate email if provided
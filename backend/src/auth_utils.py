@@ -10,7 +10,7 @@ from jose import jwt, JWTError
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.security import verify_password
+from src.security import verify_password_async
 from src.crud import get_user_by_email, get_user_by_username
 
 load_dotenv()
@@ -53,6 +53,6 @@ async def authenticate_user(
     else:
         user = await get_user_by_username(db, identifier)
 
-    if user and verify_password(password, user.hashed_password):
+    if user and await verify_password_async(password, user.hashed_password):
         return user.id
     return None
@@ -1,27 +1,59 @@
 # src/crud.py
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-from sqlalchemy import select
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import case, delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.models import User, OTP, StorySession
+from src import database, media_store, principal_cache
+from src.models import User, OTP, StorySession, StorySegment, EmailOutbox, MediaObject
+from src.session_cache import SessionState, cache as session_cache
 from src.schemas import StoryStart
-from src.security import get_password_hash
+from src.security import hash_password
 from sqlalchemy import update as sql_update
 
+# Live (unused) codes kept per email; older ones are dropped on each new code.
+OTP_MAX_ACTIVE_PER_EMAIL = int(os.getenv("OTP_MAX_ACTIVE_PER_EMAIL", "3"))
+
+# Set in session.info by enqueue_email(); email_outbox wakes its worker when
+# such a session commits.
+OUTBOX_ENQUEUED_KEY = "email_outbox_enqueued"
+
+# ────────────────────────────────────────────────────────────
+# Replica reads
+# ────────────────────────────────────────────────────────────
+async def _execute_read(db: AsyncSession, stmt: Any):
+    """Run a read-only statement on the replica when that is safe, else on `db`.
+
+    Rows read from the replica come back detached from `db`; helpers routed
+    here are only used for lookups, never for objects that get modified.
+    """
+    if database.router.use_replica(db):
+        try:
+            async with database.ReadSessionLocal() as replica:
+                return await replica.execute(stmt)
+        except (DBAPIError, OSError, asyncio.TimeoutError) as exc:
+            database.router.mark_unhealthy(exc)
+    return await db.execute(stmt)
+
+
 # ────────────────────────────────────────────────────────────
 # User helpers
 # ────────────────────────────────────────────────────────────
 async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
-    res = await db.execute(select(User).where(User.email == email))
+    res = await _execute_read(db, select(User).where(User.email == email))
     return res.scalars().first()
 
 
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
-    res = await db.execute(select(User).where(User.username == username))
+    res = await _execute_read(db, select(User).where(User.username == username))
     return res.scalars().first()
 
 
@@ -34,50 +66,91 @@ async def get_user_by_identifier(db: AsyncSession, ident: str) -> Optional[User]
 
 async def create_user(db: AsyncSession, data: dict[str, Any]) -> User:
     """`data` comes from `UserCreate.model_dump()` plus injected `username`."""
-    hashed_pw = get_password_hash(data["password"])
-    db_user = User(
-        email=data["email"],
-        username=data["username"],
-        first_name=data["first_name"],
-        last_name=data["last_name"],
-        country=data.get("country"),
-        city=data.get("city"),
-        phone_number=data.get("phone_number"),
-        date_of_birth=data.get("date_of_birth"),
-        hashed_password=hashed_pw,
-    )
-    db.add(db_user)
+    hashed_pw = await hash_password(data["password"])
+    stmt = (
+        insert(User)
+        .values(
+            email=data["email"],
+            username=data["username"],
+            first_name=data["first_name"],
+            last_name=data["last_name"],
+            country=data.get("country"),
+            city=data.get("city"),
+            phone_number=data.get("phone_number"),
+            date_of_birth=data.get("date_of_birth"),
+            hashed_password=hashed_pw,
+        )
+        .returning(User)
+    )
+    db_user = (await db.execute(stmt)).scalar_one()
     await db.commit()
-    await db.refresh(db_user)
     return db_user
 
 
-async def update_user_password(db: AsyncSession, email: str, new_pw: str) -> None:
-    user = await get_user_by_email(db, email)
-    if user:
-        user.hashed_password = get_password_hash(new_pw)
+async def _update_user_where(
+    db: AsyncSession, condition: Any, values: Dict[str, Any], commit: bool = True
+) -> Optional[User]:
+    """UPDATE users … RETURNING * – one round trip, no read before or after."""
+    stmt = (
+        sql_update(User)
+        .where(condition)
+        .values(**values)
+        .returning(User)
+        .execution_options(populate_existing=True)
+    )
+    user = (await db.execute(stmt)).scalars().first()
+    if user is not None:
+        principal_cache.invalidate_on_commit(db.sync_session, user.id)
+    if commit:
         await db.commit()
-        await db.refresh(user)
+    return user
 
 
-async def update_user_verified(db: AsyncSession, email: str) -> None:
-    user = await get_user_by_email(db, email)
-    if user:
-        user.is_verified = True
-        await db.commit()
-        await db.refresh(user)
+async def update_user_password(db: AsyncSession, email: str, new_pw: str) -> Optional[User]:
+    """`new_pw` is the plain-text password; it is hashed here."""
+    return await _update_user_where(
+        db, User.email == email, {"hashed_password": await hash_password(new_pw)}
+    )
+
+
+async def set_password_hash(db: AsyncSession, user_id: int, hashed_pw: str) -> None:
+    """Store an already computed hash, e.g. a rehash at a new bcrypt cost."""
+    await _update_user_where(db, User.id == user_id, {"hashed_password": hashed_pw})
+
+
+async def update_user_verified(db: AsyncSession, email: str, commit: bool = True) -> Optional[User]:
+    return await _update_user_where(db, User.email == email, {"is_verified": True}, commit)
 
 
 # ────────────────────────────────────────────────────────────
 # OTP helpers
 # ────────────────────────────────────────────────────────────
 async def create_otp(
-    db: AsyncSession, email: str, code: str, expires_at: datetime
+    db: AsyncSession, email: str, code: str, expires_at: datetime, commit: bool = True
 ) -> OTP:
-    otp = OTP(email=email, otp_code=code, expires_at=expires_at)
-    db.add(otp)
-    await db.commit()
-    await db.refresh(otp)
+    """Store a new code and drop this email's older live codes beyond the cap."""
+    stmt = (
+        insert(OTP)
+        .values(email=email, otp_code=code, expires_at=expires_at)
+        .returning(OTP)
+    )
+    otp = (await db.execute(stmt)).scalar_one()
+
+    keep = (
+        select(OTP.id)
+        .where(OTP.email == email, OTP.is_used.is_(False))
+        .order_by(OTP.id.desc())
+        .limit(OTP_MAX_ACTIVE_PER_EMAIL)
+    )
+    await db.execute(
+        delete(OTP).where(
+            OTP.email == email,
+            OTP.is_used.is_(False),
+            OTP.id.not_in(keep.scalar_subquery()),
+        )
+    )
+    if commit:
+        await db.commit()
     return otp
 
 
@@ -96,28 +169,220 @@ async def get_otp_by_email_and_code(
     return res.scalars().first()
 
 
-async def mark_otp_as_used(db: AsyncSession, otp_id: int) -> None:
-    otp = await db.get(OTP, otp_id)
-    if otp:
-        otp.is_used = True
+async def consume_otp(
+    db: AsyncSession, email: str, code: str, commit: bool = True
+) -> Optional[int]:
+    """Mark a live, unexpired code used in one conditional UPDATE.
+
+    Returns the OTP id, or None when the code is wrong, expired or already
+    used – so of two concurrent requests only one can succeed. Pass
+    `commit=False` to apply a user update in the same transaction.
+    """
+    stmt = (
+        sql_update(OTP)
+        .where(
+            OTP.email == email,
+            OTP.otp_code == code,
+            OTP.is_used.is_(False),
+            OTP.expires_at >= datetime.utcnow(),
+        )
+        .values(is_used=True)
+        .returning(OTP.id)
+    )
+    otp_id = (await db.execute(stmt)).scalar()
+    if commit:
+        await db.commit()
+    return otp_id
+
+
+async def get_latest_otp(db: AsyncSession, email: str, code: str) -> Optional[OTP]:
+    """Most recent row for this email and code, whatever its state."""
+    stmt = (
+        select(OTP)
+        .where(OTP.email == email, OTP.otp_code == code)
+        .order_by(OTP.id.desc())
+        .limit(1)
+    )
+    res = await db.execute(stmt)
+    return res.scalars().first()
+
+
+async def delete_stale_otps(db: AsyncSession, now: datetime, batch_size: int) -> int:
+    """Delete up to `batch_size` used or expired codes; returns how many went."""
+    stale = (
+        select(OTP.id)
+        .where((OTP.is_used.is_(True)) | (OTP.expires_at < now))
+        .limit(batch_size)
+    )
+    res = await db.execute(delete(OTP).where(OTP.id.in_(stale.scalar_subquery())))
+    await db.commit()
+    return res.rowcount or 0
+
+
+async def mark_otp_as_used(db: AsyncSession, otp_id: int, commit: bool = True) -> None:
+    await db.execute(sql_update(OTP).where(OTP.id == otp_id).values(is_used=True))
+    if commit:
+        await db.commit()
+
+
+# ────────────────────────────────────────────────────────────
+# Email outbox
+# ────────────────────────────────────────────────────────────
+async def enqueue_email(
+    db: AsyncSession,
+    to_email: str,
+    template: str,
+    context: Dict[str, Any],
+    commit: bool = True,
+) -> None:
+    """Queue mail for the email_outbox worker, inside the caller's transaction."""
+    await db.execute(
+        insert(EmailOutbox).values(to_email=to_email, template=template, context=context)
+    )
+    db.sync_session.info[OUTBOX_ENQUEUED_KEY] = True
+    if commit:
         await db.commit()
 
 
+async def claim_outbox_emails(
+    db: AsyncSession, now: datetime, limit: int, lease_seconds: float
+) -> List[EmailOutbox]:
+    """Lease up to `limit` due rows to this worker and count the attempt.
+
+    SKIP LOCKED lets several workers claim concurrently on Postgres; a row
+    whose worker dies before reporting back is due again after the lease.
+    """
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        sql_update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(EmailOutbox)
+        .execution_options(populate_existing=True)
+    )
+    rows = list((await db.execute(stmt)).scalars().all())
+    await db.commit()
+    return rows
+
+
+async def delete_outbox_emails(db: AsyncSession, email_ids: List[int]) -> None:
+    await db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(email_ids)))
+    await db.commit()
+
+
+async def reschedule_outbox_email(
+    db: AsyncSession, email_id: int, error: str, next_attempt_at: Optional[datetime]
+) -> None:
+    """Record a failed send; `next_attempt_at=None` dead-letters the row."""
+    values: Dict[str, Any] = {"last_error": error[:2000]}
+    if next_attempt_at is None:
+        values["status"] = "dead"
+    else:
+        values["next_attempt_at"] = next_attempt_at
+    await db.execute(sql_update(EmailOutbox).where(EmailOutbox.id == email_id).values(**values))
+    await db.commit()
+
+
+# ────────────────────────────────────────────────────────────
+# Media reference counts (see media_store)
+# ────────────────────────────────────────────────────────────
+async def _acquire_media(db: AsyncSession, paths: Iterable[str], kind: str) -> None:
+    """+1 on each file, creating its row; part of the caller's transaction."""
+    paths = sorted(set(paths))
+    if not paths:
+        return
+    now = datetime.utcnow()
+    dialect_insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    stmt = dialect_insert(MediaObject).values(
+        [{"path": p, "kind": kind, "refcount": 1, "updated_at": now} for p in paths]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaObject.path],
+        set_={"refcount": MediaObject.refcount + 1, "updated_at": now},
+    )
+    await db.execute(stmt)
+
+
+async def _release_media(db: AsyncSession, paths: Iterable[str]) -> None:
+    """-1 on each counted file (never below 0); uncounted files are left to media_gc."""
+    paths = sorted(set(paths))
+    if not paths:
+        return
+    await db.execute(
+        sql_update(MediaObject)
+        .where(MediaObject.path.in_(paths))
+        .values(
+            refcount=case((MediaObject.refcount > 0, MediaObject.refcount - 1), else_=0),
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+async def referenced_media(db: AsyncSession, paths: List[str]) -> Set[str]:
+    """The subset of `paths` still in use.
+
+    Counted files are settled by media_objects; the rest (uploads and audio
+    from before the counts existed) are looked up by the column value that
+    would point at them.
+    """
+    counted = set((await db.execute(
+        select(MediaObject.path).where(MediaObject.path.in_(paths), MediaObject.refcount > 0)
+    )).scalars())
+
+    by_reference: Dict[str, List[str]] = {}
+    for path in paths:
+        if path not in counted:
+            by_reference.setdefault(media_store.reference_for(path), []).append(path)
+    if not by_reference:
+        return counted
+
+    references = list(by_reference)
+    live: Set[str] = set()
+    for column in (User.profile_picture, StorySegment.audio_path, StorySession.audio_path):
+        live.update((await db.execute(
+            select(column).where(column.in_(references)).distinct()
+        )).scalars())
+    return counted | {p for ref in live for p in by_reference[ref]}
+
+
+async def forget_media(db: AsyncSession, paths: List[str]) -> None:
+    """Drop the rows of deleted files (unless something re-acquired them)."""
+    if paths:
+        await db.execute(
+            delete(MediaObject).where(MediaObject.path.in_(paths), MediaObject.refcount <= 0)
+        )
+    await db.commit()
+
+
 # ────────────────────────────────────────────────────────────
 # Story-session helpers
 # ────────────────────────────────────────────────────────────
 async def create_story_session(db: AsyncSession, story: StoryStart) -> StorySession:
-    db_story = StorySession(
-        user_id=story.user_id,
-        interests=story.interests,
-        current_story="",
-        current_choices={},
-        audio_path="",
-        context_history=[],
-    )
-    db.add(db_story)
+    stmt = (
+        insert(StorySession)
+        .values(
+            user_id=story.user_id,
+            interests=story.interests,
+            current_story="",
+            current_choices={},
+            audio_path="",
+            context_history=[],
+            context_summary="",
+        )
+        .returning(StorySession)
+    )
+    db_story = (await db.execute(stmt)).scalar_one()
     await db.commit()
-    await db.refresh(db_story)
+    session_cache.put(SessionState.from_row(db_story))
     return db_story
 
 
@@ -128,60 +393,144 @@ async def update_story_session(
     choices: Dict[int, str],
     audio_path: str,
     context: str,
-) -> Optional[StorySession]:
-    db_story = await db.get(StorySession, session_id)
-    if not db_story:
+    context_summary: Optional[str] = None,
+    seq: Optional[int] = None,
+    expected_version: Optional[int] = None,
+) -> Optional[SessionState]:
+    """Make a new segment current and append it to `story_segments`.
+
+    `seq` is the turn number the segment's context token was signed for;
+    two requests racing for the same turn collide on the (session_id, seq)
+    unique constraint and the loser's commit raises IntegrityError.
+    With `expected_version` the write only applies if nobody else has
+    written the session since it was read; otherwise None is returned.
+    """
+    values: Dict[str, Any] = {
+        "current_story": story_text,
+        "current_choices": choices,
+        "audio_path": audio_path,
+        "current_seq": seq if seq is not None else StorySession.current_seq + 1,
+        "version": StorySession.version + 1,
+    }
+    if context_summary is not None:
+        values["context_summary"] = context_summary
+
+    stmt = sql_update(StorySession).where(StorySession.id == session_id)
+    if expected_version is not None:
+        stmt = stmt.where(StorySession.version == expected_version)
+    stmt = stmt.values(**values).returning(
+        StorySession.user_id,
+        StorySession.interests,
+        StorySession.context_summary,
+        StorySession.current_seq,
+        StorySession.version,
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        await db.rollback()
+        session_cache.invalidate(session_id, stale=expected_version is not None)
         return None
 
-    db_story.current_story = story_text
-    db_story.current_choices = choices
-    db_story.audio_path = audio_path
-    history: List[str] = list(db_story.context_history or [])
-    history.append(context)
-    db_story.context_history = history
-
-    await db.commit()
-    await db.refresh(db_story)
-    return db_story
+    db.add(StorySegment(
+        session_id=session_id,
+        seq=row.current_seq,
+        context_token=context,
+        story_text=story_text,
+        choices=choices,
+        audio_path=audio_path,
+    ))
+    await _acquire_media(db, media_store.audio_files(audio_path), media_store.AUDIO)
+    try:
+        await db.commit()
+    except Exception:
+        session_cache.invalidate(session_id, stale=True)
+        raise
+
+    state = SessionState(
+        id=session_id,
+        user_id=row.user_id,
+        interests=list(row.interests or []),
+        current_story=story_text,
+        current_choices=dict(choices),
+        context_summary=row.context_summary or "",
+        current_seq=row.current_seq,
+        version=row.version,
+    )
+    session_cache.put(state)
+    return state
 
 
-async def get_story_session(db: AsyncSession, session_id: int) -> Optional[StorySession]:
-    return await db.get(StorySession, session_id)
-async def update_reset_password_otp_verified(db: AsyncSession, user_id: int, verified: bool) -> None:
+async def get_story_token_seq(db: AsyncSession, session_id: int, context: str) -> Optional[int]:
+    """Turn number of a legacy (unsigned) context token, or None if unknown."""
     stmt = (
-        select(User)
-        .where(User.id == user_id)
-    )
-    
-    result = await db.execute(stmt)
-    user = result.scalars().first()
-    
-    if user:
-        user.reset_password_otp_verified = verified
-        await db.commit()
-        await db.refresh(user)
+        select(StorySegment.seq)
+        .where(
+            StorySegment.context_token == context,
+            StorySegment.session_id == session_id,
+        )
+        .limit(1)
+    )
+    res = await db.execute(stmt)
+    return res.scalar()
+
+
+async def get_story_session(
+    db: AsyncSession, session_id: int, fresh: bool = False
+) -> Optional[SessionState]:
+    """Session state from the process cache, or from the DB when missing or `fresh`."""
+    if not fresh:
+        cached = session_cache.get(session_id)
+        if cached is not None:
+            return cached
+
+    if fresh:
+        db_story = await db.get(StorySession, session_id, populate_existing=True)
     else:
+        # A lagging replica only costs a fresh re-read: see story._load_continuation.
+        res = await _execute_read(db, select(StorySession).where(StorySession.id == session_id))
+        db_story = res.scalars().first()
+    if db_story is None:
+        return None
+    state = SessionState.from_row(db_story)
+    session_cache.put(state)
+    return state
+
+
+async def get_recent_story_interests(
+    db: AsyncSession, since: datetime, limit: int = 2000
+) -> List[List[str]]:
+    """Interest lists of the newest story sessions created after `since`."""
+    stmt = (
+        select(StorySession.interests)
+        .where(StorySession.created_at >= since)
+        .order_by(StorySession.created_at.desc())
+        .limit(limit)
+    )
+    res = await db.execute(stmt)
+    return [row for row in res.scalars().all() if row]
+
+async def update_reset_password_otp_verified(db: AsyncSession, user_id: int, verified: bool) -> None:
+    user = await _update_user_where(
+        db, User.id == user_id, {"reset_password_otp_verified": verified}
+    )
+    if user is None:
         raise Exception("User not found")
+
+
+async def set_reset_password_otp_verified_by_email(
+    db: AsyncSession, email: str, verified: bool, commit: bool = True
+) -> Optional[User]:
+    return await _update_user_where(
+        db, User.email == email, {"reset_password_otp_verified": verified}, commit
+    )
 # Update User Interests
 async def update_user_interests(db: AsyncSession, user_id: int, interests: list):
-    # Fetch the user by ID
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if user:
-        user.interests = interests
-        db.add(user)
-        await db.commit()
-        return user
-    return None
+    return await _update_user_where(db, User.id == user_id, {"interests": interests})
 
 # Get User Interests
 async def get_user_interests(db: AsyncSession, user_id: int):
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if user:
-        return user.interests
-    return None
+    result = await _execute_read(db, select(User.interests).where(User.id == user_id))
+    return result.scalar_one_or_none()
 
 
 async def get_user_by_id(db, user_id):
@@ -199,34 +548,29 @@ async def update_user(db: AsyncSession, user_id: int, update_data: Dict[str, Any
         update_data (Dict[str, Any]): A dictionary containing the fields and their new values.
 
     Returns:
-        User: The updated User object.
+        User: The updated User object, as returned by the UPDATE itself.
 
     Raises:
         ValueError: If the user with the given ID is not found.
     """
-    # Create the update statement
-    stmt = sql_update(User).where(User.id == user_id).values(**update_data)
-    
-    # Execute the update statement
-    result = await db.execute(stmt)
-    
-    # Check if any row was matched/updated
-    if result.rowcount == 0:
-        # If no rows were affected, the user likely doesn't exist
-        # You might choose to raise an exception or handle it differently
+    old_files: Optional[List[str]] = None
+    if "profile_picture" in update_data:
+        # Lock the row so the old picture's files are released exactly once.
+        old = await db.execute(
+            select(User.profile_picture).where(User.id == user_id).with_for_update()
+        )
+        old_files = media_store.profile_picture_files(old.scalar_one_or_none())
+
+    updated_user = await _update_user_where(db, User.id == user_id, update_data, commit=False)
+    if updated_user is None:
+        await db.rollback()
         raise ValueError(f"User with id {user_id} not found for update.")
-        
-    # Commit the transaction
+
+    if old_files is not None:
+        new_files = media_store.profile_picture_files(updated_user.profile_picture)
+        await _acquire_media(
+            db, [p for p in new_files if p not in old_files], media_store.PROFILE_PICTURE
+        )
+        await _release_media(db, [p for p in old_files if p not in new_files])
     await db.commit()
-    
-    # Refresh the user instance to get the updated data from the DB
-    # First, we need to fetch the user object
-    updated_user = await get_user_by_id(db, user_id) # Assuming get_user_by_id exists
-    if not updated_user:
-         # This shouldn't happen if the update succeeded, but good to check
-         raise ValueError(f"User with id {user_id} could not be fetched after update.")
-         
-    # Refresh the instance
-    await db.refresh(updated_user)
-    
     return updated_user
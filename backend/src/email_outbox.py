@@ -0,0 +1,179 @@
+"""
+src/email_outbox.py
+
+Background delivery of queued mail.
+
+Handlers call crud.enqueue_email() in the same transaction as the OTP they
+mail out, so they return without touching SMTP and nothing is sent for a
+rolled-back request. This worker claims due rows (EMAIL_OUTBOX_BATCH_SIZE at
+a time, leased for EMAIL_OUTBOX_LEASE seconds), splits them into up to
+EMAIL_OUTBOX_CONCURRENCY chunks, sends each chunk over one pooled
+mailer.transport connection and deletes the rows the relay accepted. A
+failed send is retried with exponential backoff (EMAIL_OUTBOX_BACKOFF
+doubling up to EMAIL_OUTBOX_BACKOFF_MAX, with jitter); after
+EMAIL_OUTBOX_MAX_ATTEMPTS the row is left with status "dead" and its last
+error for inspection.
+
+The worker polls every EMAIL_OUTBOX_POLL_INTERVAL seconds and is woken
+straight away when a session that enqueued mail commits in this process.
+Point SMTP_SERVER/SMTP_PORT at a local sink (e.g. aiosmtpd) to exercise it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src import crud, database, mailer
+from src.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_ENABLED = os.getenv("EMAIL_OUTBOX_ENABLED", "true").lower() == "true"
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+EMAIL_OUTBOX_CONCURRENCY = int(os.getenv("EMAIL_OUTBOX_CONCURRENCY", "4"))
+EMAIL_OUTBOX_LEASE = int(os.getenv("EMAIL_OUTBOX_LEASE", "300"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_BACKOFF = float(os.getenv("EMAIL_OUTBOX_BACKOFF", "30"))
+EMAIL_OUTBOX_BACKOFF_MAX = float(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait after the `attempts`-th failed send."""
+    delay = min(EMAIL_OUTBOX_BACKOFF * 2 ** (attempts - 1), EMAIL_OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxWorker:
+    def __init__(
+        self,
+        batch_size: int = EMAIL_OUTBOX_BATCH_SIZE,
+        concurrency: int = EMAIL_OUTBOX_CONCURRENCY,
+        poll_interval: float = EMAIL_OUTBOX_POLL_INTERVAL,
+        max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.concurrency = max(concurrency, 1)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_error: Optional[str] = None
+        self._counters: Counter = Counter()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="email-outbox")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(mailer.transport.close)
+
+    def notify(self) -> None:
+        """New mail was committed; skip the rest of the poll interval."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Email outbox drain failed")
+                claimed = 0
+            if claimed >= self.batch_size:
+                continue  # more may be due already
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        """Claim one batch of due mail and try to send all of it."""
+        async with database.AsyncSessionLocal() as db:
+            rows = await crud.claim_outbox_emails(
+                db, datetime.utcnow(), self.batch_size, EMAIL_OUTBOX_LEASE
+            )
+        self._counters["claimed"] += len(rows)
+
+        ready: List[Tuple[EmailOutbox, MIMEMultipart]] = []
+        for row in rows:
+            try:
+                ready.append((row, mailer.render(row.to_email, row.template, row.context)))
+            except Exception as exc:
+                # A broken template will not fix itself; don't retry it.
+                await self._failed(row, exc, retry=False)
+
+        # One pooled SMTP connection per chunk.
+        chunks = [ready[i::self.concurrency] for i in range(self.concurrency)]
+        await asyncio.gather(*(self._send_chunk(chunk) for chunk in chunks if chunk))
+        return len(rows)
+
+    async def _send_chunk(self, chunk: List[Tuple[EmailOutbox, MIMEMultipart]]) -> None:
+        results = await mailer.send_batch([msg for _, msg in chunk])
+        sent = [row.id for (row, _), error in zip(chunk, results) if error is None]
+        if sent:
+            async with database.AsyncSessionLocal() as db:
+                await crud.delete_outbox_emails(db, sent)
+            self._counters["sent"] += len(sent)
+        for (row, _), error in zip(chunk, results):
+            if error is not None:
+                await self._failed(row, error, retry=row.attempts < self.max_attempts)
+
+    async def _failed(self, row: EmailOutbox, exc: Exception, retry: bool) -> None:
+        error = f"{type(exc).__name__}: {exc}"
+        self._last_error = error
+        next_attempt_at = (
+            datetime.utcnow() + timedelta(seconds=retry_delay(row.attempts)) if retry else None
+        )
+        async with database.AsyncSessionLocal() as db:
+            await crud.reschedule_outbox_email(db, row.id, error, next_attempt_at)
+        if retry:
+            self._counters["retried"] += 1
+            logger.warning("Email %s to %s failed (attempt %d): %s",
+                           row.id, row.to_email, row.attempts, error)
+        else:
+            self._counters["dead"] += 1
+            logger.error("Email %s to %s dead-lettered after %d attempts: %s",
+                         row.id, row.to_email, row.attempts, error)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": EMAIL_OUTBOX_ENABLED,
+            "running": self._task is not None,
+            **{name: self._counters[name] for name in ("claimed", "sent", "retried", "dead")},
+            "last_error": self._last_error,
+            "transport": mailer.transport.stats(),
+        }
+
+
+worker = OutboxWorker()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session: Session) -> None:
+    if session.info.pop(crud.OUTBOX_ENQUEUED_KEY, False):
+        worker.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(crud.OUTBOX_ENQUEUED_KEY, None)
@@ -0,0 +1,149 @@
+"""
+src/google_certs.py
+
+Local verification of Google ID tokens against cached signing certs.
+
+id_token.verify_oauth2_token() downloads Google's certs with a blocking
+`requests` call on every sign-in. Here the PEM mapping from GOOGLE_CERTS_URL
+is kept in memory for as long as its Cache-Control max-age allows, and a
+background task re-fetches it GOOGLE_CERTS_REFRESH_MARGIN seconds before it
+expires, so verify() normally only runs the RSA check locally. The fetch
+itself runs in a thread; an unknown `kid` (key rotation) forces one early
+refresh, at most every GOOGLE_CERTS_MIN_REFRESH seconds.
+
+Point GOOGLE_CERTS_URL at a local key server to exercise the path offline.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Mapping, Optional
+
+import requests
+from google.auth import jwt as google_jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_CERTS_REFRESH_MARGIN = int(os.getenv("GOOGLE_CERTS_REFRESH_MARGIN", "300"))
+GOOGLE_CERTS_DEFAULT_TTL = int(os.getenv("GOOGLE_CERTS_DEFAULT_TTL", "3600"))
+GOOGLE_CERTS_MIN_REFRESH = int(os.getenv("GOOGLE_CERTS_MIN_REFRESH", "30"))
+GOOGLE_CERTS_TIMEOUT = float(os.getenv("GOOGLE_CERTS_TIMEOUT", "10"))
+GOOGLE_CLOCK_SKEW = int(os.getenv("GOOGLE_CLOCK_SKEW", "10"))
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _max_age(cache_control: str) -> Optional[int]:
+    match = _MAX_AGE_RE.search(cache_control or "")
+    return int(match.group(1)) if match else None
+
+
+def _token_kid(token: str) -> Optional[str]:
+    try:
+        segment = token.split(".", 1)[0]
+        header = json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return header.get("kid") if isinstance(header, dict) else None
+
+
+class GoogleCertCache:
+    def __init__(self, url: str = GOOGLE_CERTS_URL) -> None:
+        self.url = url
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Counter = Counter()
+
+    # ───────────── fetching ─────────────
+    def _download(self) -> tuple[Dict[str, str], int]:
+        response = requests.get(self.url, timeout=GOOGLE_CERTS_TIMEOUT)
+        response.raise_for_status()
+        ttl = _max_age(response.headers.get("Cache-Control", ""))
+        return json.loads(response.content), ttl if ttl is not None else GOOGLE_CERTS_DEFAULT_TTL
+
+    async def _fetch(self) -> Dict[str, str]:
+        certs, ttl = await asyncio.to_thread(self._download)
+        now = time.monotonic()
+        self._certs, self._fetched_at, self._expires_at = certs, now, now + ttl
+        self._counters["fetches"] += 1
+        return certs
+
+    async def refresh(self) -> Dict[str, str]:
+        async with self._lock:
+            return await self._fetch()
+
+    async def certs(self, force: bool = False) -> Mapping[str, str]:
+        """Cached certs; `force` re-fetches unless that just happened."""
+        if self._certs and time.monotonic() < self._expires_at and not force:
+            self._counters["hits"] += 1
+            return self._certs
+        async with self._lock:
+            # Re-check: a concurrent caller may have fetched while we waited.
+            now = time.monotonic()
+            fresh = self._certs and now < self._expires_at
+            if fresh and (not force or now - self._fetched_at < GOOGLE_CERTS_MIN_REFRESH):
+                return self._certs
+            return await self._fetch()
+
+    # ───────────── verification ─────────────
+    async def verify(self, token: str, audience: Optional[str]) -> Dict[str, Any]:
+        """Verify signature, expiry and audience; raises ValueError if invalid."""
+        certs = await self.certs()
+        kid = _token_kid(token)
+        if kid is not None and kid not in certs:
+            self._counters["kid_misses"] += 1
+            certs = await self.certs(force=True)
+        return google_jwt.decode(
+            token, certs=certs, audience=audience, clock_skew_in_seconds=GOOGLE_CLOCK_SKEW
+        )
+
+    # ───────────── background refresh ─────────────
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="google-certs-refresh")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                delay = self._expires_at - time.monotonic() - GOOGLE_CERTS_REFRESH_MARGIN
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._counters["errors"] += 1
+                logger.exception("Refreshing Google signing certs failed")
+                delay = 0
+            await asyncio.sleep(max(delay, GOOGLE_CERTS_MIN_REFRESH))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "keys": sorted(self._certs),
+            "expires_in": round(self._expires_at - time.monotonic(), 1) if self._certs else None,
+            "fetches": self._counters["fetches"],
+            "hits": self._counters["hits"],
+            "kid_misses": self._counters["kid_misses"],
+            "errors": self._counters["errors"],
+        }
+
+
+cache = GoogleCertCache()
@@ -0,0 +1,104 @@
+"""
+Internal diagnostics endpoints – only served when DEBUG=true.
+"""
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from src import (
+    audio_cache, database, email_outbox, google_certs, media_gc, opening_cache,
+    opening_pool, otp_purge, principal_cache, security, session_cache, speculation,
+)
+
+
+def _require_debug() -> None:
+    if os.getenv("DEBUG", "false").lower() != "true":
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+router = APIRouter(tags=["Internal"], dependencies=[Depends(_require_debug)])
+
+
+@router.get("/speculation")
+async def speculation_stats():
+    """Hit rate and spend of speculative branch generation."""
+    return speculation.manager.stats()
+
+
+@router.get("/tts-cache")
+async def tts_cache_stats():
+    """Size and hit counts of the content-addressed TTS audio cache."""
+    return audio_cache.cache.stats()
+
+
+@router.get("/opening-cache")
+async def opening_cache_stats():
+    """Pool sizes and hit counts of the opening-segment cache."""
+    return opening_cache.cache.stats()
+
+
+@router.get("/opening-pool")
+async def opening_pool_stats():
+    """Ranked interest sets and ready segments of the pre-warmed opening pool."""
+    return opening_pool.pool.stats()
+
+
+
+@router.get("/session-cache")
+async def session_cache_stats():
+    """Entries, hit counts and stale writes of the story-session cache."""
+    return session_cache.cache.stats()
+
+
+@router.get("/db-pool")
+async def db_pool_stats():
+    """Live checkout, overflow and connection wait figures of the DB pool."""
+    return database.pool_stats()
+
+
+@router.get("/db-replica")
+async def db_replica_stats():
+    """How many reads went to the replica, and why others stayed on the primary."""
+    return database.router.stats()
+
+
+@router.get("/otp-purge")
+async def otp_purge_stats():
+    """Runs and rows deleted by the OTP purge job."""
+    return otp_purge.purger.stats()
+
+
+@router.get("/email-outbox")
+async def email_outbox_stats():
+    """Sends, retries and dead letters of the email outbox worker."""
+    return email_outbox.worker.stats()
+
+
+@router.get("/media-gc")
+async def media_gc_stats():
+    """Progress and deletions of the media garbage collector."""
+    return media_gc.collector.stats()
+
+
+@router.get("/media-gc/dry-run")
+async def media_gc_dry_run():
+    """Orphaned media files and the bytes a GC pass would free, without deleting."""
+    return await media_gc.collector.dry_run()
+
+
+@router.get("/principal-cache")
+async def principal_cache_stats():
+    """Hit rate of the authenticated-principal cache behind get_current_user."""
+    return principal_cache.cache.stats()
+
+
+@router.get("/password-hasher")
+async def password_hasher_stats():
+    """Queue depth and rejections of the bcrypt process pool."""
+    return security.hasher.stats()
+
+
+@router.get("/google-certs")
+async def google_certs_stats():
+    """Cached Google signing keys and how often they were re-fetched."""
+    return google_certs.cache.stats()
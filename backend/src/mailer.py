@@ -0,0 +1,411 @@
+"""
+src/mailer.py
+
+SMTP delivery for outgoing mail (moved out of src/auth.py).
+
+Request handlers never call this module directly: they queue mail with
+crud.enqueue_email() and the email_outbox worker renders and sends it. The
+transport is configured from:
+ • SMTP_SERVER / SMTP_PORT       – relay; the standard ports are tried too
+ • SMTP_USERNAME / SMTP_PASSWORD – required to log in, and only ever sent
+                                   over STARTTLS/SSL; set both empty for a
+                                   relay without AUTH (e.g. a local aiosmtpd sink)
+ • SMTP_USE_TLS / SMTP_USE_SSL   – STARTTLS / implicit TLS on SMTP_PORT
+ • SMTP_TIMEOUT                  – per-connection timeout (seconds)
+ • SMTP_POOL_SIZE                – logged-in connections kept open for reuse
+ • SMTP_POOL_IDLE_TIMEOUT        – reconnect after this long unused (seconds)
+ • SMTP_MAX_MESSAGES_PER_CONNECTION – recycle a connection after this many
+
+`transport` remembers the configuration that last worked and opens new
+connections with it. When that fails, every configuration is connected at
+once but the winner is picked in priority order (587 STARTTLS, 465 SSL,
+then the fallbacks), and only a connection that logged in counts;
+SmtpDeliveryError means none did. send_batch() pushes several messages
+through one connection and reports per message, so the caller decides about
+retries. An auth or relay refusal (530/535, sender refused, 5xx "relaying
+denied") is a transport fault rather than the message's: the preferred
+configuration is forgotten and the message retried once over a new probe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
+from email.utils import formataddr
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from src import email_templete
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "mail.alphanetwork.com.pk")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))  # Changed to 587 for STARTTLS
+SMTP_USERNAME = os.getenv("SMTP_USERNAME", "no-reply@alphanetwork.com.pk")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "Hang1122@123")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+SENDER_NAME = "LingoFlow"
+
+# Ensure SMTP credentials are loaded
+if not SMTP_USERNAME or not SMTP_PASSWORD:
+    logger.error("SMTP credentials (username or password) not found. Please set SMTP_USERNAME and SMTP_PASSWORD environment variables.")
+
+
+class SmtpDeliveryError(Exception):
+    """No SMTP configuration accepted the message."""
+
+
+# ───────────── messages ─────────────
+def _body_part(subtype: str, body: bytes) -> MIMENonMultipart:
+    # Rendered bodies are already UTF-8 bytes; base64 them directly rather
+    # than letting MIMEText decode and re-encode through email.charset.
+    part = MIMENonMultipart("text", subtype, charset="utf-8")
+    part["Content-Transfer-Encoding"] = "base64"
+    part.set_payload(base64.encodebytes(body).decode("ascii"))
+    return part
+
+
+def render(to_email: str, template: str, context: Mapping[str, Any]) -> MIMEMultipart:
+    """Build the message for an outbox row from email_templete's registry.
+
+    KeyError for an unknown template or a missing field.
+    """
+    rendered = email_templete.render(template, **context)
+    msg = MIMEMultipart("alternative")
+    msg["From"] = formataddr((SENDER_NAME, SMTP_USERNAME))
+    msg["To"] = to_email
+    msg["Subject"] = rendered.subject
+    # Clients show the last alternative they support, so HTML goes last.
+    msg.attach(_body_part("plain", rendered.text))
+    msg.attach(_body_part("html", rendered.html))
+    return msg
+
+
+# ───────────── transport ─────────────
+def smtp_configs() -> List[Dict[str, Any]]:
+    configs = [
+        # Configuration 1: STARTTLS (most common)
+        {"server": SMTP_SERVER, "port": 587, "use_tls": True, "use_ssl": False},
+        # Configuration 2: SSL/TLS
+        {"server": SMTP_SERVER, "port": 465, "use_tls": False, "use_ssl": True},
+        # Configuration 3: Plain (not recommended but sometimes needed)
+        {"server": SMTP_SERVER, "port": 25, "use_tls": False, "use_ssl": False},
+        # Configuration 4: User-defined port with TLS
+        {"server": SMTP_SERVER, "port": SMTP_PORT, "use_tls": SMTP_USE_TLS, "use_ssl": SMTP_USE_SSL},
+    ]
+    unique: Dict[Tuple, Dict[str, Any]] = {}
+    for config in configs:
+        unique.setdefault(_config_key(config), config)
+    return list(unique.values())
+
+
+def _config_key(config: Mapping[str, Any]) -> Tuple:
+    return (config["server"], config["port"], config["use_tls"], config["use_ssl"])
+
+
+def _describe(config: Mapping[str, Any]) -> str:
+    return f"{config['server']}:{config['port']} (TLS: {config['use_tls']}, SSL: {config['use_ssl']})"
+
+
+def _connect(config: Mapping[str, Any], timeout: float = SMTP_TIMEOUT) -> smtplib.SMTP:
+    """Open and log in; with credentials configured, a plaintext connection is refused."""
+    authenticate = bool(SMTP_USERNAME and SMTP_PASSWORD)
+    if authenticate and not (config["use_ssl"] or config["use_tls"]):
+        raise SmtpDeliveryError("refusing to send credentials without TLS")
+    if config["use_ssl"]:
+        context = ssl.create_default_context()
+        server = smtplib.SMTP_SSL(config["server"], config["port"], timeout=timeout, context=context)
+    else:
+        server = smtplib.SMTP(config["server"], config["port"], timeout=timeout)
+        if config["use_tls"]:
+            server.starttls()
+    try:
+        server.ehlo_or_helo_if_needed()
+        if authenticate:
+            # Raises SMTPNotSupportedError when the relay offers no AUTH:
+            # a connection that never logged in doesn't count as working.
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def _close_quietly(server: smtplib.SMTP) -> None:
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+
+_RELAY_REFUSAL_CODES = {530, 535, 538}   # auth required / failed / needs encryption
+
+
+def _is_relay_refusal(exc: smtplib.SMTPException) -> bool:
+    """True when the relay won't take mail from us at all, not just this message."""
+    if isinstance(exc, (smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return bool(exc.recipients) and all(
+            code in (550, 551, 554) and b"relay" in reply.lower()
+            for code, reply in exc.recipients.values()
+        )
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code in _RELAY_REFUSAL_CODES
+
+
+def _close_connected(future: Future) -> None:
+    if future.exception() is None:
+        _close_quietly(future.result())
+
+
+class _Connection:
+    __slots__ = ("server", "config", "sent", "last_used")
+
+    def __init__(self, server: smtplib.SMTP, config: Mapping[str, Any]) -> None:
+        self.server = server
+        self.config = config
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SmtpTransport:
+    """Pool of logged-in SMTP connections shared by sending threads."""
+
+    def __init__(
+        self,
+        pool_size: int = SMTP_POOL_SIZE,
+        idle_timeout: float = SMTP_POOL_IDLE_TIMEOUT,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+    ) -> None:
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+        self._preferred: Optional[Mapping[str, Any]] = None
+        self._counters: Counter = Counter()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        # Sending threads share the transport; Counter += isn't atomic.
+        with self._lock:
+            self._counters[name] += n
+
+    # ───────────── connections ─────────────
+    def _checkout(self) -> _Connection:
+        now = time.monotonic()
+        with self._lock:
+            if self._idle and now - self._idle[-1].last_used < self.idle_timeout:
+                self._counters["reused"] += 1   # _lock is held; _count would re-take it
+                return self._idle.pop()
+            # Idle connections are reused newest first, so all of these are stale.
+            stale, self._idle = self._idle, []
+        self._count("expired", len(stale))
+        for conn in stale:
+            _close_quietly(conn.server)
+        return self._open()
+
+    def _checkin(self, conn: _Connection) -> None:
+        conn.last_used = time.monotonic()
+        if conn.sent < self.max_messages:
+            with self._lock:
+                if len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                    return
+        _close_quietly(conn.server)
+
+    def _open(self) -> _Connection:
+        preferred = self._preferred
+        if preferred is not None:
+            try:
+                conn = _Connection(_connect(preferred), preferred)
+                self._count("opened")
+                return conn
+            except Exception as exc:
+                logger.warning(f"SMTP config {_describe(preferred)} stopped working: {exc}")
+                self._preferred = None
+        return self._probe()
+
+    def _probe(self) -> _Connection:
+        """Connect every configuration at once; keep the highest-priority one that logs in.
+
+        Waiting in priority order (rather than taking whichever answers
+        first) means a fast fallback never beats a working STARTTLS relay.
+        """
+        configs = smtp_configs()
+        self._count("probes")
+        executor = ThreadPoolExecutor(max_workers=len(configs), thread_name_prefix="smtp-probe")
+        futures = {executor.submit(_connect, config): config for config in configs}
+        executor.shutdown(wait=False)
+        winner = None
+        errors = []
+        for future, config in futures.items():
+            if future.exception() is not None:
+                errors.append(f"{_describe(config)}: {future.exception()}")
+                continue
+            winner = future
+            break
+        for future in futures:
+            if future is not winner:
+                # Losers still connecting are closed whenever they finish.
+                future.add_done_callback(_close_connected)
+        if winner is None:
+            for error in errors:
+                logger.warning(f"SMTP config {error}")
+            raise SmtpDeliveryError(f"All SMTP configurations failed. Last error: {errors[-1]}")
+        config = futures[winner]
+        logger.info(f"Using SMTP config {_describe(config)}")
+        self._preferred = config
+        self._count("opened")
+        return _Connection(winner.result(), config)
+
+    # ───────────── sending ─────────────
+    def send_batch(self, messages: Sequence[MIMEMultipart]) -> List[Optional[Exception]]:
+        """Send `messages` over one pooled connection (blocking).
+
+        Returns one entry per message: None once the relay accepted it, else
+        the error. A refused message does not stop the rest; a dropped
+        connection is replaced once per message. A relay refusal drops the
+        preferred configuration and retries over a fresh probe; if that is
+        refused too, the rest of the batch fails with the same error.
+        """
+        results: List[Optional[Exception]] = []
+        conn: Optional[_Connection] = None
+        try:
+            for msg in messages:
+                for attempt in range(2):
+                    if conn is None:
+                        try:
+                            conn = self._checkout()
+                        except Exception as exc:
+                            self._count("failed", len(messages) - len(results))
+                            results.extend([exc] * (len(messages) - len(results)))
+                            return results
+                    try:
+                        conn.server.send_message(msg)
+                    except smtplib.SMTPServerDisconnected as exc:
+                        error: Optional[Exception] = exc
+                    except smtplib.SMTPException as exc:
+                        if _is_relay_refusal(exc):
+                            logger.warning(f"SMTP config {_describe(conn.config)} refused to relay: {exc}")
+                            self._count("relay_refused")
+                            self._forget(conn.config)
+                            _close_quietly(conn.server)
+                            conn = None
+                            if attempt == 1:
+                                self._count("failed", len(messages) - len(results))
+                                results.extend([exc] * (len(messages) - len(results)))
+                                return results
+                            continue
+                        # Refused by the relay; the session is still usable.
+                        self._count("failed")
+                        results.append(exc)
+                        break
+                    except OSError as exc:
+                        error = exc
+                    else:
+                        conn.sent += 1
+                        self._count("sent")
+                        results.append(None)
+                        break
+                    conn.server.close()
+                    conn = None
+                    self._count("dropped")
+                    if attempt == 1:
+                        self._count("failed")
+                        results.append(error)
+            return results
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+
+    def _forget(self, config: Mapping[str, Any]) -> None:
+        """Stop using `config`: clear it as preferred and close its idle connections."""
+        key = _config_key(config)
+        with self._lock:
+            if self._preferred is not None and _config_key(self._preferred) == key:
+                self._preferred = None
+            stale = [c for c in self._idle if _config_key(c.config) == key]
+            self._idle = [c for c in self._idle if _config_key(c.config) != key]
+        for conn in stale:
+            _close_quietly(conn.server)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            _close_quietly(conn.server)
+
+    def stats(self) -> Dict[str, object]:
+        preferred = self._preferred
+        with self._lock:
+            counters = self._counters.copy()
+            idle = len(self._idle)
+        return {
+            "preferred": _describe(preferred) if preferred is not None else None,
+            "idle": idle,
+            "pool_size": self.pool_size,
+            **{name: counters[name] for name in (
+                "sent", "failed", "opened", "reused", "expired", "dropped", "probes",
+                "relay_refused",
+            )},
+        }
+
+
+transport = SmtpTransport()
+
+
+def send_message(msg: MIMEMultipart) -> None:
+    """Send one message (blocking); raises what the relay or transport raised."""
+    error = transport.send_batch([msg])[0]
+    if error is not None:
+        raise error
+
+
+async def send(msg: MIMEMultipart) -> None:
+    await asyncio.to_thread(send_message, msg)
+
+
+async def send_batch(messages: Sequence[MIMEMultipart]) -> List[Optional[Exception]]:
+    return await asyncio.to_thread(transport.send_batch, messages)
+
+
+# Test SMTP connection function
+def test_smtp_connection() -> dict:
+    """
+    Test SMTP connection and return status
+    """
+    results = []
+
+    for config in smtp_configs()[:3]:
+        try:
+            _connect(config, timeout=10).quit()
+            status = "SUCCESS"
+        except Exception as e:
+            status = f"FAILED: {str(e)}"
+        results.append({
+            "config": f"{config['server']}:{config['port']}",
+            "tls": config['use_tls'],
+            "ssl": config['use_ssl'],
+            "status": status,
+        })
+
+    return {"smtp_tests": results}
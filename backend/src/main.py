@@ -5,18 +5,59 @@ from dotenv import load_dotenv
 
 # Load environment variables BEFORE any other imports
 load_dotenv()
-from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI
-from src.database import engine, Base
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from src.database import engine, Base, count_queries, client_key, router as replica_router
 from src.auth import router as auth_router
 from src.story import router as story_router  # New router for story endpoints
 from src.api import router as api_router
+from src.internal import router as internal_router
+from src import (
+    tts_jobs, opening_pool, otp_purge, security, google_certs, email_outbox, profile_images,
+    media_gc, media_files,
+)
 app = FastAPI()
-app.mount("/media", StaticFiles(directory="media"), name="media")
+# Content-addressed media is served with long-lived caching; see media_files.
+app.mount("/media", media_files.MediaFiles(directory="media"), name="media")
+app.mount(
+    f"/{tts_jobs.AUDIO_DIR}",
+    media_files.MediaFiles(directory=tts_jobs.AUDIO_DIR, check_dir=False),   # created on startup
+    name="audio",
+)
 # Include auth routes
 app.include_router(auth_router, prefix="/auth")
 app.include_router(story_router, prefix="/story")  # Include story routes
 app.include_router(api_router, prefix="/api")
+app.include_router(internal_router, prefix="/internal")
+
+
+@app.exception_handler(security.PasswordHasherBusy)
+async def password_hasher_busy(request: Request, exc: security.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+if replica_router.enabled:
+    @app.middleware("http")
+    async def replica_stickiness(request: Request, call_next):
+        # Same bearer token (or, without one, same address) = same client.
+        key = request.headers.get("authorization") or (request.client.host if request.client else None)
+        token = client_key.set(key)
+        try:
+            return await call_next(request)
+        finally:
+            client_key.reset(token)
+
+if os.getenv("DEBUG", "false").lower() == "true":
+    @app.middleware("http")
+    async def query_count_header(request: Request, call_next):
+        # Round trips per request, so crud regressions show up in the client.
+        with count_queries() as queries:
+            response = await call_next(request)
+        response.headers["X-DB-Queries"] = str(queries[0])
+        return response
 @app.on_event("startup")
 async def startup():
     # Create database tables
@@ -24,7 +65,33 @@ async def startup():
         await conn.run_sync(Base.metadata.create_all)
     
     # Create audio directory
-    os.makedirs("src/audio", exist_ok=True)
+    os.makedirs(tts_jobs.AUDIO_DIR, exist_ok=True)
+
+    if opening_pool.OPENING_POOL_ENABLED:
+        opening_pool.pool.start()
+
+    if otp_purge.OTP_PURGE_ENABLED:
+        otp_purge.purger.start()
+
+    if email_outbox.EMAIL_OUTBOX_ENABLED:
+        email_outbox.worker.start()
+
+    if media_gc.MEDIA_GC_ENABLED:
+        media_gc.collector.start()
+
+    # Keep Google's signing certs warm for /auth/google-login
+    google_certs.cache.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await opening_pool.pool.stop()
+    await otp_purge.purger.stop()
+    await email_outbox.worker.stop()
+    await media_gc.collector.stop()
+    await google_certs.cache.stop()
+    tts_jobs.shutdown()
+    security.hasher.shutdown()
+    profile_images.processor.shutdown()
 
 @app.get("/")
 async def health_check():
@@ -0,0 +1,95 @@
+"""
+src/media_files.py
+
+Static serving of /media and /audio, tuned for clients that cache.
+
+Content-addressed files (media_store.content_addressed) can never change
+under their URL, so they get
+    Cache-Control: public, max-age=31536000, immutable
+and a strong ETag taken from the name itself. Utime-ing a reused file (which
+media_gc relies on) therefore doesn't invalidate anyone's copy. Older files
+with random names keep Starlette's mtime/size ETag and are revalidated after
+MEDIA_MAX_AGE seconds.
+
+Starlette's FileResponse already answers Range/If-Range with 206 (so MP3s
+can seek); conditional GETs follow RFC 9110: If-None-Match, when sent, decides
+alone, otherwise If-Modified-Since.
+
+With MEDIA_PATHSEND=true a full-file GET is handed to the server through the
+ASGI "http.response.pathsend" extension, if it offers one, so the server can
+sendfile() it without copying through Python. uvicorn offers no such
+extension, and Starlette's BaseHTTPMiddleware (the DEBUG query counter and
+replica stickiness in main.py) rejects the message, so it is off by default
+and files are read in MEDIA_CHUNK_SIZE pieces instead.
+"""
+
+from __future__ import annotations
+
+import os
+from email.utils import parsedate
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, PathLike, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from src import media_store
+
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "3600"))
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(256 * 1024)))
+MEDIA_PATHSEND = os.getenv("MEDIA_PATHSEND", "false").lower() == "true"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class MediaFileResponse(FileResponse):
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._pathsend = MEDIA_PATHSEND and "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only or not self._pathsend:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+
+class MediaFiles(StaticFiles):
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        headers = {"cache-control": f"public, max-age={MEDIA_MAX_AGE}"}
+        if media_store.content_addressed(os.fspath(full_path)):
+            headers = {
+                "cache-control": IMMUTABLE_CACHE_CONTROL,
+                "etag": f'"{os.path.basename(full_path)}"',
+            }
+        response = MediaFileResponse(
+            full_path, status_code=status_code, headers=headers, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        if_none_match: Optional[str] = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # Weak comparison, as RFC 9110 prescribes for If-None-Match.
+            etag = response_headers["etag"].removeprefix("W/")
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+
+        if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+        last_modified = parsedate(response_headers.get("last-modified", ""))
+        return (
+            if_modified_since is not None
+            and last_modified is not None
+            and if_modified_since >= last_modified
+        )
@@ -0,0 +1,237 @@
+"""
+src/media_gc.py
+
+Deletes media files that nothing refers to any more.
+
+Every MEDIA_GC_INTERVAL seconds the collector walks the media_store.ROOTS
+directories in name order, MEDIA_GC_BATCH_SIZE files at a time, and asks
+crud.referenced_media() which of them are still in use. Files untouched for
+MEDIA_GC_GRACE seconds and not referenced are unlinked; the grace period
+covers a file written moments before the row that points at it commits
+(uploads and TTS renders utime existing files when they reuse them).
+
+Story MP3s are hard links to an audio_cache blob of the same key, so
+collecting audio/<key>.mp3 discards that blob as well; only then is the
+space actually freed, and that is what the byte counts report. Blobs that
+were never published under audio/ (or only under pre-content-addressing
+names) are bounded by the cache's own LRU (TTS_CACHE_MAX_BYTES).
+
+The position reached is saved to MEDIA_GC_STATE_FILE after every batch, so
+a restart resumes the pass instead of starting over. dry_run() scans
+everything without deleting and reports how many bytes a pass would free.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src import audio_cache, crud, database, media_store
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GC_ENABLED = os.getenv("MEDIA_GC_ENABLED", "true").lower() == "true"
+MEDIA_GC_INTERVAL = int(os.getenv("MEDIA_GC_INTERVAL", "3600"))
+MEDIA_GC_BATCH_SIZE = int(os.getenv("MEDIA_GC_BATCH_SIZE", "500"))
+MEDIA_GC_GRACE = int(os.getenv("MEDIA_GC_GRACE", "86400"))
+MEDIA_GC_STATE_FILE = os.getenv("MEDIA_GC_STATE_FILE", "media_gc_state.json")
+MEDIA_GC_SAMPLE = 20
+
+Cursor = Tuple[int, str]   # (index into ROOTS, last file name done in that root)
+
+
+class MediaGarbageCollector:
+    def __init__(
+        self,
+        interval: int = MEDIA_GC_INTERVAL,
+        batch_size: int = MEDIA_GC_BATCH_SIZE,
+        grace: int = MEDIA_GC_GRACE,
+        state_file: str = MEDIA_GC_STATE_FILE,
+    ) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace = grace
+        self.state_file = state_file
+        self.roots: List[str] = list(media_store.ROOTS.values())
+        self._lock = asyncio.Lock()   # one pass (real or dry) at a time
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Counter = Counter()
+        self._last_run: Optional[Dict[str, object]] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="media-gc")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Media GC failed")
+            await asyncio.sleep(self.interval)
+
+    # ───────────── cursor ─────────────
+    def _load_cursor(self) -> Cursor:
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            return int(state["root"]), str(state["after"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, ""
+
+    def _save_cursor(self, cursor: Cursor) -> None:
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"root": cursor[0], "after": cursor[1]}, f)
+        os.replace(tmp, self.state_file)
+
+    def _scan(self, cursor: Cursor) -> Iterator[Tuple[List[str], Cursor]]:
+        """Batches of paths after `cursor`, each with the cursor that follows it."""
+        root_index, after = cursor
+        for index in range(root_index, len(self.roots)):
+            root = self.roots[index]
+            try:
+                names = sorted(
+                    n for n in os.listdir(root)
+                    if not n.endswith(".tmp") and os.path.isfile(os.path.join(root, n))
+                )
+            except FileNotFoundError:
+                names = []
+            if index == root_index and after:
+                names = [n for n in names if n > after]
+            for start in range(0, len(names), self.batch_size):
+                batch = names[start:start + self.batch_size]
+                yield [f"{root}/{n}" for n in batch], (index, batch[-1])
+            after = ""
+
+    # ───────────── pass ─────────────
+    async def collect(self, dry_run: bool = False) -> Dict[str, object]:
+        """Finish the current pass (or, dry, scan everything) and report it."""
+        async with self._lock:
+            return await self._collect(dry_run)
+
+    async def dry_run(self) -> Dict[str, object]:
+        return await self.collect(dry_run=True)
+
+    async def _collect(self, dry_run: bool) -> Dict[str, object]:
+        started = time.monotonic()
+        cursor = (0, "") if dry_run else self._load_cursor()
+        report: Counter = Counter()
+        sample: List[str] = []
+
+        for paths, next_cursor in self._scan(cursor):
+            report["scanned"] += len(paths)
+            cutoff = time.time() - self.grace
+            stats = {}
+            for path in paths:
+                try:
+                    stats[path] = os.stat(path)
+                except FileNotFoundError:
+                    continue
+            candidates = [p for p, st in stats.items() if st.st_mtime < cutoff]
+            if candidates:
+                async with database.AsyncSessionLocal() as db:
+                    live = await crud.referenced_media(db, candidates)
+                orphans = [p for p in candidates if p not in live]
+            else:
+                orphans = []
+
+            deleted: List[str] = []
+            for path in orphans:
+                freed, blob_key = self._reclaimable(path, stats[path])
+                if not dry_run:
+                    try:
+                        # Reused since we looked? Then it's no orphan.
+                        if os.stat(path).st_mtime >= cutoff:
+                            continue
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        continue
+                    if blob_key is not None:
+                        audio_cache.cache.discard(blob_key)
+                    deleted.append(path)
+                report["orphaned"] += 1
+                report["bytes"] += freed
+                if len(sample) < MEDIA_GC_SAMPLE:
+                    sample.append(path)
+
+            if not dry_run:
+                async with database.AsyncSessionLocal() as db:
+                    await crud.forget_media(db, deleted)
+                self._save_cursor(next_cursor)
+            await asyncio.sleep(0)   # let request handlers in between batches
+
+        if not dry_run:
+            self._save_cursor((0, ""))   # pass complete; next one starts over
+            self._counters["runs"] += 1
+            self._counters["deleted"] += report["orphaned"]
+            self._counters["bytes_freed"] += report["bytes"]
+            if report["orphaned"]:
+                logger.info("Media GC deleted %d files (%d bytes)",
+                            report["orphaned"], report["bytes"])
+
+        result = {
+            "dry_run": dry_run,
+            "scanned": report["scanned"],
+            "orphaned": report["orphaned"],
+            "reclaimable_bytes" if dry_run else "freed_bytes": report["bytes"],
+            "sample": sample,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        if not dry_run:
+            self._last_run = result
+        return result
+
+    @staticmethod
+    def _reclaimable(path: str, st: os.stat_result) -> Tuple[int, Optional[str]]:
+        """Bytes freed by deleting `path`, plus the TTS cache blob to discard with it.
+
+        A file still hard-linked elsewhere frees nothing; when the other link
+        is the file's own cache blob, both go and the data is freed.
+        """
+        links, freed, blob_key = 1, 0, None
+        if media_store.kind_of(path) == media_store.AUDIO and media_store.content_addressed(path):
+            key = os.path.splitext(os.path.basename(path))[0]
+            try:
+                blob = os.stat(audio_cache.cache.path_for(key))
+            except FileNotFoundError:
+                blob = None
+            if blob is not None:
+                blob_key = key
+                if (blob.st_dev, blob.st_ino) == (st.st_dev, st.st_ino):
+                    links = 2
+                elif blob.st_nlink == 1:
+                    freed += blob.st_size   # a copy (cross-device cache dir)
+        if st.st_nlink <= links:
+            freed += st.st_size
+        return freed, blob_key
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": MEDIA_GC_ENABLED,
+            "running": self._task is not None,
+            "cursor": list(self._load_cursor()),
+            "runs": self._counters["runs"],
+            "deleted": self._counters["deleted"],
+            "bytes_freed": self._counters["bytes_freed"],
+            "last_run": self._last_run,
+        }
+
+
+collector = MediaGarbageCollector()
@@ -0,0 +1,67 @@
+"""
+src/media_store.py
+
+Which files on disk belong to which database references.
+
+Media is content-addressed (profile_images.content_stem, story_engine.audio_key),
+so identical content is stored once and may be shared. `media_objects` keeps
+a reference count per file; crud adjusts it in the same transaction as the
+row that starts or stops pointing at the file:
+ • users.profile_picture     → every size/format variant of the picture
+ • story_segments.audio_path → the segment's MP3
+media_gc deletes files nothing refers to once they are past a grace period.
+Paths are relative to the working directory, e.g. "audio/<key>.mp3".
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from src import profile_images
+
+AUDIO_DIR = "audio"
+
+PROFILE_PICTURE = "profile_picture"
+AUDIO = "audio"
+
+# File names derived from a content hash; what they hold never changes.
+_CONTENT_ADDRESSED_RE = re.compile(
+    r"^(?:[0-9a-f]{32}_\d+\.(?:jpg|webp)"   # profile_images.content_stem
+    r"|[0-9a-f]{64}\.mp3)$"                  # story_engine.audio_key
+)
+
+# kind → directory scanned by media_gc
+ROOTS: Dict[str, str] = {
+    PROFILE_PICTURE: profile_images.UPLOAD_DIR,
+    AUDIO: AUDIO_DIR,
+}
+
+
+def profile_picture_files(url: Optional[str]) -> List[str]:
+    return profile_images.files_for(url)
+
+
+def audio_files(audio_path: Optional[str]) -> List[str]:
+    path = (audio_path or "").lstrip("/")
+    return [path] if path.startswith(f"{AUDIO_DIR}/") else []
+
+
+def kind_of(path: str) -> Optional[str]:
+    directory = os.path.dirname(path)
+    for kind, root in ROOTS.items():
+        if directory == root:
+            return kind
+    return None
+
+
+def reference_for(path: str) -> str:
+    """The column value (profile_picture or audio_path) that keeps `path` alive."""
+    if kind_of(path) == PROFILE_PICTURE:
+        return profile_images.owner_url(path)
+    return path
+
+
+def content_addressed(path: str) -> bool:
+    return _CONTENT_ADDRESSED_RE.match(os.path.basename(path)) is not None
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Date, UniqueConstraint
+from sqlalchemy import (
+    Column, Integer, String, Boolean, DateTime, JSON, Date, Text, UniqueConstraint,
+    ForeignKey, Index, text,
+)
 from src.database import Base
 from datetime import datetime
 
@@ -33,6 +36,15 @@ class User(Base):
     
 class OTP(Base):
     __tablename__ = "otps"
+    __table_args__ = (
+        # Only live codes are ever looked up; used ones wait for the purge job.
+        Index(
+            "ix_otps_email_code_unused", "email", "otp_code",
+            postgresql_where=text("is_used = false"),
+            sqlite_where=text("is_used = 0"),
+        ),
+        Index("ix_otps_expires_at", "expires_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, index=True, nullable=False)
@@ -52,4 +64,53 @@ class StorySession(Base):
     current_choices = Column(JSON, nullable=False)
     audio_path = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    context_history = Column(JSON, default=[]) 
\ No newline at end of file
+    context_history = Column(JSON, default=[])      # legacy; turns live in story_segments
+    context_summary = Column(Text, nullable=False, default="", server_default="")  # rolling, see story_context
+    current_seq = Column(Integer, nullable=False, default=0, server_default="0")  # seq of the latest segment
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped on every write, see session_cache
+
+
+class StorySegment(Base):
+    """One generated turn of a story session; rows are only ever appended."""
+    __tablename__ = "story_segments"
+    __table_args__ = (
+        UniqueConstraint("session_id", "seq", name="uq_story_segments_session_seq"),
+        Index("ix_story_segments_context_token", "context_token", unique=True),
+        Index("ix_story_segments_audio_path", "audio_path"),  # media_gc reference checks
+    )
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("story_sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    context_token = Column(String, nullable=False)
+    story_text = Column(Text, nullable=False, default="")
+    choices = Column(JSON, nullable=False, default={})
+    audio_path = Column(String, nullable=False, default="")
+    created_at = Column(DateTime, default=datetime.utcnow) 
+
+class MediaObject(Base):
+    """Reference count of one content-addressed media file, see media_store."""
+    __tablename__ = "media_objects"
+
+    path = Column(String, primary_key=True)        # e.g. audio/<key>.mp3
+    kind = Column(String(20), nullable=False)      # profile_picture | audio
+    refcount = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class EmailOutbox(Base):
+    """Mail waiting for the email_outbox worker; rows are deleted once sent."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String, nullable=False)
+    template = Column(String(50), nullable=False)   # key of email_templete.TEMPLATES
+    context = Column(JSON, nullable=False, default={})
+    status = Column(String(10), nullable=False, default="pending", server_default="pending")  # pending | dead
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,124 @@
+"""
+src/opening_cache.py
+
+Cache in front of generate_story_segment() for opening segments (no
+previous context).
+
+Keys are canonicalized interest sets (trimmed, lowercased, de-duplicated,
+sorted), and each key holds a pool of up to OPENING_CACHE_POOL_SIZE varied
+segments: the first requests for a key generate new variants, later ones get
+a random pick, so users with the same interests don't all read one story.
+Entries expire after OPENING_CACHE_TTL seconds and the least recently used
+keys are dropped beyond OPENING_CACHE_MAX_KEYS.
+
+All bookkeeping runs synchronously between awaits, so it is safe to share
+across concurrent handlers on one event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src import story_engine
+
+OPENING_CACHE_ENABLED = os.getenv("OPENING_CACHE_ENABLED", "true").lower() == "true"
+OPENING_CACHE_POOL_SIZE = int(os.getenv("OPENING_CACHE_POOL_SIZE", "5"))
+OPENING_CACHE_TTL = int(os.getenv("OPENING_CACHE_TTL", "3600"))
+OPENING_CACHE_MAX_KEYS = int(os.getenv("OPENING_CACHE_MAX_KEYS", "256"))
+
+InterestKey = Tuple[str, ...]
+Segment = Tuple[str, Dict[int, str]]
+
+
+def canonical_interests(interests: Iterable[str]) -> InterestKey:
+    return tuple(sorted({i.strip().lower() for i in interests if i and i.strip()}))
+
+
+class OpeningCache:
+    def __init__(
+        self,
+        pool_size: int = OPENING_CACHE_POOL_SIZE,
+        ttl: int = OPENING_CACHE_TTL,
+        max_keys: int = OPENING_CACHE_MAX_KEYS,
+    ) -> None:
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._pools: "OrderedDict[InterestKey, List[Tuple[float, Segment]]]" = OrderedDict()
+        self._generating: Dict[InterestKey, List[asyncio.Task]] = {}
+        self._counters: Counter = Counter()
+
+    def lookup(self, interests: Iterable[str]) -> Optional[Segment]:
+        """Return a pooled segment once the key's pool is (about to be) full."""
+        key = canonical_interests(interests)
+        pool = self._fresh(key)
+        if pool and len(pool) + len(self._generating.get(key, ())) >= self.pool_size:
+            self._pools.move_to_end(key)
+            self._counters["hits"] += 1
+            story_text, choices = random.choice(pool)[1]
+            return story_text, dict(choices)
+        self._counters["misses"] += 1
+        return None
+
+    def add(self, interests: Iterable[str], story_text: str, choices: Dict[int, str]) -> None:
+        key = canonical_interests(interests)
+        pool = self._fresh(key)
+        if len(pool) < self.pool_size:
+            pool.append((time.monotonic(), (story_text, dict(choices))))
+        self._pools[key] = pool
+        self._pools.move_to_end(key)
+        while len(self._pools) > self.max_keys:
+            self._pools.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    async def get_or_generate(self, interests: List[str]) -> Segment:
+        cached = self.lookup(interests)
+        if cached is not None:
+            return cached
+
+        key = canonical_interests(interests)
+        in_flight = self._generating.setdefault(key, [])
+        if len(in_flight) >= self.pool_size:
+            # Cold key under a burst: share a variant that is already coming.
+            story_text, choices = await asyncio.shield(random.choice(in_flight))
+            return story_text, dict(choices)
+
+        task = asyncio.create_task(story_engine.generate_story_segment_async(interests))
+        in_flight.append(task)
+        try:
+            story_text, choices = await asyncio.shield(task)
+        finally:
+            in_flight.remove(task)
+            if not in_flight:
+                self._generating.pop(key, None)
+        self.add(interests, story_text, choices)
+        return story_text, choices
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._pools),
+            "segments": sum(len(p) for p in self._pools.values()),
+            "hits": self._counters["hits"],
+            "misses": self._counters["misses"],
+            "evictions": self._counters["evictions"],
+        }
+
+    def _fresh(self, key: InterestKey) -> List[Tuple[float, Segment]]:
+        pool = self._pools.get(key)
+        if not pool:
+            return []
+        cutoff = time.monotonic() - self.ttl
+        fresh = [entry for entry in pool if entry[0] >= cutoff]
+        if not fresh:
+            del self._pools[key]
+        elif len(fresh) != len(pool):
+            self._pools[key] = fresh
+        return fresh
+
+
+cache = OpeningCache()
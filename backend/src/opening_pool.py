@@ -0,0 +1,169 @@
+"""
+src/opening_pool.py
+
+Pre-warmed pool of opening segments for the most requested interest sets.
+
+A background worker ranks interest sets by how often they appear in recent
+`story_sessions.interests` rows, keeps the top OPENING_POOL_TOP_K of them
+stocked with OPENING_POOL_SIZE ready segments (text plus an already
+synthesized MP3), and generates at most OPENING_POOL_REFILL_RATE segments
+every OPENING_POOL_REFILL_INTERVAL seconds. /story/start pops a ready
+segment, so the common start path is a DB insert plus a file reference.
+
+Pooled MP3s have no DB reference until a session takes them, so each refill
+touches the ones still held to keep them inside media_gc's grace period. If
+one is gone anyway, pop() hands it to tts_jobs to synthesize again, so the
+returned audio_url reports "pending" instead of 404ing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional
+
+from src import crud, database, story_engine, tts_jobs
+from src.opening_cache import InterestKey, canonical_interests
+from src.story_engine import PreparedSegment
+
+logger = logging.getLogger(__name__)
+
+OPENING_POOL_ENABLED = os.getenv("OPENING_POOL_ENABLED", "false").lower() == "true"
+OPENING_POOL_TOP_K = int(os.getenv("OPENING_POOL_TOP_K", "10"))
+OPENING_POOL_SIZE = int(os.getenv("OPENING_POOL_SIZE", "3"))
+OPENING_POOL_REFILL_RATE = int(os.getenv("OPENING_POOL_REFILL_RATE", "5"))
+OPENING_POOL_REFILL_INTERVAL = int(os.getenv("OPENING_POOL_REFILL_INTERVAL", "60"))
+OPENING_POOL_LOOKBACK_HOURS = int(os.getenv("OPENING_POOL_LOOKBACK_HOURS", "24"))
+OPENING_POOL_SAMPLE_ROWS = int(os.getenv("OPENING_POOL_SAMPLE_ROWS", "2000"))
+
+
+class OpeningPool:
+    def __init__(
+        self,
+        top_k: int = OPENING_POOL_TOP_K,
+        size: int = OPENING_POOL_SIZE,
+        refill_rate: int = OPENING_POOL_REFILL_RATE,
+        interval: int = OPENING_POOL_REFILL_INTERVAL,
+    ) -> None:
+        self.top_k = top_k
+        self.size = size
+        self.refill_rate = refill_rate
+        self.interval = interval
+        self._ready: Dict[InterestKey, Deque[PreparedSegment]] = {}
+        self._ranking: List[InterestKey] = []
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Counter = Counter()
+
+    # ───────────── request path ─────────────
+    def pop(self, interests: List[str]) -> Optional[PreparedSegment]:
+        ready = self._ready.get(canonical_interests(interests))
+        if not ready:
+            self._counters["misses"] += 1
+            return None
+        self._counters["hits"] += 1
+        segment = ready.popleft()
+        if not self._touch(segment):
+            self._counters["resynthesized"] += 1
+            tts_jobs.submit(segment.story_text, segment.audio_filename)
+        return segment
+
+    @staticmethod
+    def _touch(segment: PreparedSegment) -> bool:
+        """Restart media_gc's grace period for the segment's MP3; False if it's gone."""
+        try:
+            os.utime(segment.audio_filename)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # ───────────── worker ─────────────
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="opening-pool-refill")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refill_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Opening pool refill failed")
+            await asyncio.sleep(self.interval)
+
+    async def refill_once(self) -> int:
+        """Re-rank interest sets and generate up to `refill_rate` segments."""
+        self._ranking = await self._rank()
+        self._drop_unranked()
+        self._touch_held()
+
+        generated = 0
+        while generated < self.refill_rate:
+            key = self._neediest()
+            if key is None:
+                break
+            segment = await self._prepare(key)
+            self._ready.setdefault(key, deque()).append(segment)
+            generated += 1
+        self._counters["generated"] += generated
+        return generated
+
+    async def _rank(self) -> List[InterestKey]:
+        since = datetime.utcnow() - timedelta(hours=OPENING_POOL_LOOKBACK_HOURS)
+        async with database.AsyncSessionLocal() as db:
+            rows = await crud.get_recent_story_interests(db, since, OPENING_POOL_SAMPLE_ROWS)
+        counts = Counter(canonical_interests(r) for r in rows if isinstance(r, list))
+        return [key for key, _ in counts.most_common(self.top_k) if len(key) >= 3]
+
+    def _neediest(self) -> Optional[InterestKey]:
+        # Most popular first, so a low refill rate still covers the head.
+        for key in self._ranking:
+            if len(self._ready.get(key, ())) < self.size:
+                return key
+        return None
+
+    async def _prepare(self, key: InterestKey) -> PreparedSegment:
+        story_text, choices = await story_engine.generate_story_segment_async(list(key))
+        audio_filename = tts_jobs.story_audio_filename(story_text)
+        await asyncio.to_thread(story_engine.generate_tts_audio, story_text, audio_filename)
+        return PreparedSegment(story_text, choices, audio_filename)
+
+    def _drop_unranked(self) -> None:
+        ranked = set(self._ranking)
+        for key in [k for k in self._ready if k not in ranked]:
+            # Their audio may be shared by name; media_gc removes it if unused.
+            self._ready.pop(key)
+
+    def _touch_held(self) -> None:
+        for ready in self._ready.values():
+            for segment in list(ready):
+                if not self._touch(segment):
+                    ready.remove(segment)   # deleted under us; regenerate instead
+                    self._counters["expired"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": OPENING_POOL_ENABLED,
+            "ranked": [list(k) for k in self._ranking],
+            "ready": {",".join(k): len(v) for k, v in self._ready.items()},
+            "hits": self._counters["hits"],
+            "misses": self._counters["misses"],
+            "generated": self._counters["generated"],
+            "resynthesized": self._counters["resynthesized"],
+            "expired": self._counters["expired"],
+        }
+
+
+pool = OpeningPool()
@@ -0,0 +1,87 @@
+"""
+src/otp_purge.py
+
+Background purge of dead OTP rows.
+
+Codes are only ever looked up while unused and unexpired, so every
+OTP_PURGE_INTERVAL seconds the worker deletes used or expired rows in
+batches of OTP_PURGE_BATCH_SIZE, one short transaction per batch, until a
+batch comes back short. Growth between runs is bounded separately by
+crud.OTP_MAX_ACTIVE_PER_EMAIL.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from src import crud, database
+
+logger = logging.getLogger(__name__)
+
+OTP_PURGE_ENABLED = os.getenv("OTP_PURGE_ENABLED", "true").lower() == "true"
+OTP_PURGE_INTERVAL = int(os.getenv("OTP_PURGE_INTERVAL", "600"))
+OTP_PURGE_BATCH_SIZE = int(os.getenv("OTP_PURGE_BATCH_SIZE", "1000"))
+
+
+class OtpPurger:
+    def __init__(
+        self, interval: int = OTP_PURGE_INTERVAL, batch_size: int = OTP_PURGE_BATCH_SIZE
+    ) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Counter = Counter()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="otp-purge")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.purge_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("OTP purge failed")
+            await asyncio.sleep(self.interval)
+
+    async def purge_once(self) -> int:
+        now = datetime.utcnow()
+        total = 0
+        while True:
+            async with database.AsyncSessionLocal() as db:
+                deleted = await crud.delete_stale_otps(db, now, self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            await asyncio.sleep(0)  # let request handlers in between batches
+        self._counters["runs"] += 1
+        self._counters["deleted"] += total
+        if total:
+            logger.info("Purged %d stale OTPs", total)
+        return total
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": OTP_PURGE_ENABLED,
+            "runs": self._counters["runs"],
+            "deleted": self._counters["deleted"],
+        }
+
+
+purger = OtpPurger()
@@ -0,0 +1,106 @@
+"""
+src/principal_cache.py
+
+TTL-bounded cache of authenticated principals for auth.get_current_user.
+
+Entries are `schemas.UserInDB` snapshots keyed by user id, so an
+authenticated request normally costs no DB query once the JWT is decoded.
+crud's user writes call invalidate_on_commit(); the entry is dropped when
+that transaction commits, so the next request re-reads the committed row.
+Other workers see the change within PRINCIPAL_CACHE_TTL seconds.
+
+Cached snapshots are shared between requests – treat them as read-only and
+change users through crud.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.schemas import UserInDB
+
+PRINCIPAL_CACHE_ENABLED = os.getenv("PRINCIPAL_CACHE_ENABLED", "true").lower() == "true"
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+_PENDING_KEY = "principal_cache_invalidate"
+
+
+class PrincipalCache:
+    def __init__(
+        self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: int = PRINCIPAL_CACHE_TTL
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, UserInDB]]" = OrderedDict()
+        self._counters: Counter = Counter()
+
+    def get(self, user_id: int) -> Optional[UserInDB]:
+        if not PRINCIPAL_CACHE_ENABLED:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(user_id, None)
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self._counters["hits"] += 1
+        return entry[1]
+
+    def put(self, user: Any) -> Any:
+        """Cache a snapshot of the ORM `user` and return it (or `user` itself
+        when the row does not fit the schema, e.g. legacy NULL columns)."""
+        try:
+            principal = UserInDB.model_validate(user)
+        except ValidationError:
+            self._counters["uncacheable"] += 1
+            return user
+        if PRINCIPAL_CACHE_ENABLED:
+            self._entries[principal.id] = (time.monotonic(), principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return principal
+
+    def invalidate(self, user_id: int) -> None:
+        if self._entries.pop(user_id, None) is not None:
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        hits, misses = self._counters["hits"], self._counters["misses"]
+        return {
+            "enabled": PRINCIPAL_CACHE_ENABLED,
+            "entries": len(self._entries),
+            **{name: self._counters[name] for name in (
+                "hits", "misses", "evictions", "invalidations", "uncacheable",
+            )},
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+
+cache = PrincipalCache()
+
+
+def invalidate_on_commit(session: Session, user_id: int) -> None:
+    """Drop `user_id` now and again once `session`'s transaction commits."""
+    cache.invalidate(user_id)
+    session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
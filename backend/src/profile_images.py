@@ -0,0 +1,197 @@
+"""
+src/profile_images.py
+
+Profile-picture processing off the event loop.
+
+An upload is decoded, EXIF-rotated, centre-cropped to a square and written
+as every size in PROFILE_IMAGE_SIZES, each as WebP and progressive JPEG:
+    media/profile_pics/<stem>_<size>.webp / .jpg
+The stem is a hash of the upload and the output settings, so re-uploading a
+picture (by anyone) reuses the existing files without decoding it again;
+media_gc deletes variants no user points at any more.
+
+JPEGs are opened in draft mode, so the decoder scales a huge photo down by
+up to 8x instead of decoding every pixel. The work runs in a process pool of
+PROFILE_IMAGE_WORKERS (0 = the event loop's thread pool); the handler only
+awaits it.
+
+User.profile_picture keeps pointing at the largest JPEG; srcset() derives
+the other variants from that URL for list views.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+UPLOAD_DIR = "media/profile_pics"
+UPLOAD_URL = "/media/profile_pics"
+
+PROFILE_IMAGE_SIZES: Tuple[int, ...] = tuple(sorted(
+    (int(s) for s in os.getenv("PROFILE_IMAGE_SIZES", "64,128,300").split(",")), reverse=True
+))
+PROFILE_IMAGE_WORKERS = int(os.getenv("PROFILE_IMAGE_WORKERS", str(min(os.cpu_count() or 1, 2))))
+PROFILE_IMAGE_JPEG_QUALITY = int(os.getenv("PROFILE_IMAGE_JPEG_QUALITY", "85"))
+PROFILE_IMAGE_WEBP_QUALITY = int(os.getenv("PROFILE_IMAGE_WEBP_QUALITY", "80"))
+
+# format → (extension, Pillow save options)
+FORMATS: Dict[str, Tuple[str, Dict[str, object]]] = {
+    "webp": ("webp", {"format": "WEBP", "quality": PROFILE_IMAGE_WEBP_QUALITY, "method": 4}),
+    "jpeg": ("jpg", {
+        "format": "JPEG", "quality": PROFILE_IMAGE_JPEG_QUALITY,
+        "progressive": True, "optimize": True,
+    }),
+}
+
+_VARIANT_RE = re.compile(r"^(?P<base>.+)_(?P<size>\d+)\.jpg$")
+_VARIANT_FILE_RE = re.compile(r"^(?P<base>.+)_(?P<size>\d+)\.(?:jpg|webp)$")
+
+Variants = Dict[str, Dict[int, str]]   # format → size → URL
+
+
+def content_stem(data: bytes) -> str:
+    """File stem for an upload: changes with the bytes and with any output setting."""
+    settings = json.dumps({"sizes": PROFILE_IMAGE_SIZES, "formats": FORMATS}, sort_keys=True)
+    return hashlib.sha256(settings.encode() + b"\0" + data).hexdigest()[:32]
+
+
+def variant_name(stem: str, size: int, fmt: str) -> str:
+    return f"{stem}_{size}.{FORMATS[fmt][0]}"
+
+
+def _variants_for(stem: str) -> Variants:
+    return {
+        fmt: {size: f"{UPLOAD_URL}/{variant_name(stem, size, fmt)}" for size in PROFILE_IMAGE_SIZES}
+        for fmt in FORMATS
+    }
+
+
+# ───────────── worker side ─────────────
+def _save(image: Image.Image, path: str, options: Dict[str, object]) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    image.save(tmp, **options)
+    os.replace(tmp, path)   # readers never see a half-written file
+
+
+def render_variants(data: bytes, stem: str, out_dir: str = UPLOAD_DIR) -> Variants:
+    """Decode `data` and write every size/format variant; ValueError if unreadable."""
+    largest = PROFILE_IMAGE_SIZES[0]
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG only: decode at the smallest 1/2^n scale still >= the largest size.
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGB")
+        base = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    except Exception as exc:
+        # Pillow signals bad input with OSError, SyntaxError, ValueError,
+        # DecompressionBombError, EXIF parsing errors…; all mean "unreadable".
+        raise ValueError(f"{type(exc).__name__}: {exc}") from exc
+
+    variants: Variants = {fmt: {} for fmt in FORMATS}
+    for size in PROFILE_IMAGE_SIZES:
+        # Each size is scaled from the already-cropped largest one.
+        resized = base if size == largest else base.resize((size, size), Image.Resampling.LANCZOS)
+        for fmt, (_, options) in FORMATS.items():
+            name = variant_name(stem, size, fmt)
+            _save(resized, os.path.join(out_dir, name), options)
+            variants[fmt][size] = f"{UPLOAD_URL}/{name}"
+    return variants
+
+
+# ───────────── pool ─────────────
+class ImageProcessor:
+    def __init__(self, workers: int = PROFILE_IMAGE_WORKERS) -> None:
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    def _pool(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def process(self, data: bytes) -> Variants:
+        """Variant URLs for `data`, rendering them unless they already exist."""
+        stem = content_stem(data)
+        variants = _variants_for(stem)
+        paths = [url.lstrip("/") for by_size in variants.values() for url in by_size.values()]
+        try:
+            for path in paths:
+                os.utime(path)   # restart media_gc's grace period
+            return variants
+        except FileNotFoundError:
+            pass
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool(), render_variants, data, stem
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+processor = ImageProcessor()
+
+
+# ───────────── URLs ─────────────
+def primary_url(variants: Variants) -> str:
+    """The URL stored in User.profile_picture: the largest JPEG."""
+    return variants["jpeg"][PROFILE_IMAGE_SIZES[0]]
+
+
+def format_srcset(variants: Variants) -> Dict[str, str]:
+    return {
+        fmt: ", ".join(f"{url} {size}w" for size, url in sorted(by_size.items()))
+        for fmt, by_size in variants.items()
+    }
+
+
+def srcset(profile_picture: Optional[str]) -> Optional[Dict[str, str]]:
+    """srcset strings per format for a stored variant URL; None for anything
+    else (Google avatars, pictures uploaded before variants existed)."""
+    match = _VARIANT_RE.match(profile_picture or "")
+    if match is None or int(match["size"]) != PROFILE_IMAGE_SIZES[0]:
+        return None
+    base = match["base"]
+    return format_srcset({
+        fmt: {size: f"{base}_{size}.{ext}" for size in PROFILE_IMAGE_SIZES}
+        for fmt, (ext, _) in FORMATS.items()
+    })
+
+
+# ───────────── files ─────────────
+def files_for(profile_picture: Optional[str]) -> List[str]:
+    """Paths on disk behind a stored profile_picture URL (none for external URLs)."""
+    url = profile_picture or ""
+    if not url.startswith(f"{UPLOAD_URL}/"):
+        return []
+    if srcset(url) is None:
+        return [url.lstrip("/")]   # single file from before variants
+    base = _VARIANT_RE.match(url)["base"].lstrip("/")
+    return [f"{base}_{size}.{ext}" for size in PROFILE_IMAGE_SIZES for ext, _ in FORMATS.values()]
+
+
+def owner_url(path: str) -> str:
+    """The profile_picture value that keeps the file at `path` alive."""
+    name = os.path.basename(path)
+    match = _VARIANT_FILE_RE.match(name)
+    if match is not None and int(match["size"]) in PROFILE_IMAGE_SIZES:
+        return f"{UPLOAD_URL}/{match['base']}_{PROFILE_IMAGE_SIZES[0]}.jpg"
+    return f"{UPLOAD_URL}/{name}"
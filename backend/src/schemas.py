@@ -1,9 +1,11 @@
 from typing import Dict, List, Optional, Any
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from sqlalchemy import Column, Integer, String, DateTime, func, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import date
 
+from src import profile_images
+
 Base = declarative_base()
 
 # ─────────── User ────────────
@@ -40,6 +42,12 @@ class User(UserBase):
     is_superuser: bool
     is_verified: bool
 
+    @computed_field
+    @property
+    def profile_picture_srcset(self) -> Optional[Dict[str, str]]:
+        """Per-format srcset of the uploaded picture's size variants."""
+        return profile_images.srcset(self.profile_picture)
+
     class Config:
         from_attributes = True
 
@@ -79,11 +87,13 @@ class LoginEvent(Base):
 class StoryStart(BaseModel):
     user_id: int
     interests: List[str]
+    speculate: bool = False        # pre-generate both branches in the background
 
 class StoryContinue(BaseModel):
     session_id: int
     choice: int
     context_token: str
+    speculate: bool = False
 
 class StoryResponse(BaseModel):
     session_id: int
@@ -91,6 +101,13 @@ class StoryResponse(BaseModel):
     choices: Dict[int, str]
     audio_url: str
     context_token: str
+    audio_id: Optional[str] = None
+    audio_status: str = "ready"    # "pending" until the MP3 at audio_url exists
+
+class AudioStatus(BaseModel):
+    audio_id: str
+    status: str                    # pending | ready | failed
+    audio_url: str
 
 class LoginRequest(BaseModel):
     identifier: str  # email OR username
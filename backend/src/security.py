@@ -1,12 +1,36 @@
 """
 Password-hash helpers — kept import-cycle-free.
+
+bcrypt costs a few hundred milliseconds of CPU per call, so request
+handlers use the async `hasher` (hash_password / verify_password_async /
+verify_and_update), which runs passlib in a bounded process pool:
+ • BCRYPT_ROUNDS       – cost factor for new hashes; older hashes are
+                         reported for rehash by verify_and_update()
+ • BCRYPT_WORKERS      – pool processes (0 = event loop's thread pool)
+ • BCRYPT_MAX_PENDING  – calls queued or running before new ones are
+                         refused with PasswordHasherBusy
+ • BCRYPT_RETRY_AFTER  – seconds clients are told to wait when refused
+
+get_password_hash() / verify_password() stay synchronous for scripts.
 """
+import asyncio
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
 load_dotenv()
 
-_pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(os.cpu_count() or 1, 4))))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", str(max(BCRYPT_WORKERS, 1) * 8)))
+BCRYPT_RETRY_AFTER = int(os.getenv("BCRYPT_RETRY_AFTER", "1"))
+
+_pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 
 def get_password_hash(password: str) -> str:
@@ -15,3 +39,86 @@ def get_password_hash(password: str) -> str:
 
 def verify_password(password: str, hashed_password: str) -> bool:
     return _pwd_ctx.verify(password, hashed_password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return _pwd_ctx.verify_and_update(password, hashed_password)
+
+
+# ───────────── off-loop hashing ─────────────
+class PasswordHasherBusy(Exception):
+    """Every hashing slot is taken; the caller should answer 503 + Retry-After."""
+
+    def __init__(self, retry_after: int = BCRYPT_RETRY_AFTER) -> None:
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(
+        self, workers: int = BCRYPT_WORKERS, max_pending: int = BCRYPT_MAX_PENDING
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._counters: Counter = Counter()
+
+    def _pool(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._counters["rejected"] += 1
+            raise PasswordHasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        finally:
+            self._pending -= 1
+            self._counters["completed"] += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored cost is outdated."""
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self._counters["completed"],
+            "rejected": self._counters["rejected"],
+        }
+
+
+hasher = PasswordHasher()
+
+
+async def hash_password(password: str) -> str:
+    return await hasher.hash(password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await hasher.verify(password, hashed_password)
@@ -0,0 +1,102 @@
+"""
+src/session_cache.py
+
+Process-local LRU of active story sessions.
+
+/story/continue reads a session and then writes its next turn. With the
+session held here the read is served from memory, and crud writes the turn
+as one conditional `UPDATE … RETURNING` plus the segment INSERT in a single
+commit – no `db.get` before it and no refresh after it.
+
+Entries are write-through snapshots (SessionState), replaced only after a
+commit succeeds. Each row carries a `version` that every write bumps, and
+the UPDATE is guarded with `WHERE version = <cached version>`: when another
+worker has moved the session on, the write matches no row, the entry is
+dropped and the caller reports a conflict instead of overwriting newer state.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+STORY_SESSION_CACHE_ENABLED = os.getenv("STORY_SESSION_CACHE_ENABLED", "true").lower() == "true"
+STORY_SESSION_CACHE_SIZE = int(os.getenv("STORY_SESSION_CACHE_SIZE", "1024"))
+STORY_SESSION_CACHE_TTL = int(os.getenv("STORY_SESSION_CACHE_TTL", "900"))
+
+
+@dataclass
+class SessionState:
+    """The columns of a StorySession that the story endpoints read."""
+    id: int
+    user_id: Optional[int]
+    interests: List[str]
+    current_story: str
+    current_choices: Dict[Any, str]
+    context_summary: str
+    current_seq: int
+    version: int
+
+    @classmethod
+    def from_row(cls, row: Any) -> "SessionState":
+        return cls(
+            id=row.id,
+            user_id=row.user_id,
+            interests=list(row.interests or []),
+            current_story=row.current_story or "",
+            current_choices=dict(row.current_choices or {}),
+            context_summary=row.context_summary or "",
+            current_seq=row.current_seq or 0,
+            version=row.version or 0,
+        )
+
+
+class SessionCache:
+    def __init__(
+        self, max_entries: int = STORY_SESSION_CACHE_SIZE, ttl: int = STORY_SESSION_CACHE_TTL
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, SessionState]]" = OrderedDict()
+        self._counters: Counter = Counter()
+
+    def get(self, session_id: int) -> Optional[SessionState]:
+        if not STORY_SESSION_CACHE_ENABLED:
+            return None
+        entry = self._entries.get(session_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(session_id, None)
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self._counters["hits"] += 1
+        return entry[1]
+
+    def put(self, state: SessionState) -> None:
+        if not STORY_SESSION_CACHE_ENABLED:
+            return
+        current = self._entries.get(state.id)
+        if current is not None and current[1].version > state.version:
+            return  # never replace newer state with an older read
+        self._entries[state.id] = (time.monotonic(), state)
+        self._entries.move_to_end(state.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def invalidate(self, session_id: int, stale: bool = False) -> None:
+        if self._entries.pop(session_id, None) is not None and stale:
+            self._counters["stale"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": STORY_SESSION_CACHE_ENABLED,
+            "entries": len(self._entries),
+            **{name: self._counters[name] for name in ("hits", "misses", "evictions", "stale")},
+        }
+
+
+cache = SessionCache()
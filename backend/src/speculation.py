@@ -0,0 +1,210 @@
+"""
+src/speculation.py
+
+Speculative pre-generation of story branches.
+
+Once a segment is returned its two choices are known, so (when the client
+opts in) both continuations are generated in the background – plus their
+MP3 when STORY_SPECULATION_TTS is on – and parked under
+(session_id, context_token, choice). /story/continue then takes the prepared
+branch instead of calling Gemini, and the branch that was not taken is
+cancelled or dropped. Its MP3 job is cancelled too if it hasn't started;
+synthesis already running in tts_jobs finishes, and media_gc deletes the
+unreferenced file later, so that TTS spend is not reclaimed.
+
+Spend is bounded by a per-client budget over a sliding window and by a cap
+on speculative generations in flight; `manager.stats()` reports the hit rate
+so the extra LLM cost can be judged. The story endpoints are not
+authenticated, so the budget is keyed by the client address the server
+sees, never by anything in the request body.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src import story_engine, story_tokens, tts_jobs
+from src.story_engine import PreparedSegment
+
+logger = logging.getLogger(__name__)
+
+STORY_SPECULATION_ENABLED = os.getenv("STORY_SPECULATION_ENABLED", "false").lower() == "true"
+STORY_SPECULATION_TTS = os.getenv("STORY_SPECULATION_TTS", "false").lower() == "true"
+STORY_SPECULATION_MAX_CONCURRENT = int(os.getenv("STORY_SPECULATION_MAX_CONCURRENT", "4"))
+STORY_SPECULATION_USER_BUDGET = int(os.getenv("STORY_SPECULATION_USER_BUDGET", "20"))
+STORY_SPECULATION_BUDGET_WINDOW = int(os.getenv("STORY_SPECULATION_BUDGET_WINDOW", "3600"))
+STORY_SPECULATION_TTL = int(os.getenv("STORY_SPECULATION_TTL", "600"))
+
+_Key = Tuple[int, str, int]  # (session_id, context_token, choice)
+
+
+class SpeculationManager:
+    def __init__(
+        self,
+        max_concurrent: int = STORY_SPECULATION_MAX_CONCURRENT,
+        user_budget: int = STORY_SPECULATION_USER_BUDGET,
+        budget_window: int = STORY_SPECULATION_BUDGET_WINDOW,
+        ttl: int = STORY_SPECULATION_TTL,
+        with_tts: bool = STORY_SPECULATION_TTS,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.user_budget = user_budget
+        self.budget_window = budget_window
+        self.ttl = ttl
+        self.with_tts = with_tts
+        self._tasks: Dict[_Key, asyncio.Task] = {}
+        self._started: Dict[_Key, float] = {}
+        self._spend: Dict[str, Deque[float]] = {}
+        self._counters: Counter = Counter()
+
+    # ───────────── scheduling ─────────────
+    def speculate(
+        self,
+        session_id: int,
+        client: str,
+        context_token: str,
+        interests: List[str],
+        story_text: str,
+        choices: Dict[int, str],
+        summary: str = "",
+    ) -> int:
+        """Start background generation for every choice; returns how many started."""
+        self._evict_expired()
+        self.discard_session(session_id, keep_token=context_token)
+        next_seq = story_tokens.verify_context_token(context_token).seq + 1
+
+        started = 0
+        for choice in choices:
+            key = (session_id, context_token, int(choice))
+            if key in self._tasks:
+                continue
+            if self._in_flight() >= self.max_concurrent:
+                self._counters["skipped_capacity"] += 1
+                continue
+            if not self._charge(client):
+                self._counters["skipped_budget"] += 1
+                continue
+
+            previous_context = story_engine.continuation_context(
+                story_text, choices, int(choice), summary
+            )
+            task = asyncio.create_task(
+                self._generate(session_id, next_seq, interests, previous_context),
+                name=f"speculate-{session_id}-{choice}",
+            )
+            task.add_done_callback(self._record_outcome)
+            self._tasks[key] = task
+            self._started[key] = time.monotonic()
+            self._counters["launched"] += 1
+            started += 1
+        return started
+
+    async def _generate(
+        self, session_id: int, seq: int, interests: List[str], previous_context: str
+    ) -> PreparedSegment:
+        story_text, choices = await story_engine.generate_story_segment_async(
+            interests, previous_context
+        )
+        audio_filename = None
+        if self.with_tts:
+            audio_filename = tts_jobs.story_audio_filename(story_text)
+            tts_jobs.submit(story_text, audio_filename)
+        return PreparedSegment(story_text, choices, audio_filename)
+
+    def _record_outcome(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._counters["failed"] += 1
+            logger.warning("Speculative generation failed: %s", task.exception())
+
+    def _in_flight(self) -> int:
+        return sum(1 for t in self._tasks.values() if not t.done())
+
+    def _charge(self, client: str) -> bool:
+        now = time.monotonic()
+        spent = self._spend.setdefault(client, deque())
+        while spent and now - spent[0] > self.budget_window:
+            spent.popleft()
+        if len(spent) >= self.user_budget:
+            return False
+        spent.append(now)
+        return True
+
+    # ───────────── consumption ─────────────
+    async def take(
+        self, session_id: int, context_token: str, choice: int
+    ) -> Optional[PreparedSegment]:
+        """Return the prepared branch for this turn, or None on a miss.
+
+        A branch still being generated is awaited, since it finishes sooner
+        than a fresh call would. All other branches of the session are dropped.
+        """
+        self._evict_expired()
+        speculated = any(k[:2] == (session_id, context_token) for k in self._tasks)
+        task = self._pop((session_id, context_token, choice))
+        self.discard_session(session_id)
+
+        if task is None:
+            if speculated:
+                self._counters["misses"] += 1
+            return None
+        try:
+            prepared = await asyncio.shield(task) if not task.done() else task.result()
+        except Exception:
+            self._counters["misses"] += 1
+            return None
+
+        self._counters["hits"] += 1
+        return prepared
+
+    # ───────────── eviction ─────────────
+    def discard_session(self, session_id: int, keep_token: Optional[str] = None) -> None:
+        """Drop every branch of `session_id` except those under `keep_token`."""
+        for key in [k for k in self._tasks if k[0] == session_id and k[1] != keep_token]:
+            self._drop(key)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, t in self._started.items() if now - t > self.ttl]:
+            self._drop(key)
+
+    def _pop(self, key: _Key) -> Optional[asyncio.Task]:
+        self._started.pop(key, None)
+        return self._tasks.pop(key, None)
+
+    def _drop(self, key: _Key) -> None:
+        task = self._pop(key)
+        if task is None:
+            return
+        if task.done():
+            self._counters["wasted"] += 1
+            if not task.cancelled() and task.exception() is None:
+                audio_filename = task.result().audio_filename
+                if audio_filename and tts_jobs.cancel(tts_jobs.audio_id_for(audio_filename)):
+                    self._counters["tts_cancelled"] += 1
+        else:
+            task.cancel()
+            self._counters["cancelled"] += 1
+
+    # ───────────── metrics ─────────────
+    def stats(self) -> Dict[str, object]:
+        hits, misses = self._counters["hits"], self._counters["misses"]
+        return {
+            "enabled": STORY_SPECULATION_ENABLED,
+            "in_flight": self._in_flight(),
+            "prepared": sum(1 for t in self._tasks.values() if t.done()),
+            **{name: self._counters[name] for name in (
+                "launched", "hits", "misses", "wasted", "cancelled",
+                "tts_cancelled", "failed", "skipped_budget", "skipped_capacity",
+            )},
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+
+manager = SpeculationManager()
@@ -1,85 +1,333 @@
 # src/story.py
+import json
 import logging
-import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src import crud, schemas, story_engine, database
+from src import (
+    crud, schemas, story_engine, database, tts_jobs, speculation, opening_cache,
+    opening_pool, story_context, story_tokens,
+)
+from src.session_cache import SessionState
 
 router = APIRouter()        # no prefix here; it’s provided in main.py
 logger = logging.getLogger(__name__)
 
-@router.post("/start", response_model=schemas.StoryResponse)
-async def start_story(
-    story: schemas.StoryStart,
-    db: AsyncSession = Depends(database.get_db),
-):
+def _check_interests(story: schemas.StoryStart) -> None:
     if len(story.interests) < 3:
         raise HTTPException(400, "Please provide at least 3 interests")
 
-    db_session = await crud.create_story_session(db, story)
-    story_text, choices = story_engine.generate_story_segment(story.interests)
-    context_token = str(uuid.uuid4())
-
-    audio_filename = f"audio/story_{db_session.id}.mp3"
-    story_engine.generate_tts_audio(story_text, audio_filename)
-
-    await crud.update_story_session(
-        db,
-        db_session.id,
-        story_text,
-        choices,
-        audio_filename,
-        context_token,
+
+async def _generate_opening(interests: List[str]) -> Tuple[str, Dict[int, str]]:
+    if opening_cache.OPENING_CACHE_ENABLED:
+        return await opening_cache.cache.get_or_generate(interests)
+    return await story_engine.generate_story_segment_async(interests)
+
+
+def _pooled_opening(interests: List[str]) -> Optional[story_engine.PreparedSegment]:
+    if not opening_pool.OPENING_POOL_ENABLED:
+        return None
+    return opening_pool.pool.pop(interests)
+
+
+def _cached_opening(interests: List[str]) -> Optional[story_engine.PreparedSegment]:
+    pooled = _pooled_opening(interests)
+    if pooled is not None or not opening_cache.OPENING_CACHE_ENABLED:
+        return pooled
+    cached = opening_cache.cache.lookup(interests)
+    if cached is None:
+        return None
+    story_text, choices = cached
+    return story_engine.PreparedSegment(story_text, choices)
+
+
+async def _load_continuation(
+    db: AsyncSession, continuation: schemas.StoryContinue
+) -> Tuple[SessionState, str, str]:
+    """Validate a continue request.
+
+    Returns the session, the prompt context for the next segment and the
+    rolling summary to store with it (now including the segment being left).
+    Signed tokens are checked before any DB read; only the latest turn of a
+    session can be continued.
+    """
+    token = continuation.context_token
+    seq: Optional[int] = None
+    if story_tokens.is_signed(token):
+        try:
+            claims = story_tokens.verify_context_token(token)
+        except story_tokens.InvalidContextToken as exc:
+            raise HTTPException(400, str(exc))
+        if claims.session_id != continuation.session_id:
+            raise HTTPException(400, "Invalid context token")
+        seq = claims.seq
+
+    db_session = await crud.get_story_session(db, continuation.session_id)
+    if not db_session:
+        raise HTTPException(404, "Session not found")
+
+    if not story_tokens.is_signed(token):
+        # Unsigned UUID tokens issued before signing was introduced.
+        seq = await crud.get_story_token_seq(db, db_session.id, token)
+        if seq is None:
+            raise HTTPException(400, "Invalid context token")
+    if seq != db_session.current_seq:
+        # The cached copy may trail a turn written by another worker.
+        db_session = await crud.get_story_session(db, db_session.id, fresh=True)
+        if db_session is None or seq != db_session.current_seq:
+            raise HTTPException(409, "Context token is no longer current")
+
+    summary = db_session.context_summary or ""
+    previous_context = story_engine.continuation_context(
+        db_session.current_story, db_session.current_choices, continuation.choice, summary
+    )
+    next_summary = story_context.update_summary(
+        summary,
+        db_session.current_story,
+        story_engine.choice_text(db_session.current_choices, continuation.choice),
+    )
+    return db_session, previous_context, next_summary
+
+
+async def _take_prepared(
+    db_session: SessionState, continuation: schemas.StoryContinue
+) -> Optional[story_engine.PreparedSegment]:
+    if not speculation.STORY_SPECULATION_ENABLED:
+        return None
+    return await speculation.manager.take(
+        db_session.id, continuation.context_token, continuation.choice
     )
 
+
+def _client(request: Request) -> str:
+    # Speculation budget key: the endpoints are unauthenticated, so nothing
+    # from the body (user_id, session id) can be trusted to identify a client.
+    return request.client.host if request.client else "unknown"
+
+
+def _maybe_speculate(
+    response: schemas.StoryResponse,
+    client: str,
+    interests: List[str],
+    requested: bool,
+    summary: str = "",
+) -> None:
+    if requested and speculation.STORY_SPECULATION_ENABLED:
+        speculation.manager.speculate(
+            response.session_id,
+            client,
+            response.context_token,
+            interests,
+            response.story_text,
+            response.choices,
+            summary,
+        )
+
+
+async def _save_segment(
+    db: AsyncSession,
+    session_id: int,
+    story_text: str,
+    choices: Dict[int, str],
+    seq: int,
+    prepared: Optional[story_engine.PreparedSegment] = None,
+    summary: Optional[str] = None,
+    version: Optional[int] = None,
+) -> schemas.StoryResponse:
+    """Queue TTS for a freshly generated segment, persist it as turn `seq`
+    and build the response."""
+    context_token = story_tokens.create_context_token(session_id, seq)
+
+    if prepared is not None and prepared.audio_filename:
+        audio_filename = prepared.audio_filename
+        audio_id = tts_jobs.audio_id_for(audio_filename)
+    else:
+        audio_filename = tts_jobs.story_audio_filename(story_text)
+        audio_id = tts_jobs.submit(story_text, audio_filename)
+
+    try:
+        saved = await crud.update_story_session(
+            db,
+            session_id,
+            story_text,
+            choices,
+            audio_filename,
+            context_token,
+            context_summary=summary,
+            seq=seq,
+            expected_version=version,
+        )
+    except IntegrityError:
+        await db.rollback()
+        saved = None
+    if saved is None:
+        raise HTTPException(409, "Context token is no longer current")
+
     return schemas.StoryResponse(
-        session_id=db_session.id,
+        session_id=session_id,
         story_text=story_text,
         choices=choices,
         audio_url=f"/{audio_filename}",
         context_token=context_token,
+        audio_id=audio_id,
+        audio_status=tts_jobs.status(audio_id) or tts_jobs.PENDING,
+    )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_segment(
+    session_id: int,
+    client: str,
+    interests: List[str],
+    previous_context: str,
+    opening: bool,
+    seq: int,
+    speculate: bool,
+    prepared: Optional[story_engine.PreparedSegment] = None,
+    summary: str = "",
+    version: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """SSE body: `text` events with story deltas, then one `done` event.
+
+    The request's DB session is already closed while the body streams, so
+    the segment is persisted through a session of its own.
+    """
+    try:
+        if prepared is not None:
+            story_text, choices = prepared.story_text, prepared.choices
+            yield _sse("text", {"delta": story_text})
+        else:
+            text_filter = story_engine.StoryTextFilter()
+            raw: List[str] = []
+            async for chunk in story_engine.stream_story_segment(interests, previous_context):
+                raw.append(chunk)
+                delta = text_filter.feed(chunk)
+                if delta:
+                    yield _sse("text", {"delta": delta})
+            story_text, choices = story_engine.parse_story_segment("".join(raw))
+            if opening and opening_cache.OPENING_CACHE_ENABLED:
+                opening_cache.cache.add(interests, story_text, choices)
+
+        async with database.AsyncSessionLocal() as db:
+            response = await _save_segment(
+                db, session_id, story_text, choices, seq, prepared, summary, version
+            )
+        _maybe_speculate(response, client, interests, speculate, summary)
+        yield _sse("done", response.model_dump())
+    except HTTPException as exc:
+        yield _sse("error", {"detail": exc.detail})
+    except Exception:
+        logger.exception("Streaming story generation failed for session %s", session_id)
+        yield _sse("error", {"detail": "Story generation failed"})
+
+
+def _event_stream(body: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/start", response_model=schemas.StoryResponse)
+async def start_story(
+    story: schemas.StoryStart,
+    request: Request,
+    db: AsyncSession = Depends(database.get_db),
+):
+    _check_interests(story)
+
+    db_session = await crud.create_story_session(db, story)
+    prepared = _pooled_opening(story.interests)
+    if prepared is not None:
+        story_text, choices = prepared.story_text, prepared.choices
+    else:
+        story_text, choices = await _generate_opening(story.interests)
+    response = await _save_segment(
+        db, db_session.id, story_text, choices,
+        seq=1, prepared=prepared, version=db_session.version,
+    )
+    _maybe_speculate(response, _client(request), story.interests, story.speculate)
+    return response
+
+@router.post("/start/stream")
+async def start_story_stream(
+    story: schemas.StoryStart,
+    request: Request,
+    db: AsyncSession = Depends(database.get_db),
+):
+    _check_interests(story)
+
+    db_session = await crud.create_story_session(db, story)
+    return _event_stream(
+        _stream_segment(
+            db_session.id, _client(request), story.interests, "",
+            opening=True, seq=1, speculate=story.speculate,
+            prepared=_cached_opening(story.interests), version=db_session.version,
+        )
     )
 
 @router.post("/continue", response_model=schemas.StoryResponse)
 async def continue_story(
     continuation: schemas.StoryContinue,
+    request: Request,
     db: AsyncSession = Depends(database.get_db),
 ):
-    db_session = await crud.get_story_session(db, continuation.session_id)
-    if not db_session:
-        raise HTTPException(404, "Session not found")
+    db_session, previous_context, summary = await _load_continuation(db, continuation)
 
-    if continuation.context_token not in db_session.context_history:
-        raise HTTPException(400, "Invalid context token")
-
-    prev_choice = db_session.current_choices.get(continuation.choice, "")
-    previous_context = (
-        f"Previous story: {db_session.current_story}\n"
-        f"User chose: {prev_choice}"
+    prepared = await _take_prepared(db_session, continuation)
+    if prepared is not None:
+        story_text, choices = prepared.story_text, prepared.choices
+    else:
+        story_text, choices = await story_engine.generate_story_segment_async(
+            db_session.interests,
+            previous_context,
+        )
+    response = await _save_segment(
+        db, db_session.id, story_text, choices,
+        seq=db_session.current_seq + 1, prepared=prepared, summary=summary,
+        version=db_session.version,
     )
-
-    story_text, choices = story_engine.generate_story_segment(
-        db_session.interests,
-        previous_context,
+    _maybe_speculate(
+        response, _client(request), db_session.interests, continuation.speculate, summary
     )
-    context_token = str(uuid.uuid4())
-    audio_filename = f"audio/story_{db_session.id}_{context_token[:8]}.mp3"
-    story_engine.generate_tts_audio(story_text, audio_filename)
-
-    await crud.update_story_session(
-        db,
-        db_session.id,
-        story_text,
-        choices,
-        audio_filename,
-        context_token,
+    return response
+
+@router.post("/continue/stream")
+async def continue_story_stream(
+    continuation: schemas.StoryContinue,
+    request: Request,
+    db: AsyncSession = Depends(database.get_db),
+):
+    db_session, previous_context, summary = await _load_continuation(db, continuation)
+    prepared = await _take_prepared(db_session, continuation)
+    return _event_stream(
+        _stream_segment(
+            db_session.id, _client(request), db_session.interests, previous_context,
+            opening=False, seq=db_session.current_seq + 1,
+            speculate=continuation.speculate, prepared=prepared,
+            summary=summary, version=db_session.version,
+        )
     )
 
-    return schemas.StoryResponse(
-        session_id=db_session.id,
-        story_text=story_text,
-        choices=choices,
-        audio_url=f"/{audio_filename}",
-        context_token=context_token,
+@router.get("/audio/{audio_id}", response_model=schemas.AudioStatus)
+async def audio_status(
+    audio_id: str,
+    wait: float = Query(0, ge=0, le=30, description="Long-poll for up to this many seconds"),
+):
+    state = await tts_jobs.wait(audio_id, wait)
+    if state is None:
+        raise HTTPException(404, "Audio not found")
+
+    return schemas.AudioStatus(
+        audio_id=audio_id,
+        status=state,
+        audio_url=f"/{tts_jobs.AUDIO_DIR}/{audio_id}.mp3",
     )
@@ -0,0 +1,105 @@
+"""
+src/story_context.py
+
+Bounded story memory for continuation prompts.
+
+Each StorySession keeps a rolling `context_summary` that is updated once per
+turn from the segment just played and the choice taken, so nothing is
+re-read from older turns:
+
+ • recent turns are kept as one line each – the opening sentence of the
+   scene plus the choice;
+ • once those exceed STORY_SUMMARY_TOKEN_BUDGET the oldest lines are folded
+   into a single "Earlier choices" line, which is itself trimmed from the
+   front.
+
+build_context() then assembles summary + previous segment + choice and
+clamp() enforces STORY_CONTEXT_TOKEN_BUDGET on it, so prompt size – and
+with it per-turn latency – stays flat however long a session runs.
+Token counts are estimated (about four characters per token); no extra
+model call is made.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import List
+
+STORY_CONTEXT_TOKEN_BUDGET = int(os.getenv("STORY_CONTEXT_TOKEN_BUDGET", "600"))
+STORY_SUMMARY_TOKEN_BUDGET = int(os.getenv("STORY_SUMMARY_TOKEN_BUDGET", "250"))
+
+_CHARS_PER_TOKEN = 4
+_EARLIER_PREFIX = "Earlier choices: "
+_SPEAKER_RE = re.compile(r"^[A-Za-z]+:\s*", re.MULTILINE)
+_SENTENCE_RE = re.compile(r"(.+?[.!?])(\s|$)", re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def clamp(text: str, max_tokens: int, keep: str = "end") -> str:
+    """Cut `text` to roughly `max_tokens`, keeping its start or its end."""
+    limit = max_tokens * _CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    if limit <= 1:
+        return ""
+    if keep == "start":
+        return text[: limit - 1] + "…"
+    return "…" + text[-(limit - 1):]
+
+
+def _first_sentence(story_text: str) -> str:
+    plain = " ".join(_SPEAKER_RE.sub("", story_text).split())
+    match = _SENTENCE_RE.match(plain)
+    return (match.group(1) if match else plain).strip()
+
+
+def update_summary(summary: str, story_text: str, choice_text: str) -> str:
+    """Fold one finished turn into the rolling summary."""
+    lines: List[str] = [l for l in (summary or "").splitlines() if l.strip()]
+    earlier = ""
+    if lines and lines[0].startswith(_EARLIER_PREFIX):
+        earlier = lines.pop(0)[len(_EARLIER_PREFIX):]
+
+    scene = clamp(_first_sentence(story_text), 40, keep="start")
+    lines.append(f"{scene} → {choice_text}" if choice_text else scene)
+
+    def render() -> str:
+        head = [_EARLIER_PREFIX + earlier] if earlier else []
+        return "\n".join(head + lines)
+
+    # Demote the oldest detailed turns to bare choices until we fit.
+    while len(lines) > 1 and estimate_tokens(render()) > STORY_SUMMARY_TOKEN_BUDGET:
+        oldest = lines.pop(0)
+        choice = oldest.rsplit(" → ", 1)[1] if " → " in oldest else oldest
+        earlier = f"{earlier}; {choice}" if earlier else choice
+
+    if earlier:
+        room = STORY_SUMMARY_TOKEN_BUDGET - estimate_tokens("\n".join(lines)) - 5
+        earlier = clamp(earlier, max(room, 0), keep="end")
+    return render()
+
+
+def build_context(summary: str, story_text: str, choice_text: str) -> str:
+    """Prompt context for the next segment, within STORY_CONTEXT_TOKEN_BUDGET."""
+    choice_part = f"User chose: {choice_text}"
+    story_prefix = "Previous story: "
+    # The labels and the line break between the parts count against the budget too.
+    story_budget = max(
+        STORY_CONTEXT_TOKEN_BUDGET - estimate_tokens(choice_part) - estimate_tokens(story_prefix) - 1,
+        0,
+    )
+    story_part = story_prefix + clamp(story_text, story_budget)
+
+    summary_budget = max(
+        STORY_CONTEXT_TOKEN_BUDGET - estimate_tokens(story_part) - estimate_tokens(choice_part) - 4,
+        0,
+    )
+    parts = []
+    if summary and summary_budget:
+        parts.append(f"Story so far:\n{clamp(summary, summary_budget)}")
+    parts += [story_part, choice_part]
+    return clamp("\n".join(parts), STORY_CONTEXT_TOKEN_BUDGET)
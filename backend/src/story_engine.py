@@ -2,22 +2,32 @@
 src/story_engine.py
 
 Story text + TTS helpers:
- • generate_story_segment()  – Gemini-1.5 Flash for text
- • generate_tts_audio()      – Open-source TTS via gTTS producing MP3, filtering out speaker tags
+ • generate_story_segment()        – Gemini-1.5 Flash for text (blocking)
+ • generate_story_segment_async()  – same, awaitable and concurrency-capped
+ • stream_story_segment()          – raw text chunks as Gemini produces them
+ • continuation_context()          – prompt context for the branch a user picked
+ • StoryTextFilter                 – strips the `Choice N:` lines from a stream
+ • PreparedSegment                 – a segment produced ahead of the request for it
+ • generate_tts_audio()            – Open-source TTS via gTTS producing MP3, filtering out
+                                     speaker tags; deduplicated through src.audio_cache
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import google.generativeai as genai
 from google.generativeai import types
 from gtts import gTTS
 
+from src import audio_cache, story_context
+
 # ─────────────────────────── configuration ────────────────────────────
 # Gemini text generation
 _genai_key = os.getenv("GOOGLE_API_KEY")
@@ -25,6 +35,21 @@ if not _genai_key:
     raise RuntimeError("Environment variable GOOGLE_API_KEY must be set for story generation")
 genai.configure(api_key=_genai_key)
 _TEXT_MODEL = genai.GenerativeModel("gemini-1.5-flash")
+_GENERATION_CONFIG = types.GenerationConfig(
+    temperature=0.8,
+    top_p=0.95,
+    top_k=50,
+    max_output_tokens=1024,
+)
+
+# Upper bound on Gemini calls in flight per worker; extra requests queue here
+# instead of piling onto the API.
+STORY_MAX_CONCURRENT_GENERATIONS = int(os.getenv("STORY_MAX_CONCURRENT_GENERATIONS", "8"))
+_generation_slots = asyncio.Semaphore(STORY_MAX_CONCURRENT_GENERATIONS)
+
+# gTTS voice; part of the audio cache key
+TTS_LANG = os.getenv("TTS_LANG", "en")
+TTS_TLD = os.getenv("TTS_TLD", "com")
 
 # Logger setup
 logger = logging.getLogger(__name__)
@@ -36,18 +61,25 @@ if not logger.handlers:
 
 # ───────────────────────── story generation ────────────────────────────
 
-def generate_story_segment(
-    interests: List[str], previous_context: str = ""
-) -> Tuple[str, Dict[int, str]]:
-    """Return a story segment and two choices."""
+@dataclass
+class PreparedSegment:
+    story_text: str
+    choices: Dict[int, str]
+    audio_filename: Optional[str] = None  # set when TTS was already queued or done
+
+
+def _build_prompt(interests: List[str], previous_context: str = "") -> str:
     interests = interests or ["adventure"]
+    previous_context = story_context.clamp(
+        previous_context, story_context.STORY_CONTEXT_TOKEN_BUDGET
+    )
     greeting = (
         f"I see you're passionate about {interests[0]}!"
         if len(interests) == 1
         else f"I see you're interested in {', '.join(interests[:-1])} and {interests[-1]}."
     )
 
-    prompt = f"""{greeting}
+    return f"""{greeting}
 Let's create an exciting adventure together!
 
 Create an engaging story segment (3-5 sentences) incorporating these interests.
@@ -59,45 +91,156 @@ Protagonist: …
 Choice 1: …
 Choice 2: …
 """
-    resp = _TEXT_MODEL.generate_content(
-        prompt,
-        generation_config=types.GenerationConfig(
-            temperature=0.8,
-            top_p=0.95,
-            top_k=50,
-            max_output_tokens=1024,
-        ),
-    )
-    full_text = resp.text.strip()
+
+
+_CHOICE_RE = re.compile(r"Choice\s*(\d+):\s*(.+)", re.I)
+_CHOICE_LINE_RE = re.compile(r"^[ \t]*Choice\s*\d", re.I | re.M)
+
+
+def parse_story_segment(full_text: str) -> Tuple[str, Dict[int, str]]:
+    """Split raw model output into story text and the numbered choices."""
+    full_text = full_text.strip()
     logger.info("Generated story: %s", full_text.replace("\n", " / "))
 
     # Extract the two choices
-    choice_re = re.compile(r"Choice\s*(\d+):\s*(.+)", re.I)
-    choices = {int(n): t.strip() for n, t in choice_re.findall(full_text)}
-    story_text = choice_re.sub("", full_text).strip()
+    choices = {int(n): t.strip() for n, t in _CHOICE_RE.findall(full_text)}
+    story_text = _CHOICE_RE.sub("", full_text).strip()
     return story_text, choices or {1: "Continue", 2: "Stop"}
 
+
+def choice_text(choices: Dict, choice: int) -> str:
+    # choices loaded from the JSON column have string keys
+    return choices.get(choice) or choices.get(str(choice), "")
+
+
+def continuation_context(
+    story_text: str, choices: Dict, choice: int, summary: str = ""
+) -> str:
+    """Prompt context for continuing `story_text` down branch `choice`."""
+    return story_context.build_context(summary, story_text, choice_text(choices, choice))
+
+
+def generate_story_segment(
+    interests: List[str], previous_context: str = ""
+) -> Tuple[str, Dict[int, str]]:
+    """Return a story segment and two choices."""
+    resp = _TEXT_MODEL.generate_content(
+        _build_prompt(interests, previous_context),
+        generation_config=_GENERATION_CONFIG,
+    )
+    return parse_story_segment(resp.text)
+
+
+async def generate_story_segment_async(
+    interests: List[str], previous_context: str = ""
+) -> Tuple[str, Dict[int, str]]:
+    """Async variant of generate_story_segment() for request handlers.
+
+    Uses Gemini's async client so the event loop keeps serving other requests
+    while the model is working; at most STORY_MAX_CONCURRENT_GENERATIONS calls
+    run at once.
+    """
+    async with _generation_slots:
+        resp = await _TEXT_MODEL.generate_content_async(
+            _build_prompt(interests, previous_context),
+            generation_config=_GENERATION_CONFIG,
+        )
+    return parse_story_segment(resp.text)
+
+
+async def stream_story_segment(
+    interests: List[str], previous_context: str = ""
+) -> AsyncIterator[str]:
+    """Yield raw model output chunk by chunk; join them for parse_story_segment()."""
+    async with _generation_slots:
+        resp = await _TEXT_MODEL.generate_content_async(
+            _build_prompt(interests, previous_context),
+            generation_config=_GENERATION_CONFIG,
+            stream=True,
+        )
+        async for chunk in resp:
+            try:
+                text = chunk.text
+            except ValueError:  # chunk without text parts (e.g. safety metadata)
+                continue
+            if text:
+                yield text
+
+
+class StoryTextFilter:
+    """Turn raw streamed chunks into displayable story text.
+
+    Narrator/protagonist text is passed through as soon as it arrives; once a
+    `Choice N:` line starts, everything after it is held back, because the
+    choices are delivered separately after parsing the full output.
+    """
+
+    def __init__(self) -> None:
+        self._raw = ""
+        self._sent = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> str:
+        if self._done:
+            return ""
+        self._raw += chunk
+
+        match = _CHOICE_LINE_RE.search(self._raw)
+        if match:
+            limit = match.start()
+            self._done = True
+        else:
+            # The trailing partial line may still turn into "Choice 1:".
+            line_start = self._raw.rfind("\n") + 1
+            tail = self._raw[line_start:].lstrip().lower()
+            if tail and ("choice".startswith(tail) or tail.startswith("choice")):
+                limit = line_start
+            else:
+                limit = len(self._raw)
+
+        delta = self._raw[self._sent:limit]
+        self._sent = max(self._sent, limit)
+        return delta
+
 # ───────────────────────── TTS generation ───────────────────────────────
 
+def _filter_for_speech(story_text: str) -> str:
+    # Remove dialogue tags like 'Narrator:', 'Protagonist:', etc.
+    return re.sub(r"^[A-Za-z]+:\s*", "", story_text, flags=re.MULTILINE)
+
+
+def audio_key(story_text: str) -> str:
+    """Content key of the speech for `story_text` (also its TTS cache key)."""
+    return audio_cache.cache_key(_filter_for_speech(story_text), lang=TTS_LANG, tld=TTS_TLD)
+
+
 def generate_tts_audio(story_text: str, filename: str | Path) -> None:
-    """Synthesize speech via gTTS, filtering out speaker tags."""
+    """Synthesize speech via gTTS, filtering out speaker tags.
+
+    Identical filtered text is synthesized once and shared through the
+    content-addressed audio cache. Failures propagate (tts_jobs reports the
+    job as failed): `filename` is the text's permanent, immutably cached URL,
+    so nothing but the real speech may ever be written there.
+    """
     p = Path(filename)
     # ensure .mp3 extension
     if p.suffix.lower() != ".mp3":
         p = p.with_suffix(".mp3")
     p.parent.mkdir(parents=True, exist_ok=True)
 
-    # Remove dialogue tags like 'Narrator:', 'Protagonist:', etc.
-    filtered = re.sub(r"^[A-Za-z]+:\s*", "", story_text, flags=re.MULTILINE)
+    filtered = _filter_for_speech(story_text)
+    key = audio_key(story_text)
 
-    try:
+    def synthesize(tmp: Path) -> None:
         logger.info("Generating filtered gTTS MP3 → %s", p)
-        tts = gTTS(text=filtered, lang="en")
-        tts.save(str(p))
-    except Exception as e:
-        logger.error("gTTS generation failed: %s", e, exc_info=True)
-        # write 1s silent MP3 using empty TTS
-        silent = gTTS(text=" ", lang="en")
-        silent.save(str(p))
+        gTTS(text=filtered, lang=TTS_LANG, tld=TTS_TLD).save(str(tmp))
+
+    # get_or_create/link_to write to temp files and os.replace() them, so
+    # a failure leaves no partial file behind at `p`.
+    blob = audio_cache.cache.get_or_create(key, synthesize)
+    audio_cache.cache.link_to(blob, p)
+    # A hard link shares the blob's mtime; media GC's grace period should
+    # count from publication, not from when the text was first spoken.
+    os.utime(p)
 
 # no _write_wav anymore
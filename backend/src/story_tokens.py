@@ -0,0 +1,83 @@
+"""
+src/story_tokens.py
+
+Stateless, HMAC-signed context tokens for /story/continue.
+
+A token reads `<session_id>.<seq>.<expires_at>.<signature>`, where the
+signature is a truncated HMAC-SHA256 over the first three fields keyed with
+STORY_TOKEN_SECRET (falling back to SECRET_KEY; with neither set a random
+per-process key is used, so tokens die with the process and aren't shared
+between workers). Forged, mangled or expired
+tokens are rejected without touching the database; the handler then only
+has to compare `seq` with the session's current turn to refuse replays of
+older branches.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+_configured_secret = os.getenv("STORY_TOKEN_SECRET") or os.getenv("SECRET_KEY")
+if not _configured_secret:
+    logger.warning(
+        "Neither STORY_TOKEN_SECRET nor SECRET_KEY is set; signing context tokens "
+        "with a random key that is lost on restart"
+    )
+STORY_TOKEN_SECRET = (_configured_secret or secrets.token_urlsafe(32)).encode("utf-8")
+STORY_TOKEN_TTL = int(os.getenv("STORY_TOKEN_TTL", str(7 * 24 * 3600)))
+
+_SIG_BYTES = 16
+
+# ASCII digits only (int() would also take "٣", " 3" or "3_0"), and a
+# base64url signature, so nothing non-ASCII ever reaches _sign/compare_digest.
+_TOKEN_RE = re.compile(r"(\d+)\.(\d+)\.(\d+)\.([A-Za-z0-9_-]+)", re.ASCII)
+
+
+class InvalidContextToken(ValueError):
+    pass
+
+
+class ContextClaims(NamedTuple):
+    session_id: int
+    seq: int
+    expires_at: int
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(STORY_TOKEN_SECRET, payload.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:_SIG_BYTES]).rstrip(b"=").decode("ascii")
+
+
+def create_context_token(session_id: int, seq: int, ttl: Optional[int] = None) -> str:
+    expires_at = int(time.time()) + (STORY_TOKEN_TTL if ttl is None else ttl)
+    payload = f"{session_id}.{seq}.{expires_at}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def is_signed(token: str) -> bool:
+    """Legacy tokens are bare UUIDs; signed ones have four dot-separated parts."""
+    return token.count(".") == 3
+
+
+def verify_context_token(token: str, now: Optional[float] = None) -> ContextClaims:
+    match = _TOKEN_RE.fullmatch(token)
+    if match is None:
+        raise InvalidContextToken("Malformed context token")
+    session_id, seq, expires_at = (int(part) for part in match.group(1, 2, 3))
+    payload, signature = token.rsplit(".", 1)
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidContextToken("Invalid context token")
+    if expires_at < (time.time() if now is None else now):
+        raise InvalidContextToken("Context token expired")
+    return ContextClaims(session_id, seq, expires_at)
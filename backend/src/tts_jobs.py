@@ -0,0 +1,149 @@
+"""
+src/tts_jobs.py
+
+Background speech synthesis for story segments:
+ • story_audio_filename() – where a segment's MP3 lives (content-addressed)
+ • submit()  – queue generate_tts_audio() on a bounded worker pool
+ • cancel()  – drop a queued job nobody needs any more
+ • status()  – "pending" / "ready" / "failed" for a segment's MP3
+ • wait()    – long-poll helper behind GET /story/audio/{audio_id}
+
+Jobs are keyed by the MP3's file stem (the "audio id"), so a finished job
+that has already dropped out of the in-memory registry – or was produced by
+another worker – is still reported as ready once the file is on disk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Set
+
+from src import media_store, story_engine
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DIR = media_store.AUDIO_DIR
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+# How many finished jobs to remember; older ones fall back to the disk check.
+TTS_JOB_HISTORY = int(os.getenv("TTS_JOB_HISTORY", "1024"))
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+_AUDIO_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+_jobs: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+_running: Set[str] = set()   # audio ids a worker thread has picked up
+_submitters: Counter = Counter()   # pending audio id → submit() calls still wanting it
+
+
+def story_audio_filename(story_text: str) -> str:
+    # Named by content: segments with the same speech share one file, which
+    # media_gc deletes once no segment references it.
+    return f"{AUDIO_DIR}/{story_engine.audio_key(story_text)}.mp3"
+
+
+def audio_id_for(filename: str | Path) -> str:
+    return Path(filename).stem
+
+
+def _audio_path(audio_id: str) -> Path:
+    return Path(AUDIO_DIR) / f"{audio_id}.mp3"
+
+
+def _trim_history() -> None:
+    while len(_jobs) > TTS_JOB_HISTORY:
+        oldest_id, oldest = next(iter(_jobs.items()))
+        if not oldest.done():
+            break
+        _jobs.pop(oldest_id)
+
+
+def submit(story_text: str, filename: str | Path) -> str:
+    """Schedule synthesis of `story_text` into `filename`; returns the audio id."""
+    audio_id = audio_id_for(filename)
+    existing = _jobs.get(audio_id)
+    if existing is not None and not existing.done():
+        _submitters[audio_id] += 1   # same content requested again
+        return audio_id
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, _synthesize, audio_id, story_text, filename)
+    future.add_done_callback(lambda f: _job_done(audio_id, f))
+    _submitters[audio_id] = 1
+    _jobs[audio_id] = future
+    _jobs.move_to_end(audio_id)
+    _trim_history()
+    return audio_id
+
+
+def _synthesize(audio_id: str, story_text: str, filename: str | Path) -> None:
+    _running.add(audio_id)
+    try:
+        story_engine.generate_tts_audio(story_text, filename)
+    finally:
+        _running.discard(audio_id)
+
+
+def _job_done(audio_id: str, future: asyncio.Future) -> None:
+    if _jobs.get(audio_id) in (None, future):   # not yet resubmitted after a cancel
+        _submitters.pop(audio_id, None)
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("TTS job %s failed: %s", audio_id, future.exception())
+
+
+def cancel(audio_id: str) -> bool:
+    """Withdraw one submit() of `audio_id`; True if the job was dropped.
+
+    Audio is shared by content, so the job is only cancelled once every
+    submitter has withdrawn, and only while still queued: a job already
+    synthesizing runs to completion (a worker thread can't be interrupted)
+    and its file is left for media_gc.
+    """
+    future = _jobs.get(audio_id)
+    if future is None or future.done():
+        return False
+    _submitters[audio_id] -= 1
+    if _submitters[audio_id] > 0 or audio_id in _running:
+        return False
+    _jobs.pop(audio_id)
+    return future.cancel()
+
+
+def status(audio_id: str) -> Optional[str]:
+    """Return the job state, or None if the id is unknown."""
+    if not _AUDIO_ID_RE.match(audio_id):
+        return None
+
+    future = _jobs.get(audio_id)
+    if future is not None:
+        if not future.done():
+            return PENDING
+        if future.cancelled() or future.exception() is not None:
+            return FAILED
+        return READY
+
+    return READY if _audio_path(audio_id).exists() else None
+
+
+async def wait(audio_id: str, timeout: float) -> Optional[str]:
+    """Block up to `timeout` seconds for a pending job, then report its state."""
+    future = _jobs.get(audio_id)
+    if future is not None and not future.done() and timeout > 0:
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except Exception:
+            pass  # timeouts stay PENDING, job errors surface as FAILED
+    return status(audio_id)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,222 @@
+"""
+Shared test setup.
+
+Modules read their configuration from the environment at import time, so it
+is set here before anything under src/ is imported: a throw-away SQLite
+database, TTS cache and working directory (media/ and audio/ are paths
+relative to it), in-thread bcrypt at minimum cost, and no background
+workers. Requests go straight to the ASGI app through httpx; app startup
+is skipped (it would start the workers and fetch Google's certs), so the
+tables are created here instead.
+
+All tests share one event loop (session-scoped anyio_backend), because the
+engine's pooled connections belong to the loop that opened them.
+
+Besides the app's own dependencies this needs pytest, httpx and aiosqlite;
+run `python -m pytest` from backend/.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite+aiosqlite:///{WORKDIR}/test.db",
+    SECRET_KEY="test-secret",
+    STORY_TOKEN_SECRET="test-story-secret",
+    GOOGLE_API_KEY="test",
+    GOOGLE_CLIENT_ID="test-client-id.apps.googleusercontent.com",
+    DEBUG="true",
+    BCRYPT_WORKERS="0",
+    BCRYPT_ROUNDS="4",
+    PROFILE_IMAGE_WORKERS="0",
+    OPENING_CACHE_ENABLED="false",
+    OPENING_POOL_ENABLED="false",
+    OTP_PURGE_ENABLED="false",
+    EMAIL_OUTBOX_ENABLED="false",
+    MEDIA_GC_ENABLED="false",
+    STORY_SPECULATION_ENABLED="false",
+    TTS_CACHE_DIR=f"{WORKDIR}/audio_cache",
+    MEDIA_GC_STATE_FILE=f"{WORKDIR}/media_gc_state.json",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from src import mailer, story_engine  # noqa: E402
+from src.database import AsyncSessionLocal, Base, engine  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models import OTP  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    """Run from WORKDIR, so media/ and audio/ land there."""
+    os.chdir(WORKDIR)
+    for directory in ("media/profile_pics", "audio"):
+        os.makedirs(directory, exist_ok=True)
+    return WORKDIR
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def tables(anyio_backend):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(tables):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as c:
+        yield c
+
+
+class FakeSpeech:
+    """Stands in for gTTS: writes the text instead of calling Google."""
+
+    def __init__(self, text: str, **_: object) -> None:
+        self.text = text
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(b"ID3" + self.text.encode("utf-8"))
+
+
+class FakeChunks:
+    """A streamed reply: `text` in pieces of `size` characters."""
+
+    def __init__(self, text: str, size: int) -> None:
+        self.pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            await asyncio.sleep(0)
+            yield type("Chunk", (), {"text": piece})()
+
+
+class FakeModel:
+    """Stands in for Gemini: answers after `delay` seconds without blocking the loop.
+
+    Streamed replies arrive in `chunk_size`-character pieces.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.chunk_size = 7
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        call = self.calls
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        text = f"Segment {call} of the tale.\nChoice 1: Go left\nChoice 2: Go right"
+        if stream:
+            return FakeChunks(text, self.chunk_size)
+        return type("Response", (), {"text": text})()
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(story_engine, "_TEXT_MODEL", model)
+    monkeypatch.setattr(story_engine, "gTTS", FakeSpeech)
+    return model
+
+
+async def latest_otp(email: str) -> str:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(OTP.otp_code).where(OTP.email == email).order_by(OTP.id.desc()).limit(1)
+        )).scalar_one()
+
+
+async def make_user(client: httpx.AsyncClient, password: str = "Secret123!") -> dict:
+    """Sign up and verify a fresh user; returns its email, id and auth headers."""
+    name = f"u{uuid.uuid4().hex[:10]}"
+    email = f"{name}@example.com"
+    r = await client.post("/auth/signup", json={
+        "email": email, "username": name, "first_name": "Test", "last_name": "User",
+        "password": password,
+    })
+    assert r.status_code == 201, r.text
+    r = await client.post("/auth/verify-email", json={"email": email, "otp": await latest_otp(email)})
+    assert r.status_code == 200, r.text
+    r = await client.post("/auth/login", json={"identifier": name, "password": password})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    return {
+        "email": email, "username": name, "id": body["user_id"],
+        "headers": {"Authorization": f"Bearer {body['access_token']}"},
+    }
+
+
+class FakeRelay:
+    """Stands in for the SMTP server behind mailer._connect.
+
+    `refuse` maps a recipient (or "*") to the exception sending to it
+    raises; `down` holds ports whose connect fails; `slow` maps a port to
+    seconds its connect takes.
+    """
+
+    def __init__(self) -> None:
+        self.sent: list = []
+        self.connections: list = []
+        self.refuse: dict = {}
+        self.down: set = set()
+        self.slow: dict = {}
+
+    def connect(self, config, timeout=None):
+        time.sleep(self.slow.get(config["port"], 0))
+        if config["port"] in self.down:
+            raise ConnectionRefusedError(f"port {config['port']} is closed")
+        connection = FakeSmtpConnection(self, config)
+        self.connections.append(connection)
+        return connection
+
+
+class FakeSmtpConnection:
+    def __init__(self, relay: FakeRelay, config) -> None:
+        self.relay = relay
+        self.config = config
+        self.closed = False
+
+    def send_message(self, msg) -> None:
+        error = self.relay.refuse.get(msg["To"]) or self.relay.refuse.get("*")
+        if error is not None:
+            raise error
+        self.relay.sent.append(msg)
+
+    def quit(self) -> None:
+        self.closed = True
+
+    close = quit
+
+
+@pytest.fixture
+def relay(monkeypatch):
+    fake = FakeRelay()
+    monkeypatch.setattr(mailer, "_connect", fake.connect)
+    monkeypatch.setattr(mailer, "transport", mailer.SmtpTransport())
+    return fake
@@ -0,0 +1,115 @@
+"""
+The TTS cache synthesizes each text once, shares the blob by hard link,
+evicts least-recently-used blobs past its byte budget and keeps that order
+across restarts in its index.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import audio_cache
+
+
+def writer(data: bytes, calls: list, delay: float = 0.0):
+    def synthesize(tmp):
+        calls.append(tmp)
+        time.sleep(delay)
+        tmp.write_bytes(data)
+    return synthesize
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return audio_cache.AudioCache(tmp_path / "cache", max_bytes=250)
+
+
+def test_key_depends_on_text_and_voice():
+    key = audio_cache.cache_key("Hello", lang="en", tld="com")
+
+    assert key == audio_cache.cache_key("Hello", tld="com", lang="en")
+    assert key != audio_cache.cache_key("Hello", lang="en", tld="co.uk")
+    assert key != audio_cache.cache_key("Hello!", lang="en", tld="com")
+
+
+def test_concurrent_misses_synthesize_once(cache):
+    calls = []
+    synthesize = writer(b"x" * 100, calls, delay=0.1)
+    start = threading.Barrier(8)
+
+    def fetch(_):
+        start.wait()
+        return cache.get_or_create("k", synthesize)
+
+    with ThreadPoolExecutor(8) as pool:
+        blobs = set(pool.map(fetch, range(8)))
+
+    assert len(calls) == 1
+    assert blobs == {cache.path_for("k")}
+    assert (cache.stats()["misses"], cache.stats()["hits"]) == (1, 7)
+    assert cache._key_locks == {}
+    assert not [p for p in cache.root.iterdir() if p.suffix == ".tmp"]
+
+
+def test_failed_synthesis_leaves_nothing_behind(cache):
+    def broken(tmp):
+        tmp.write_bytes(b"half")
+        raise RuntimeError("gTTS is down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create("k", broken)
+
+    assert sorted(p.name for p in cache.root.iterdir()) == []
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_bytes(cache):
+    calls = []
+    for key in ("a", "b"):
+        cache.get_or_create(key, writer(b"x" * 100, calls))
+    cache.get_or_create("a", writer(b"", calls))   # a is now the most recent
+
+    cache.get_or_create("c", writer(b"x" * 100, calls))
+
+    assert not cache.path_for("b").exists()
+    assert cache.path_for("a").exists() and cache.path_for("c").exists()
+    assert cache.stats()["bytes"] == 200
+    assert len(calls) == 3
+
+
+def test_index_survives_a_restart(cache):
+    calls = []
+    for key in ("a", "b"):
+        cache.get_or_create(key, writer(b"x" * 100, calls))
+    cache.get_or_create("a", writer(b"", calls))
+    cache._save_index()   # hits alone are flushed lazily
+
+    reloaded = audio_cache.AudioCache(cache.root, max_bytes=250)
+    assert list(reloaded._entries) == ["b", "a"]
+    assert reloaded.stats()["bytes"] == 200
+
+    reloaded.get_or_create("c", writer(b"x" * 100, calls))
+    assert not reloaded.path_for("b").exists()   # LRU order came from the index
+
+
+def test_link_shares_the_blob(cache, tmp_path):
+    blob = cache.get_or_create("k", writer(b"speech", []))
+    target = tmp_path / "audio" / "k.mp3"
+
+    cache.link_to(blob, target)
+
+    assert target.read_bytes() == b"speech"
+    assert os.stat(target).st_ino == os.stat(blob).st_ino
+
+
+def test_discard_forgets_the_blob(cache):
+    cache.get_or_create("k", writer(b"x" * 10, []))
+
+    cache.discard("k")
+
+    assert not cache.path_for("k").exists()
+    assert cache.stats()["bytes"] == 0
+    assert audio_cache.AudioCache(cache.root).stats()["entries"] == 0
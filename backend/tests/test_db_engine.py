@@ -0,0 +1,99 @@
+"""
+The async engine is built from DB_* settings, and its instrumented pool
+reports checkouts, overflow and waits at /internal/db-pool.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from src import database
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("postgresql://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+    ("postgresql+asyncpg://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+    ("sqlite+aiosqlite:///local.db", "sqlite+aiosqlite:///local.db"),
+])
+def test_urls_are_forced_onto_async_drivers(url, expected):
+    assert database.async_database_url(url) == expected
+
+
+@pytest.mark.parametrize("url", ["", "mysql://u:p@db/app", "sqlite:///local.db"])
+def test_unsupported_urls_are_refused(url):
+    with pytest.raises(ValueError):
+        database.async_database_url(url)
+
+
+def test_postgres_engine_settings(monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 7)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 3)
+    monkeypatch.setattr(database, "DB_POOL_RECYCLE", 600)
+    monkeypatch.setattr(database, "DB_STATEMENT_CACHE_SIZE", 0)
+
+    created = {}
+    real = database.create_async_engine
+
+    def capture(url, **options):
+        created.update(options)
+        return real(url, **options)
+
+    monkeypatch.setattr(database, "create_async_engine", capture)
+    engine = database.create_engine_from_env("postgresql://u:p@db/app")
+
+    pool = engine.sync_engine.pool
+    assert isinstance(pool, database.InstrumentedPool)
+    assert (pool.size(), pool._max_overflow, pool._recycle) == (7, 3, 600)
+    assert pool._pre_ping is database.DB_POOL_PRE_PING
+    # pgbouncer-safe: no prepared-statement cache in asyncpg or in SQLAlchemy
+    assert engine.url.query["prepared_statement_cache_size"] == "0"
+    assert created["connect_args"] == {"statement_cache_size": 0}
+
+
+def test_statement_cache_can_be_turned_back_on(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_CACHE_SIZE", 100)
+
+    engine = database.create_engine_from_env("postgresql://u:p@db/app", pool_size=2)
+
+    assert "prepared_statement_cache_size" not in engine.url.query
+    assert engine.sync_engine.pool.size() == 2   # overrides win
+
+
+async def test_pool_counts_checkouts_and_timeouts(tmp_path):
+    engine = database.create_engine_from_env(
+        f"sqlite+aiosqlite:///{tmp_path}/pool.db", pool_size=1, max_overflow=0, pool_timeout=0.1
+    )
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("select 1"))
+            busy = engine.sync_engine.pool.stats()
+            with pytest.raises(PoolTimeout):
+                async with engine.connect():
+                    pass
+        stats = engine.sync_engine.pool.stats()
+    finally:
+        await engine.dispose()
+
+    assert (busy["checked_out"], busy["checkouts"]) == (1, 1)
+    assert (stats["checked_out"], stats["checkouts"], stats["errors"]) == (0, 1, 1)
+    assert stats["max_wait_ms"] < 100   # the failed wait is an error, not a checkout
+
+
+async def test_db_pool_endpoint(client):
+    await asyncio.gather(*(client.get("/auth/me") for _ in range(3)))   # some checkouts
+
+    r = await client.get("/internal/db-pool")
+
+    assert r.status_code == 200
+    primary = r.json()["primary"]
+    assert primary["checkouts"] > 0
+    assert {"size", "checked_out", "overflow", "avg_wait_ms", "max_wait_ms"} <= set(primary)
+
+
+async def test_internal_endpoints_need_debug(client, monkeypatch):
+    monkeypatch.setenv("DEBUG", "false")
+    assert (await client.get("/internal/db-pool")).status_code == 404
@@ -0,0 +1,132 @@
+"""
+Mail is queued in the request's transaction and delivered by the outbox
+worker over pooled SMTP connections (a fake relay here), with backoff on
+failure and a dead letter after too many attempts.
+"""
+
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from conftest import latest_otp
+from src import crud, email_outbox
+from src.database import AsyncSessionLocal
+from src.models import EmailOutbox
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def outbox(tables):
+    """An empty outbox; other tests' signups leave their mail in it."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(EmailOutbox))
+        await db.commit()
+
+
+async def rows() -> list:
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(select(EmailOutbox))).scalars())
+
+
+async def enqueue(template: str = "verification", context=None) -> str:
+    email = f"m{uuid.uuid4().hex[:10]}@example.com"
+    async with AsyncSessionLocal() as db:
+        await crud.enqueue_email(
+            db, email, template, context or {"otp": "123456", "otp_expiry_minutes": 10}
+        )
+    return email
+
+
+async def test_signup_mail_is_delivered_by_the_worker(client, outbox, relay):
+    email_outbox.worker._wake.clear()
+    name = f"m{uuid.uuid4().hex[:10]}"
+    email = f"{name}@example.com"
+    r = await client.post("/auth/signup", json={
+        "email": email, "username": name, "first_name": "Mail", "last_name": "Box",
+        "password": "Secret123!",
+    })
+    assert r.status_code == 201
+    assert relay.sent == []   # the request itself never talks to SMTP
+    assert email_outbox.worker._wake.is_set()
+
+    worker = email_outbox.OutboxWorker()
+    assert await worker.drain_once() == 1
+
+    [msg] = relay.sent
+    assert msg["To"] == email
+    assert msg.get_content_type() == "multipart/alternative"
+    assert (await latest_otp(email)) in msg.get_payload()[0].get_payload(decode=True).decode()
+    assert await rows() == []
+
+
+async def test_rolled_back_mail_is_never_queued(outbox):
+    email_outbox.worker._wake.clear()
+    async with AsyncSessionLocal() as db:
+        await crud.enqueue_email(db, "nobody@example.com", "verification", {}, commit=False)
+        await db.rollback()
+
+    assert await rows() == []
+    assert not email_outbox.worker._wake.is_set()
+
+
+async def test_batch_shares_pooled_connections(outbox, relay):
+    for _ in range(6):
+        await enqueue()
+    worker = email_outbox.OutboxWorker(concurrency=2)
+
+    assert await worker.drain_once() == 6
+
+    assert len(relay.sent) == 6
+    assert await rows() == []
+    assert email_outbox.mailer.transport.stats()["opened"] == 2   # one per chunk
+
+    for _ in range(2):
+        await enqueue()
+    await worker.drain_once()
+    stats = email_outbox.mailer.transport.stats()
+    assert (stats["opened"], stats["reused"]) == (2, 2)
+
+
+async def test_failed_send_is_retried_with_backoff(outbox, relay):
+    email = await enqueue()
+    relay.refuse[email] = smtplib.SMTPRecipientsRefused({email: (550, b"No such user")})
+    worker = email_outbox.OutboxWorker()
+
+    assert await worker.drain_once() == 1
+    [row] = await rows()
+    assert row.status == "pending"
+    assert row.attempts == 1
+    assert "No such user" in row.last_error
+    min_delay = email_outbox.EMAIL_OUTBOX_BACKOFF * 0.8
+    assert row.next_attempt_at > datetime.utcnow() + timedelta(seconds=min_delay - 5)
+
+    assert await worker.drain_once() == 0   # not due yet
+
+
+async def test_mail_is_dead_lettered_after_max_attempts(outbox, relay):
+    relay.refuse["*"] = smtplib.SMTPDataError(554, b"Message rejected")
+    await enqueue()
+    worker = email_outbox.OutboxWorker(max_attempts=1)
+
+    await worker.drain_once()
+
+    [row] = await rows()
+    assert row.status == "dead"
+    assert "Message rejected" in row.last_error
+    assert worker.stats()["dead"] == 1
+
+
+async def test_broken_template_is_dead_lettered_at_once(outbox, relay):
+    await enqueue(template="no-such-template")
+    worker = email_outbox.OutboxWorker()
+
+    await worker.drain_once()
+
+    [row] = await rows()
+    assert row.status == "dead"
+    assert row.attempts == 1
+    assert relay.sent == []
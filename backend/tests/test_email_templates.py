@@ -0,0 +1,71 @@
+"""
+Precompiled email templates: HTML plus a plaintext alternative, dynamic
+fields escaped, and the message mailer.render() builds from them.
+"""
+
+import timeit
+
+import pytest
+
+from src import email_templete, mailer
+
+
+@pytest.mark.parametrize("name", ["verification", "password_reset"])
+def test_render_has_plaintext_part(name):
+    rendered = email_templete.render(name, otp="482913", otp_expiry_minutes=10)
+
+    assert rendered.subject
+    assert b"482913" in rendered.html
+    assert b"{" not in rendered.text   # every field was filled in
+    assert b"Valid for 10 minutes." in rendered.text
+    assert b"<" not in rendered.text
+    assert rendered.text.count(b"482913") == 1
+
+
+def test_dynamic_fields_are_escaped_in_html_only():
+    rendered = email_templete.render("verification", otp="<b>&", otp_expiry_minutes=5)
+    assert b"&lt;b&gt;&amp;" in rendered.html
+    assert b"<b>&" not in rendered.html
+    assert b": <b>&\n" in rendered.text
+
+
+def test_missing_field_raises():
+    with pytest.raises(KeyError):
+        email_templete.render("verification", otp="123456")
+
+
+def test_static_fields_are_baked_in():
+    template = email_templete.TEMPLATES["password_reset"]
+    assert set(template.html.fields) == {"otp", "otp_expiry_minutes"}
+    assert set(template.text.fields) == {"otp", "otp_expiry_minutes"}
+    assert b"Password Reset" in b"".join(template.text.chunks)
+
+
+def test_minified_html_is_smaller():
+    source = "<p>\n  {otp}\n</p>\n<style>/* note */ a {{ }}</style>"
+    plain = email_templete.EmailTemplate("t", "s", source, "{otp}", {}, minify=False)
+    small = email_templete.EmailTemplate("t", "s", source, "{otp}", {}, minify=True)
+
+    assert small.render(otp="1").html == b"<p> 1 </p><style> a { }</style>"
+    assert len(small.render(otp="1").html) < len(plain.render(otp="1").html)
+
+
+def test_mailer_builds_multipart_alternative():
+    msg = mailer.render("user@example.com", "verification", {"otp": "482913", "otp_expiry_minutes": 10})
+
+    assert msg.get_content_type() == "multipart/alternative"
+    plain, html = msg.get_payload()
+    assert (plain.get_content_type(), html.get_content_type()) == ("text/plain", "text/html")
+    assert "482913" in plain.get_payload(decode=True).decode("utf-8")
+    assert "482913" in html.get_payload(decode=True).decode("utf-8")
+    assert msg["To"] == "user@example.com"
+
+
+def test_benchmark_render():
+    runs = 20000
+    seconds = timeit.timeit(
+        lambda: email_templete.render("verification", otp="482913", otp_expiry_minutes=10),
+        number=runs,
+    )
+    print(f"\nrender {seconds / runs * 1e6:.1f} µs/message")
+    assert seconds / runs < 200e-6
@@ -0,0 +1,179 @@
+"""
+Google ID tokens are verified locally against certs fetched from a key
+server (a local one here) and cached for their max-age; an unknown key id
+forces one early re-fetch.
+"""
+
+import datetime
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+
+from src import google_certs
+
+pytestmark = pytest.mark.anyio
+
+AUDIENCE = "test-client-id.apps.googleusercontent.com"
+
+
+class KeyPair:
+    def __init__(self, kid: str) -> None:
+        self.kid = kid
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        self.cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+        self.signer = crypt.RSASigner.from_string(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ),
+            key_id=kid,
+        )
+
+    def token(self, audience: str = AUDIENCE, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com", "aud": audience,
+            "sub": uuid.uuid4().hex, "email": f"g{uuid.uuid4().hex[:10]}@example.com",
+            "email_verified": True, "name": "Goo Gle", "iat": now, "exp": now + 600,
+            **claims,
+        }
+        return google_jwt.encode(self.signer, payload).decode()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return KeyPair("k1"), KeyPair("k2")
+
+
+@pytest.fixture
+def key_server():
+    state = {"certs": {}, "max_age": 3600, "hits": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["hits"] += 1
+            body = json.dumps(state["certs"]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", f"public, max-age={state['max_age']}")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/certs"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+async def test_verify_uses_cached_certs(key_server, keys):
+    k1, _ = keys
+    key_server["certs"] = {k1.kid: k1.cert_pem}
+    cache = google_certs.GoogleCertCache(key_server["url"])
+
+    for _ in range(5):
+        claims = await cache.verify(k1.token(), AUDIENCE)
+        assert claims["aud"] == AUDIENCE
+
+    assert key_server["hits"] == 1
+    assert cache.stats()["hits"] == 4
+    assert 3500 < cache.stats()["expires_in"] <= 3600   # the server's max-age
+
+
+async def test_expired_certs_are_refetched(key_server, keys):
+    k1, _ = keys
+    key_server["certs"], key_server["max_age"] = {k1.kid: k1.cert_pem}, 0
+    cache = google_certs.GoogleCertCache(key_server["url"])
+
+    await cache.verify(k1.token(), AUDIENCE)
+    await cache.verify(k1.token(), AUDIENCE)
+
+    assert key_server["hits"] == 2
+
+
+async def test_key_rotation_forces_one_refresh(key_server, keys, monkeypatch):
+    k1, k2 = keys
+    key_server["certs"] = {k1.kid: k1.cert_pem}
+    cache = google_certs.GoogleCertCache(key_server["url"])
+    await cache.verify(k1.token(), AUDIENCE)
+
+    key_server["certs"] = {k2.kid: k2.cert_pem}
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_MIN_REFRESH", 0)
+    assert (await cache.verify(k2.token(), AUDIENCE))["aud"] == AUDIENCE
+    assert key_server["hits"] == 2
+    assert cache.stats()["kid_misses"] == 1
+
+
+async def test_unknown_kids_cannot_hammer_the_key_server(key_server, keys):
+    k1, k2 = keys
+    key_server["certs"] = {k1.kid: k1.cert_pem}
+    cache = google_certs.GoogleCertCache(key_server["url"])
+    await cache.verify(k1.token(), AUDIENCE)
+
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            await cache.verify(k2.token(), AUDIENCE)
+
+    assert key_server["hits"] == 1   # within GOOGLE_CERTS_MIN_REFRESH of the fetch
+
+
+@pytest.mark.parametrize("token", [
+    lambda k1: k1.token(audience="someone-else"),
+    lambda k1: k1.token(exp=int(time.time()) - 3600),
+    lambda k1: k1.token()[:-4] + "AAAA",
+])
+async def test_invalid_tokens_raise_value_error(key_server, keys, token):
+    k1, _ = keys
+    key_server["certs"] = {k1.kid: k1.cert_pem}
+    cache = google_certs.GoogleCertCache(key_server["url"])
+
+    with pytest.raises(ValueError):
+        await cache.verify(token(k1), AUDIENCE)
+
+
+async def test_google_login_endpoint(client, key_server, keys, monkeypatch):
+    k1, _ = keys
+    key_server["certs"] = {k1.kid: k1.cert_pem}
+    monkeypatch.setattr(google_certs, "cache", google_certs.GoogleCertCache(key_server["url"]))
+
+    r = await client.post("/auth/google-login", json={"id_token": k1.token()})
+    assert r.status_code == 200, r.text
+    assert r.json()["access_token"]
+
+    r = await client.post("/auth/google-login", json={"id_token": k1.token(audience="other")})
+    assert r.status_code == 400
+    assert key_server["hits"] == 1
+
+
+async def test_google_login_without_key_server_is_a_503(client, monkeypatch):
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_TIMEOUT", 1)
+    monkeypatch.setattr(google_certs, "cache", google_certs.GoogleCertCache("http://127.0.0.1:9/certs"))
+    r = await client.post("/auth/google-login", json={"id_token": "a.b.c"})
+    assert r.status_code == 503
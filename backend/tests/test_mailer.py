@@ -0,0 +1,130 @@
+"""
+SMTP transport: configurations are probed in priority order, credentials
+never go out without TLS, and a relay refusal moves on to a fresh probe
+instead of failing every later message on a dead configuration.
+"""
+
+import smtplib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import mailer
+
+
+def message(to: str = "user@example.com"):
+    return mailer.render(to, "verification", {"otp": "123456", "otp_expiry_minutes": 10})
+
+
+def test_credentials_never_go_out_in_plaintext(monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_USERNAME", "user")
+    monkeypatch.setattr(mailer, "SMTP_PASSWORD", "secret")
+    plain = {"server": "127.0.0.1", "port": 9, "use_tls": False, "use_ssl": False}
+
+    with pytest.raises(mailer.SmtpDeliveryError, match="without TLS"):
+        mailer._connect(plain)   # refused before any socket is opened
+
+
+def test_probe_prefers_starttls_over_a_faster_fallback(relay):
+    relay.slow[587] = 0.2
+
+    assert mailer.transport.send_batch([message()]) == [None]
+
+    assert mailer.transport.stats()["preferred"].startswith(f"{mailer.SMTP_SERVER}:587 ")
+    losers = [c for c in relay.connections if c.config["port"] != 587]
+    assert losers and all(c.closed for c in losers)
+
+
+def test_probe_falls_back_when_starttls_is_down(relay):
+    relay.down.add(587)
+
+    assert mailer.transport.send_batch([message()]) == [None]
+    assert ":465 " in mailer.transport.stats()["preferred"]
+
+
+def test_all_configs_down_fails_the_batch(relay):
+    relay.down.update({587, 465, 25, mailer.SMTP_PORT})
+
+    results = mailer.transport.send_batch([message(), message()])
+
+    assert all(isinstance(r, mailer.SmtpDeliveryError) for r in results)
+
+
+def test_connections_are_pooled(relay):
+    mailer.transport.send_batch([message()])
+    mailer.transport.send_batch([message(), message()])
+
+    stats = mailer.transport.stats()
+    assert (stats["probes"], stats["opened"], stats["reused"], stats["sent"]) == (1, 1, 1, 3)
+
+
+def test_refused_recipient_does_not_stop_the_batch(relay):
+    refused = smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"No such user")})
+    relay.refuse["bad@example.com"] = refused
+
+    results = mailer.transport.send_batch(
+        [message(), message("bad@example.com"), message()]
+    )
+
+    assert results == [None, refused, None]
+    assert mailer.transport.stats()["relay_refused"] == 0
+
+
+def test_dropped_connection_is_replaced(relay):
+    mailer.transport.send_batch([message()])
+    pooled = mailer.transport._idle[0].server
+
+    def drop(msg):
+        raise smtplib.SMTPServerDisconnected("gone")
+
+    pooled.send_message = drop
+    assert mailer.transport.send_batch([message()]) == [None]
+    assert mailer.transport.stats()["dropped"] == 1
+    assert pooled.closed
+
+
+def test_relay_refusal_reprobes_once(relay):
+    mailer.transport.send_batch([message()])
+    first = mailer.transport._idle[0].server
+
+    def refuse(msg):
+        raise smtplib.SMTPSenderRefused(530, b"Authentication required", msg["From"])
+
+    first.send_message = refuse
+    results = mailer.transport.send_batch([message("a@example.com"), message("b@example.com")])
+
+    assert results == [None, None]
+    assert first.closed
+    assert [m["To"] for m in relay.sent[-2:]] == ["a@example.com", "b@example.com"]
+    stats = mailer.transport.stats()
+    assert (stats["relay_refused"], stats["probes"]) == (1, 2)
+
+
+def test_persistent_relay_refusal_fails_the_rest_of_the_batch(relay):
+    refusal = smtplib.SMTPRecipientsRefused({"a@example.com": (554, b"Relay access denied")})
+    relay.refuse["*"] = refusal
+
+    results = mailer.transport.send_batch([message("a@example.com")] * 3)
+
+    assert results == [refusal] * 3
+    stats = mailer.transport.stats()
+    assert (stats["relay_refused"], stats["probes"]) == (2, 2)
+    assert stats["preferred"] is None
+
+
+def test_counters_add_up_across_threads(relay):
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)   # switch threads as often as possible
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(
+                lambda _: mailer.transport.send_batch([message(), message()]), range(200)
+            ))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert all(r == [None, None] for r in results)
+    stats = mailer.transport.stats()
+    assert stats["sent"] == len(relay.sent) == 400
+    assert stats["opened"] + stats["reused"] == 200
@@ -0,0 +1,101 @@
+"""
+/audio and /media: content-addressed files are immutable with a name-based
+ETag, everything else is revalidated; conditional and Range requests are
+answered with 304 and 206.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+
+import pytest
+
+from src import media_files
+
+pytestmark = pytest.mark.anyio
+
+BODY = b"ID3" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def hashed(workdir):
+    name = f"{hashlib.sha256(uuid.uuid4().bytes).hexdigest()}.mp3"
+    with open(os.path.join("audio", name), "wb") as f:
+        f.write(BODY)
+    return f"/audio/{name}", f'"{name}"'
+
+
+@pytest.fixture
+def legacy(workdir):
+    name = f"{uuid.uuid4()}.jpg"
+    with open(os.path.join("media", "profile_pics", name), "wb") as f:
+        f.write(BODY)
+    return f"/media/profile_pics/{name}"
+
+
+async def test_content_addressed_file_is_immutable(client, hashed):
+    url, etag = hashed
+
+    r = await client.get(url)
+
+    assert r.status_code == 200
+    assert r.content == BODY
+    assert r.headers["cache-control"] == media_files.IMMUTABLE_CACHE_CONTROL
+    assert r.headers["etag"] == etag
+    assert r.headers["accept-ranges"] == "bytes"
+
+
+async def test_etag_survives_a_touch(client, hashed):
+    url, etag = hashed
+    os.utime(os.path.join("audio", url.rsplit("/", 1)[1]), (time.time() + 60,) * 2)
+
+    assert (await client.get(url)).headers["etag"] == etag
+
+
+@pytest.mark.parametrize("if_none_match, status", [
+    ("{etag}", 304),
+    ("W/{etag}", 304),
+    ('"other", {etag}', 304),
+    ("*", 304),
+    ('"other"', 200),
+])
+async def test_if_none_match(client, hashed, if_none_match, status):
+    url, etag = hashed
+
+    r = await client.get(url, headers={"If-None-Match": if_none_match.format(etag=etag)})
+
+    assert r.status_code == status
+    if status == 304:
+        assert r.content == b""
+        assert r.headers["etag"] == etag
+        assert r.headers["cache-control"] == media_files.IMMUTABLE_CACHE_CONTROL
+
+
+async def test_range_request_is_partial(client, hashed):
+    url, _ = hashed
+
+    r = await client.get(url, headers={"Range": "bytes=3-10"})
+
+    assert r.status_code == 206
+    assert r.content == BODY[3:11]
+    assert r.headers["content-range"] == f"bytes 3-10/{len(BODY)}"
+
+
+async def test_other_files_are_revalidated(client, legacy):
+    r = await client.get(legacy)
+
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == f"public, max-age={media_files.MEDIA_MAX_AGE}"
+    assert "immutable" not in r.headers["cache-control"]
+    etag, last_modified = r.headers["etag"], r.headers["last-modified"]
+
+    assert (await client.get(legacy, headers={"If-None-Match": etag})).status_code == 304
+    assert (await client.get(legacy, headers={"If-Modified-Since": last_modified})).status_code == 304
+    # If-None-Match, when present, decides alone.
+    r = await client.get(legacy, headers={"If-None-Match": '"stale"', "If-Modified-Since": last_modified})
+    assert r.status_code == 200
+
+
+async def test_missing_file_is_a_404(client):
+    assert (await client.get(f"/audio/{'0' * 64}.mp3")).status_code == 404
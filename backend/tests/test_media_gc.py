@@ -0,0 +1,187 @@
+"""
+Content-addressed media: reference counts follow the rows that point at a
+file, and media_gc removes (or, dry, reports) what nothing points at.
+
+Files made here are backdated past the collector's grace period; everything
+else is touched before each test, so it is never a candidate.
+"""
+
+import io
+import os
+import time
+import uuid
+
+import pytest
+from PIL import Image
+from sqlalchemy import select
+
+from conftest import make_user
+from src import audio_cache, crud, media_gc, profile_images, story_engine, tts_jobs
+from src.database import AsyncSessionLocal
+from src.models import MediaObject
+
+pytestmark = pytest.mark.anyio
+
+GRACE = 3600
+
+
+def picture(colour: str) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (320, 320), colour).save(out, "JPEG")
+    return out.getvalue()
+
+
+async def upload(client, user, data: bytes) -> str:
+    r = await client.post(
+        "/auth/profile/upload-profile-picture", headers=user["headers"],
+        files={"file": ("me.jpg", data, "image/jpeg")},
+    )
+    assert r.status_code == 200, r.text
+    return r.json()["profile_picture"]
+
+
+async def refcounts(paths) -> dict:
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(MediaObject.path, MediaObject.refcount).where(MediaObject.path.in_(paths))
+        )
+        return dict(rows.all())
+
+
+def backdate(paths) -> None:
+    old = time.time() - 2 * GRACE
+    for path in paths:
+        os.utime(path, (old, old))
+
+
+@pytest.fixture(autouse=True)
+def fresh_media(workdir):
+    """Leftovers of earlier tests are inside the grace period again."""
+    now = time.time()
+    for root in media_gc.collector.roots:
+        for name in os.listdir(root):
+            try:
+                os.utime(os.path.join(root, name), (now, now))
+            except FileNotFoundError:
+                pass   # a temp file renamed into place meanwhile
+
+
+@pytest.fixture
+def collector(tmp_path):
+    return media_gc.MediaGarbageCollector(
+        batch_size=4, grace=GRACE, state_file=str(tmp_path / "gc.json")
+    )
+
+
+async def test_profile_picture_refcounts(client):
+    alice, bob = await make_user(client), await make_user(client)
+    shared = picture(f"#{uuid.uuid4().hex[:6]}")
+    files = profile_images.files_for(await upload(client, alice, shared))
+    assert len(files) == 2 * len(profile_images.PROFILE_IMAGE_SIZES)
+
+    await upload(client, bob, shared)
+    assert await refcounts(files) == {path: 2 for path in files}
+
+    await upload(client, alice, picture(f"#{uuid.uuid4().hex[:6]}"))
+    assert await refcounts(files) == {path: 1 for path in files}
+
+    r = await client.patch("/auth/api/users/me", headers=bob["headers"], json={"profile_picture": None})
+    assert r.status_code == 200
+    assert await refcounts(files) == {path: 0 for path in files}
+
+
+async def test_dry_run_reports_without_deleting(client, collector):
+    user = await make_user(client)
+    files = profile_images.files_for(await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}")))
+    await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}"))
+    backdate(files)
+
+    report = await collector.dry_run()
+
+    assert report["dry_run"] is True
+    assert report["orphaned"] == len(files)
+    assert report["reclaimable_bytes"] == sum(os.path.getsize(p) for p in files)
+    assert all(os.path.exists(p) for p in files)
+
+
+async def test_collect_deletes_only_orphans(client, collector):
+    user = await make_user(client)
+    old = profile_images.files_for(await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}")))
+    live = profile_images.files_for(await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}")))
+    backdate(old + live)
+    size = sum(os.path.getsize(p) for p in old)
+
+    report = await collector.collect()
+
+    assert report["orphaned"] == len(old)
+    assert report["freed_bytes"] == size
+    assert not any(os.path.exists(p) for p in old)
+    assert all(os.path.exists(p) for p in live)
+    assert await refcounts(old) == {}   # rows of deleted files are dropped
+    assert collector.stats()["cursor"] == [0, ""]   # pass complete
+
+
+async def test_recent_orphans_survive_the_grace_period(client, collector):
+    user = await make_user(client)
+    old = profile_images.files_for(await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}")))
+    await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}"))
+
+    await collector.collect()
+
+    assert all(os.path.exists(p) for p in old)
+
+
+async def test_orphaned_audio_frees_its_cache_blob(client, fake_model, collector):
+    user = await make_user(client)
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["owls", "maps", "tea"]}
+    )
+    assert r.status_code == 200
+    assert await tts_jobs.wait(r.json()["audio_id"], 5) == tts_jobs.READY
+    live = r.json()["audio_url"].lstrip("/")
+
+    text = f"Nobody will ever hear this {uuid.uuid4().hex}."
+    orphan = tts_jobs.story_audio_filename(text)
+    story_engine.generate_tts_audio(text, orphan)
+    blob = audio_cache.cache.path_for(story_engine.audio_key(text))
+    assert os.stat(orphan).st_ino == os.stat(blob).st_ino
+    backdate([orphan, live])
+    size = os.path.getsize(orphan)
+
+    report = await collector.collect()
+
+    assert report["orphaned"] == 1
+    assert report["freed_bytes"] == size   # two links, one copy of the data
+    assert not os.path.exists(orphan)
+    assert not blob.exists()
+    assert os.path.exists(live)
+
+
+async def test_collect_resumes_after_interruption(client, collector, monkeypatch):
+    collector.roots = [profile_images.UPLOAD_DIR]   # audio/ may still be filling up
+    user = await make_user(client)
+    old = profile_images.files_for(await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}")))
+    await upload(client, user, picture(f"#{uuid.uuid4().hex[:6]}"))
+    backdate(old)
+
+    real = crud.referenced_media
+    calls = 0
+
+    async def failing_after_first_batch(db, paths):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise RuntimeError("worker killed")
+        return await real(db, paths)
+
+    monkeypatch.setattr(crud, "referenced_media", failing_after_first_batch)
+    with pytest.raises(RuntimeError):
+        await collector.collect()
+    root, after = collector.stats()["cursor"]
+    assert after
+
+    monkeypatch.setattr(crud, "referenced_media", real)
+    remaining = [n for n in os.listdir(profile_images.UPLOAD_DIR) if n > after]
+    report = await collector.collect()
+    assert report["scanned"] == len(remaining)   # picked up after the last batch done
+    assert not any(os.path.exists(p) for p in old)
@@ -0,0 +1,146 @@
+"""
+Data migrations, run against a SQLite file.
+
+The revision chain starts from tables made by create_all, so each test
+builds the schema a revision expects and runs that revision's upgrade()
+on it directly.
+"""
+
+import importlib.util
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from src.models import OTP
+
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+
+def revision(rev: str):
+    [path] = VERSIONS.glob(f"{rev}_*.py")
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path}/migrate.db")
+    yield engine
+    engine.dispose()
+
+
+@contextmanager
+def migrating(engine):
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            yield conn
+
+
+def index_sql(engine, name: str) -> str:
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.text("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = :name"),
+            {"name": name},
+        ).scalar_one()
+
+
+def test_otp_purge_migration(db, tmp_path):
+    metadata = sa.MetaData()
+    otps = sa.Table(
+        "otps", metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("email", sa.String, nullable=False),
+        sa.Column("otp_code", sa.String(6), nullable=False),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("expires_at", sa.DateTime, nullable=False),
+        sa.Column("is_used", sa.Boolean, default=False),
+    )
+    metadata.create_all(db)
+    now = datetime.utcnow()
+    rows = {
+        "used": (True, now + timedelta(minutes=5)),
+        "long expired": (False, now - timedelta(days=2)),
+        "just expired": (False, now - timedelta(hours=1)),
+        "live": (False, now + timedelta(minutes=5)),
+    }
+    with db.begin() as conn:
+        conn.execute(otps.insert(), [
+            {"email": name, "otp_code": "123456", "is_used": used, "expires_at": expires}
+            for name, (used, expires) in rows.items()
+        ])
+
+    with migrating(db):
+        revision("d9f1b6a2c4e7").upgrade()
+
+    with db.connect() as conn:
+        left = set(conn.execute(sa.select(otps.c.email)).scalars())
+    assert left == {"just expired", "live"}
+
+    # Same partial index as the models declare for this dialect.
+    fresh = sa.create_engine(f"sqlite:///{tmp_path}/fresh.db")
+    OTP.__table__.create(fresh)
+    assert index_sql(db, "ix_otps_email_code_unused") == index_sql(fresh, "ix_otps_email_code_unused")
+    fresh.dispose()
+
+
+def test_story_segments_backfill(db):
+    metadata = sa.MetaData()
+    sessions = sa.Table(
+        "story_sessions", metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("current_story", sa.String),
+        sa.Column("current_choices", sa.JSON),
+        sa.Column("audio_path", sa.String),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("context_history", sa.JSON),
+    )
+    metadata.create_all(db)
+    histories = {
+        1: ["t1", "t2", "t3"],
+        2: [],
+        3: None,
+        4: ["t4"],
+        5: ["t2", "t5"],         # t2 was given to session 1, two batches back
+        6: ["t6", "t6", "t7"],   # a repeat within one session
+        7: ["t8"],
+    }
+    with db.begin() as conn:
+        conn.execute(sessions.insert(), [
+            {"id": sid, "current_story": f"story {sid}", "current_choices": {"1": "a"},
+             "audio_path": f"audio/{sid}.mp3", "context_history": history}
+            for sid, history in histories.items()
+        ])
+
+    migration = revision("b7d2f05c8e61")
+    migration.BACKFILL_BATCH = 2
+    with migrating(db):
+        migration.upgrade()
+
+    with db.connect() as conn:
+        rows = conn.execute(sa.text(
+            "SELECT session_id, seq, context_token, story_text FROM story_segments"
+            " ORDER BY session_id, seq"
+        )).all()
+        current = dict(conn.execute(sa.text("SELECT id, current_seq FROM story_sessions")).all())
+
+    tokens = [r.context_token for r in rows]
+    assert len(tokens) == len(set(tokens)) == 8
+    by_session = {}
+    for r in rows:
+        by_session.setdefault(r.session_id, []).append(r)
+    assert {sid: [r.context_token for r in segs] for sid, segs in by_session.items()} == {
+        1: ["t1", "t2", "t3"], 4: ["t4"], 5: ["t5"], 6: ["t6", "t7"], 7: ["t8"],
+    }
+    for sid, segs in by_session.items():
+        assert [r.seq for r in segs] == list(range(1, len(segs) + 1))
+        assert current[sid] == len(segs)
+        # Only the latest turn's text is known.
+        assert [r.story_text for r in segs] == [""] * (len(segs) - 1) + [f"story {sid}"]
+    assert current[2] == current[3] == 0
@@ -0,0 +1,80 @@
+"""
+Opening segments are cached per canonical interest set: the first requests
+fill a pool of variants, later ones are served from it until they expire,
+and the least recently used sets go first.
+"""
+
+import asyncio
+
+import pytest
+
+from src import opening_cache
+from src.opening_cache import canonical_interests
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("interests", [
+    ["Space", "cats", "Pirates"],
+    ["pirates", " space ", "CATS", "cats"],
+    ["cats", "", "  ", "pirates", "space"],
+])
+def test_interest_sets_are_canonical(interests):
+    assert canonical_interests(interests) == ("cats", "pirates", "space")
+
+
+async def test_pool_fills_then_serves(fake_model):
+    cache = opening_cache.OpeningCache(pool_size=2)
+
+    first = await cache.get_or_generate(["Cats", "space", "pirates"])
+    second = await cache.get_or_generate(["space", "pirates", "cats"])
+    assert first != second   # two variants before any is reused
+
+    for _ in range(5):
+        assert await cache.get_or_generate(["pirates", "cats", "SPACE"]) in (first, second)
+    assert fake_model.calls == 2
+    assert cache.stats()["hits"] == 5
+
+
+async def test_cold_burst_shares_in_flight_generations(fake_model):
+    fake_model.delay = 0.05
+    cache = opening_cache.OpeningCache(pool_size=2)
+
+    results = await asyncio.gather(
+        *(cache.get_or_generate(["a", "b", "c"]) for _ in range(10))
+    )
+
+    assert fake_model.calls == 2
+    assert len(set(text for text, _ in results)) == 2
+
+
+async def test_entries_expire(fake_model):
+    cache = opening_cache.OpeningCache(pool_size=1, ttl=-1)
+
+    await cache.get_or_generate(["a", "b", "c"])
+    await cache.get_or_generate(["a", "b", "c"])
+
+    assert fake_model.calls == 2
+    assert cache.lookup(["a", "b", "c"]) is None
+
+
+def test_least_recently_used_sets_are_evicted():
+    cache = opening_cache.OpeningCache(pool_size=1, max_keys=2)
+    cache.add(["a"], "A", {1: "x"})
+    cache.add(["b"], "B", {1: "x"})
+    assert cache.lookup(["a"]) == ("A", {1: "x"})   # a is now the most recent
+
+    cache.add(["c"], "C", {1: "x"})
+
+    assert cache.lookup(["b"]) is None
+    assert cache.lookup(["a"]) and cache.lookup(["c"])
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cached_choices_are_copies():
+    cache = opening_cache.OpeningCache(pool_size=1)
+    cache.add(["a"], "A", {1: "x"})
+
+    cache.lookup(["a"])[1][1] = "changed"
+
+    assert cache.lookup(["a"]) == ("A", {1: "x"})
@@ -0,0 +1,77 @@
+"""
+Pooled openings hold an MP3 nothing in the DB points at yet: each refill
+keeps those inside media_gc's grace period, and one deleted anyway is
+regenerated (held) or re-synthesized (popped) rather than served as a 404.
+"""
+
+import os
+import time
+import uuid
+
+import pytest
+
+from src import opening_pool, tts_jobs
+from src.opening_cache import canonical_interests
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def interests():
+    return [f"topic-{uuid.uuid4().hex[:6]}" for _ in range(3)]
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_model, interests):
+    pool = opening_pool.OpeningPool(top_k=1, size=2, refill_rate=2)
+
+    async def rank():
+        return [canonical_interests(interests)]
+
+    monkeypatch.setattr(pool, "_rank", rank)
+    return pool
+
+
+async def test_refill_stocks_ready_segments(pool, interests):
+    assert await pool.refill_once() == 2
+    assert await pool.refill_once() == 0   # already full
+
+    segment = pool.pop(interests)
+    assert os.path.exists(segment.audio_filename)
+    assert pool.stats()["hits"] == 1
+    assert pool.pop(["not", "in", "pool"]) is None
+
+
+async def test_refill_keeps_held_audio_fresh(pool):
+    await pool.refill_once()
+    held = [s.audio_filename for ready in pool._ready.values() for s in ready]
+    old = time.time() - 3600
+    for path in held:
+        os.utime(path, (old, old))
+
+    await pool.refill_once()
+
+    assert all(os.path.getmtime(p) > old + 60 for p in held)
+
+
+async def test_deleted_held_audio_is_regenerated(pool, interests):
+    await pool.refill_once()
+    gone = pool._ready[canonical_interests(interests)][0].audio_filename
+    os.remove(gone)
+
+    assert await pool.refill_once() == 1
+
+    assert pool.stats()["expired"] == 1
+    assert all(os.path.exists(s.audio_filename) for s in pool._ready[canonical_interests(interests)])
+
+
+async def test_popped_segment_without_audio_is_resynthesized(pool, interests):
+    await pool.refill_once()
+    os.remove(pool._ready[canonical_interests(interests)][0].audio_filename)
+
+    segment = pool.pop(interests)
+
+    assert pool.stats()["resynthesized"] == 1
+    audio_id = tts_jobs.audio_id_for(segment.audio_filename)
+    assert await tts_jobs.wait(audio_id, 5) == tts_jobs.READY
+    assert os.path.exists(segment.audio_filename)
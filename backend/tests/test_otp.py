@@ -0,0 +1,77 @@
+"""
+OTP codes are consumed by one conditional UPDATE, so each works exactly once
+however many requests race for it.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import latest_otp, make_user
+from src import crud
+from src.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+RACERS = 10
+
+
+async def new_otp(code: str = "123456", minutes: int = 5) -> str:
+    email = f"otp{uuid.uuid4().hex[:10]}@example.com"
+    async with AsyncSessionLocal() as db:
+        await crud.create_otp(db, email, code, datetime.utcnow() + timedelta(minutes=minutes))
+    return email
+
+
+async def consume(email: str, code: str):
+    async with AsyncSessionLocal() as db:   # one session per racer
+        return await crud.consume_otp(db, email, code)
+
+
+async def test_concurrent_consume_succeeds_once(tables):
+    email = await new_otp()
+
+    results = await asyncio.gather(*(consume(email, "123456") for _ in range(RACERS)))
+
+    assert sum(r is not None for r in results) == 1
+    assert await consume(email, "123456") is None
+
+
+async def test_consume_rejects_wrong_and_expired_codes(tables):
+    email = await new_otp()
+    assert await consume(email, "654321") is None
+
+    expired = await new_otp(minutes=-1)
+    assert await consume(expired, "123456") is None
+
+
+async def test_concurrent_verify_email_accepts_one(client):
+    name = f"otp{uuid.uuid4().hex[:10]}"
+    email = f"{name}@example.com"
+    r = await client.post("/auth/signup", json={
+        "email": email, "username": name, "first_name": "Race", "last_name": "Condition",
+        "password": "Secret123!",
+    })
+    assert r.status_code == 201
+    body = {"email": email, "otp": await latest_otp(email)}
+
+    responses = await asyncio.gather(
+        *(client.post("/auth/verify-email", json=body) for _ in range(RACERS))
+    )
+
+    assert sorted(r.status_code for r in responses) == [200] + [400] * (RACERS - 1)
+
+
+async def test_reset_otp_reports_why_it_was_refused(client):
+    user = await make_user(client)
+    r = await client.post("/auth/forgot-password", json={"email": user["email"]})
+    assert r.status_code == 200
+    body = {"email": user["email"], "otp": await latest_otp(user["email"])}
+
+    r = await client.post("/auth/verify-reset-otp", json=body)
+    assert r.status_code == 200
+    r = await client.post("/auth/verify-reset-otp", json=body)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "OTP has already been used"
@@ -0,0 +1,82 @@
+"""
+Dead OTP rows are purged in short batches, and each email keeps at most
+OTP_MAX_ACTIVE_PER_EMAIL live codes in between purges.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from src import crud, otp_purge
+from src.database import AsyncSessionLocal
+from src.models import OTP
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def otps(tables):
+    """An empty otps table; other tests' signups leave their codes in it."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(OTP))
+        await db.commit()
+
+
+async def codes(email: str) -> list:
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(
+            select(OTP.otp_code).where(OTP.email == email).order_by(OTP.id)
+        )).scalars())
+
+
+def email() -> str:
+    return f"o{uuid.uuid4().hex[:10]}@example.com"
+
+
+async def test_live_codes_are_capped_per_email(otps):
+    address = email()
+    expires = datetime.utcnow() + timedelta(minutes=10)
+    async with AsyncSessionLocal() as db:
+        await crud.create_otp(db, address, "000000", expires)
+        assert await crud.consume_otp(db, address, "000000")   # used: not a live code
+        for n in range(1, 6):
+            await crud.create_otp(db, address, f"00000{n}", expires)
+        await crud.create_otp(db, "someone-else@example.com", "999999", expires)
+
+    cap = crud.OTP_MAX_ACTIVE_PER_EMAIL
+    assert await codes(address) == ["000000"] + [f"00000{n}" for n in range(6 - cap, 6)]
+    assert await codes("someone-else@example.com") == ["999999"]
+
+
+async def test_purge_deletes_dead_codes_in_batches(otps, monkeypatch):
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        db.add_all(
+            [OTP(email=email(), otp_code="1", expires_at=now + timedelta(minutes=5), is_used=True)
+             for _ in range(4)]
+            + [OTP(email=email(), otp_code="2", expires_at=now - timedelta(seconds=1))
+               for _ in range(3)]
+            + [OTP(email=email(), otp_code="3", expires_at=now + timedelta(minutes=5))
+               for _ in range(2)]
+        )
+        await db.commit()
+
+    batches = []
+    real = crud.delete_stale_otps
+
+    async def counting(db, now, batch_size):
+        batches.append(await real(db, now, batch_size))
+        return batches[-1]
+
+    monkeypatch.setattr(crud, "delete_stale_otps", counting)
+    purger = otp_purge.OtpPurger(batch_size=3)
+
+    assert await purger.purge_once() == 7
+    assert batches == [3, 3, 1]   # stops at the first short batch
+    async with AsyncSessionLocal() as db:
+        assert set((await db.execute(select(OTP.otp_code))).scalars()) == {"3"}
+
+    assert await purger.purge_once() == 0
+    assert purger.stats()["runs"] == 2 and purger.stats()["deleted"] == 7
@@ -0,0 +1,153 @@
+"""
+bcrypt runs behind PasswordHasher's admission control: when every slot is
+taken new calls are refused, and the handlers answer 503 + Retry-After
+instead of queueing (or, for signup, reporting a failed registration).
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from passlib.context import CryptContext
+
+from conftest import make_user
+from src import auth, crud, security
+from src.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    monkeypatch.setattr(security.hasher, "max_pending", 0)
+
+
+def assert_busy(response) -> None:
+    assert response.status_code == 503, response.text
+    assert response.headers["Retry-After"] == str(security.BCRYPT_RETRY_AFTER)
+
+
+async def test_hasher_refuses_beyond_max_pending(monkeypatch):
+    hasher = security.PasswordHasher(workers=0, max_pending=1)
+    release = threading.Event()
+    monkeypatch.setattr(security, "get_password_hash", lambda password: release.wait(5) and "hash")
+
+    first = asyncio.create_task(hasher.hash("one"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(security.PasswordHasherBusy):
+        await hasher.hash("two")
+    release.set()
+    assert await first == "hash"
+
+    assert await hasher.hash("three") == "hash"   # the slot is free again
+    assert hasher.stats()["rejected"] == 1
+
+
+async def test_signup_refused_with_503(client, saturated, monkeypatch):
+    name = f"h{uuid.uuid4().hex[:10]}"
+    account = {
+        "email": f"{name}@example.com", "username": name,
+        "first_name": "Busy", "last_name": "Hasher", "password": "Secret123!",
+    }
+    assert_busy(await client.post("/auth/signup", json=account))
+
+    monkeypatch.undo()   # capacity is back; nothing was half-created
+    assert (await client.post("/auth/signup", json=account)).status_code == 201
+
+
+async def test_login_refused_with_503(client, monkeypatch):
+    user = await make_user(client)
+    monkeypatch.setattr(security.hasher, "max_pending", 0)
+    assert_busy(await client.post(
+        "/auth/login", json={"identifier": user["username"], "password": "Secret123!"}
+    ))
+
+
+async def test_change_password_refused_with_503(client, monkeypatch):
+    user = await make_user(client)
+    monkeypatch.setattr(security.hasher, "max_pending", 0)
+    assert_busy(await client.post(
+        "/auth/change-password", headers=user["headers"],
+        json={"current_password": "Secret123!", "new_password": "Secret456!"},
+    ))
+
+
+async def test_login_rehashes_outdated_cost(client):
+    user = await make_user(client)
+    old_hash = CryptContext(
+        schemes=["bcrypt"], bcrypt__rounds=security.BCRYPT_ROUNDS + 1
+    ).hash("Secret123!")
+    async with AsyncSessionLocal() as db:
+        await crud.set_password_hash(db, user["id"], old_hash)
+
+    r = await client.post("/auth/login", json={"identifier": user["username"], "password": "Secret123!"})
+    assert r.status_code == 200
+
+    async with AsyncSessionLocal() as db:
+        stored = (await crud.get_user_by_id(db, user["id"])).hashed_password
+    assert stored != old_hash
+    assert stored.startswith(f"$2b${security.BCRYPT_ROUNDS:02d}$")
+    assert security.verify_password("Secret123!", stored)
+
+
+class InlineHasher(security.PasswordHasher):
+    """bcrypt on the event loop, the way login ran before the pool."""
+
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+
+async def login_throughput(client, user, hasher, monkeypatch, logins: int = 12):
+    """(logins/s, longest event-loop stall) for `logins` concurrent logins."""
+    monkeypatch.setattr(security, "hasher", hasher)
+    monkeypatch.setattr(auth, "hasher", hasher)
+    body = {"identifier": user["username"], "password": "Secret123!"}
+    assert (await client.post("/auth/login", json=body)).status_code == 200   # warm up
+
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stall = max(stall, time.perf_counter() - started - 0.005)
+
+    ticking = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    responses = await asyncio.gather(
+        *(client.post("/auth/login", json=body) for _ in range(logins))
+    )
+    elapsed = time.perf_counter() - started
+    done = True
+    await ticking
+    assert all(r.status_code == 200 for r in responses)
+    return logins / elapsed, stall
+
+
+async def test_benchmark_login_throughput(client, monkeypatch):
+    rounds = 10   # ~50 ms per hash: enough to dominate a login
+    monkeypatch.setenv("BCRYPT_ROUNDS", str(rounds))   # read by the spawned workers
+    monkeypatch.setattr(security, "_pwd_ctx", CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds))
+    user = await make_user(client)
+    async with AsyncSessionLocal() as db:
+        await crud.set_password_hash(db, user["id"], security.get_password_hash("Secret123!"))
+
+    inline_rate, inline_stall = await login_throughput(client, user, InlineHasher(), monkeypatch)
+    pool = security.PasswordHasher(workers=2, max_pending=16)
+    try:
+        pool_rate, pool_stall = await login_throughput(client, user, pool, monkeypatch)
+    finally:
+        # Wait for the workers to exit, so they don't steal CPU from later timings.
+        await asyncio.to_thread(pool._pool().shutdown)
+
+    print(
+        f"\nlogin inline {inline_rate:.1f}/s (loop stalled {inline_stall * 1e3:.0f} ms), "
+        f"pool {pool_rate:.1f}/s (loop stalled {pool_stall * 1e3:.0f} ms)"
+    )
+    # The pool's point is a free event loop; throughput must not suffer for it.
+    assert pool_stall < inline_stall / 4
+    assert pool_rate > inline_rate * 0.5
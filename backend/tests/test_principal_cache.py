@@ -0,0 +1,139 @@
+"""
+Authenticated principals: a warm /auth/me costs no query, every crud user
+write drops the cached entry once it commits, and credentials are always
+checked against the database, never against a cached snapshot.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+from sqlalchemy import update
+
+from conftest import make_user
+from src import crud, principal_cache
+from src.database import AsyncSessionLocal
+from src.models import User
+from src.security import hash_password
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = principal_cache.PrincipalCache()
+    monkeypatch.setattr(principal_cache, "cache", cache)
+    return cache
+
+
+async def me(client, user) -> dict:
+    r = await client.get("/auth/me", headers=user["headers"])
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+async def test_warm_read_costs_no_query(client, cache):
+    user = await make_user(client)
+
+    first = await client.get("/auth/me", headers=user["headers"])
+    second = await client.get("/auth/me", headers=user["headers"])
+
+    assert first.headers["X-DB-Queries"] == "1"
+    assert second.headers["X-DB-Queries"] == "0"
+    assert second.json() == first.json()
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+async def test_expired_and_evicted_entries_miss(client, monkeypatch):
+    alice, bob = await make_user(client), await make_user(client)
+    cache = principal_cache.PrincipalCache(max_entries=1)
+    monkeypatch.setattr(principal_cache, "cache", cache)
+
+    await me(client, alice)
+    await me(client, bob)   # pushes alice out
+    await me(client, alice)
+    assert (cache.stats()["misses"], cache.stats()["evictions"]) == (3, 2)
+
+    cache.ttl = -1
+    await me(client, alice)
+    assert cache.stats()["misses"] == 4
+
+
+async def write_directly(helper, user):
+    async with AsyncSessionLocal() as db:
+        await helper(db, user)
+
+
+def picture() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (200, 200), "#3366aa").save(out, "JPEG")
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("write", [
+    lambda db, u: crud.update_user(db, u["id"], {"first_name": "Changed"}),
+    lambda db, u: crud.update_user_password(db, u["email"], "Secret456!"),
+    lambda db, u: crud.update_user_verified(db, u["email"]),
+    lambda db, u: crud.update_user_interests(db, u["id"], ["x", "y", "z"]),
+])
+async def test_crud_writes_invalidate_on_commit(client, cache, write):
+    user = await make_user(client)
+    await me(client, user)
+    assert cache.stats()["entries"] == 1
+
+    await write_directly(write, user)
+
+    assert cache.stats()["entries"] == 0
+    r = await client.get("/auth/me", headers=user["headers"])
+    assert r.headers["X-DB-Queries"] == "1"
+
+
+async def test_rolled_back_write_keeps_serving_the_committed_row(client, cache):
+    user = await make_user(client)
+    async with AsyncSessionLocal() as db:
+        await crud.update_user(db, user["id"], {"first_name": "Draft"})   # commits
+    await me(client, user)
+
+    async with AsyncSessionLocal() as db:
+        await crud._update_user_where(db, User.id == user["id"], {"first_name": "Nope"}, commit=False)
+        await db.rollback()
+
+    assert (await me(client, user))["first_name"] == "Draft"
+
+
+async def test_profile_picture_upload_invalidates(client, cache):
+    user = await make_user(client)
+    assert (await me(client, user))["profile_picture"] is None
+
+    r = await client.post(
+        "/auth/profile/upload-profile-picture", headers=user["headers"],
+        files={"file": ("me.jpg", picture(), "image/jpeg")},
+    )
+    assert r.status_code == 200, r.text
+
+    assert (await me(client, user))["profile_picture"] == r.json()["profile_picture"]
+
+
+async def test_change_password_checks_the_database_not_the_cache(client, cache):
+    user = await make_user(client)
+    await me(client, user)
+    # Another worker resets the password: this process's entry stays warm.
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(User).where(User.id == user["id"])
+            .values(hashed_password=await hash_password("Secret789!"))
+        )
+        await db.commit()
+    assert cache.stats()["entries"] == 1
+
+    r = await client.post("/auth/change-password", headers=user["headers"], json={
+        "current_password": "Secret123!", "new_password": "Secret456!",
+    })
+    assert r.status_code == 400
+
+    r = await client.post("/auth/change-password", headers=user["headers"], json={
+        "current_password": "Secret789!", "new_password": "Secret456!",
+    })
+    assert r.status_code == 200, r.text
@@ -0,0 +1,108 @@
+"""
+Profile picture uploads: size/format variants named by content, EXIF
+orientation applied, and anything Pillow can't decode answered with a 400.
+"""
+
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import make_user
+from src import profile_images
+
+pytestmark = pytest.mark.anyio
+
+UPLOAD = "/auth/profile/upload-profile-picture"
+
+
+def jpeg(width: int = 600, height: int = 300, orientation: int = 1) -> bytes:
+    """Left half red, right half blue."""
+    image = Image.new("RGB", (width, height), "blue")
+    image.paste("red", (0, 0, width // 2, height))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    image.save(out, "JPEG", exif=exif)
+    return out.getvalue()
+
+
+def png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGBA", (80, 80), (0, 128, 0, 128)).save(out, "PNG")
+    return out.getvalue()
+
+
+async def upload(client, user, data: bytes, filename: str = "me.jpg"):
+    return await client.post(
+        UPLOAD, headers=user["headers"], files={"file": (filename, data, "image/jpeg")}
+    )
+
+
+async def test_upload_writes_every_variant(client):
+    user = await make_user(client)
+    r = await upload(client, user, jpeg())
+    assert r.status_code == 200, r.text
+    body = r.json()
+
+    assert body["profile_picture"] == body["variants"]["jpeg"][str(profile_images.PROFILE_IMAGE_SIZES[0])]
+    for fmt, by_size in body["variants"].items():
+        for size, url in by_size.items():
+            with Image.open(url.lstrip("/")) as image:
+                assert image.size == (int(size), int(size))
+                assert image.format == {"jpeg": "JPEG", "webp": "WEBP"}[fmt]
+    assert body["srcset"]["webp"].endswith(f"{profile_images.PROFILE_IMAGE_SIZES[0]}w")
+
+
+async def test_exif_orientation_is_applied(client):
+    user = await make_user(client)
+    # Orientation 6: displayed rotated 90° clockwise, so red ends up on top.
+    r = await upload(client, user, jpeg(orientation=6))
+    assert r.status_code == 200, r.text
+
+    with Image.open(r.json()["profile_picture"].lstrip("/")) as image:
+        size = image.size[0]
+        top = image.getpixel((size // 2, size // 8))
+        bottom = image.getpixel((size // 2, size - size // 8))
+    assert top[0] > 200 and top[2] < 60
+    assert bottom[2] > 200 and bottom[0] < 60
+
+
+async def test_reupload_reuses_files(client, monkeypatch):
+    user = await make_user(client)
+    data = png()
+    first = await upload(client, user, data, "me.png")
+    assert first.status_code == 200
+
+    def render_variants(*args):
+        raise AssertionError("identical upload was rendered again")
+
+    monkeypatch.setattr(profile_images, "render_variants", render_variants)
+    second = await upload(client, user, data, "me.png")
+    assert second.status_code == 200
+    assert second.json()["variants"] == first.json()["variants"]
+
+
+@pytest.mark.parametrize("data", [
+    jpeg()[:200],                       # truncated JPEG
+    png()[:60],                         # truncated PNG
+    b"\xff\xd8\xff\xe0" + b"\0" * 64,   # JPEG signature, garbage after
+    b"not an image at all",
+    b"",
+], ids=["truncated-jpeg", "truncated-png", "bad-jpeg-header", "junk", "empty"])
+async def test_corrupt_upload_is_a_400(client, data):
+    user = await make_user(client)
+    before = set(os.listdir(profile_images.UPLOAD_DIR))
+
+    r = await upload(client, user, data)
+
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"].startswith("Failed to process image")
+    assert set(os.listdir(profile_images.UPLOAD_DIR)) == before
+
+
+async def test_wrong_extension_is_a_400(client):
+    user = await make_user(client)
+    r = await upload(client, user, jpeg(), "me.exe")
+    assert r.status_code == 400
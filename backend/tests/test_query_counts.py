@@ -0,0 +1,281 @@
+"""
+Round trips per endpoint and per crud write.
+
+Endpoints are read from the DEBUG-only X-DB-Queries header (built on
+database.count_queries); crud functions are counted directly. A number going
+up here means a handler grew an extra round trip: fix the handler, or bump
+the number in the same commit with a reason.
+"""
+
+import io
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+from conftest import latest_otp, make_user
+from src import crud, google_certs, story_engine
+from src.database import AsyncSessionLocal, count_queries, engine
+
+pytestmark = pytest.mark.anyio
+
+
+def queries(response) -> int:
+    assert response.status_code < 500, response.text
+    return int(response.headers["X-DB-Queries"])
+
+
+def new_account() -> dict:
+    name = f"q{uuid.uuid4().hex[:10]}"
+    return {
+        "email": f"{name}@example.com", "username": name,
+        "first_name": "Query", "last_name": "Count", "password": "Secret123!",
+    }
+
+
+async def test_health_check_touches_no_database(client):
+    assert queries(await client.get("/")) == 0
+
+
+async def test_signup_verify_login(client):
+    account = new_account()
+    r = await client.post("/auth/signup", json=account)
+    assert r.status_code == 201
+    # email taken?, username taken?, OTP insert + cap, outbox insert, user insert
+    assert queries(r) == 6
+
+    otp = await latest_otp(account["email"])
+    r = await client.post("/auth/verify-email", json={"email": account["email"], "otp": otp})
+    assert r.status_code == 200
+    assert queries(r) == 2   # consume OTP, flag user – one transaction
+
+    r = await client.post("/auth/verify-email", json={"email": account["email"], "otp": otp})
+    assert r.status_code == 400
+    assert queries(r) == 1
+
+    r = await client.post(
+        "/auth/login", json={"identifier": account["username"], "password": account["password"]}
+    )
+    assert r.status_code == 200
+    assert queries(r) == 1
+
+
+async def test_otp_endpoints(client):
+    user = await make_user(client)
+
+    r = await client.post("/auth/resend-otp", json={"email": user["email"]})
+    assert r.status_code == 200
+    assert queries(r) == 4
+
+    r = await client.post("/auth/forgot-password", json={"email": user["email"]})
+    assert r.status_code == 200
+    assert queries(r) == 4
+
+    otp = await latest_otp(user["email"])
+    r = await client.post("/auth/verify-reset-otp", json={"email": user["email"], "otp": otp})
+    assert r.status_code == 200
+    assert queries(r) == 2
+
+    r = await client.post(
+        "/auth/reset-password", json={"email": user["email"], "new_password": "Secret789!"}
+    )
+    assert r.status_code == 200
+    assert queries(r) == 2
+
+
+async def test_profile_endpoints(client):
+    user = await make_user(client)
+    headers = user["headers"]
+
+    r = await client.get("/auth/me", headers=headers)
+    assert r.status_code == 200
+    assert queries(r) == 1
+
+    r = await client.patch("/auth/api/users/me", headers=headers, json={"first_name": "Renamed"})
+    assert r.status_code == 200
+    assert r.json()["user"]["first_name"] == "Renamed"
+    assert queries(r) == 1   # UPDATE … RETURNING
+
+    r = await client.post(
+        "/auth/change-password", headers=headers,
+        json={"current_password": "Secret123!", "new_password": "Secret456!"},
+    )
+    assert r.status_code == 200
+    assert queries(r) == 3   # principal, password hash from the primary, UPDATE
+
+
+async def test_interest_endpoints(client):
+    user = await make_user(client)
+
+    r = await client.put(f"/api/users/{user['id']}/interests", json={"interests": ["a", "b", "c"]})
+    assert r.status_code == 200
+    assert queries(r) == 1
+
+    r = await client.get(f"/api/users/{user['id']}/interests")
+    assert r.status_code == 200
+    assert queries(r) == 1
+
+
+async def test_story_endpoints(client, fake_model):
+    user = await make_user(client)
+
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["space", "cats", "pirates"]}
+    )
+    assert r.status_code == 200
+    assert queries(r) == 4
+    story = r.json()
+
+    continuation = {
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    }
+    r = await client.post("/story/continue", json=continuation)
+    assert r.status_code == 200
+    assert queries(r) == 3
+
+    r = await client.post("/story/continue", json=continuation)
+    assert r.status_code == 409
+    assert queries(r) == 1
+
+    r = await client.get(f"/story/audio/{story['audio_id']}")
+    assert r.status_code == 200
+    assert queries(r) == 0
+
+
+async def test_crud_writes_are_single_statements(tables):
+    account = new_account()
+    async with AsyncSessionLocal() as db:
+        with count_queries() as n:
+            user = await crud.create_user(db, dict(account))
+        assert n[0] == 1
+
+        with count_queries() as n:
+            updated = await crud.update_user(db, user.id, {"last_name": "Changed"})
+        assert n[0] == 1
+        assert updated.last_name == "Changed"
+
+        expires = datetime.utcnow() + timedelta(minutes=5)
+        with count_queries() as n:
+            await crud.create_otp(db, account["email"], "123456", expires)
+        assert n[0] == 2   # the insert, then the per-email cap
+
+        with count_queries() as n:
+            assert await crud.consume_otp(db, account["email"], "123456")
+        assert n[0] == 1
+
+        with count_queries() as n:
+            await crud.update_user_verified(db, account["email"])
+        assert n[0] == 1
+
+
+@contextmanager
+def engine_queries():
+    """Every statement the primary runs in the block. Streamed bodies persist
+    their segment after the response headers – and X-DB-Queries – are sent."""
+    counter = [0]
+
+    def tally(*_):
+        counter[0] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", tally)
+    try:
+        yield counter
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", tally)
+
+
+async def test_streaming_story_endpoints(client, fake_model):
+    user = await make_user(client)
+
+    with engine_queries() as total:
+        r = await client.post(
+            "/story/start/stream", json={"user_id": user["id"], "interests": ["owls", "maps", "tea"]}
+        )
+    assert r.status_code == 200
+    assert queries(r) == 1   # the session insert, before the stream starts
+    assert total[0] == 4     # as /story/start: the segment is saved in the stream
+    done = json.loads(r.text.split("event: done\ndata: ")[1])
+
+    continuation = {
+        "session_id": done["session_id"], "context_token": done["context_token"], "choice": 2,
+    }
+    with engine_queries() as total:
+        r = await client.post("/story/continue/stream", json=continuation)
+    assert r.status_code == 200
+    assert queries(r) == 0   # the session comes from session_cache
+    assert total[0] == 3     # as /story/continue
+
+    with engine_queries() as total:
+        r = await client.post("/story/continue/stream", json=continuation)
+    assert r.status_code == 409   # refused before the stream starts
+    assert queries(r) == total[0] == 1
+
+
+async def test_audio_long_poll_touches_no_database(client, fake_model, monkeypatch):
+    user = await make_user(client)
+    synthesize = story_engine.generate_tts_audio
+
+    def slow_synthesis(text, filename):
+        time.sleep(0.1)
+        synthesize(text, filename)
+
+    monkeypatch.setattr(story_engine, "generate_tts_audio", slow_synthesis)
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["fog", "bells", "moss"]}
+    )
+    assert r.json()["audio_status"] == "pending"
+
+    r = await client.get(f"/story/audio/{r.json()['audio_id']}", params={"wait": 5})
+    assert r.json()["status"] == "ready"
+    assert queries(r) == 0
+
+
+def picture() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (200, 200), f"#{uuid.uuid4().hex[:6]}").save(out, "JPEG")
+    return out.getvalue()
+
+
+async def test_profile_picture_upload(client):
+    user = await make_user(client)
+
+    r = await client.post(
+        "/auth/profile/upload-profile-picture", headers=user["headers"],
+        files={"file": ("me.jpg", picture(), "image/jpeg")},
+    )
+    assert r.status_code == 200, r.text
+    # principal, lock the old picture, UPDATE … RETURNING, media refcount upsert
+    assert queries(r) == 4
+
+    r = await client.post(
+        "/auth/profile/upload-profile-picture", headers=user["headers"],
+        files={"file": ("me.jpg", picture(), "image/jpeg")},
+    )
+    assert r.status_code == 200
+    assert queries(r) == 5   # + releasing the previous picture's files
+
+
+class StubCerts:
+    """Accepts any token as a fresh Google account; signature checks live in
+    test_google_certs."""
+
+    async def verify(self, token, audience):
+        return {
+            "iss": "https://accounts.google.com", "aud": audience, "sub": token,
+            "email": f"{token}@example.com", "email_verified": True, "name": "Goo Gle",
+        }
+
+
+async def test_google_login_new_user(client, monkeypatch):
+    monkeypatch.setattr(google_certs, "cache", StubCerts())
+
+    r = await client.post("/auth/google-login", json={"id_token": f"g{uuid.uuid4().hex[:10]}"})
+
+    assert r.status_code == 200, r.text
+    # email taken?, username taken?, user insert
+    assert queries(r) == 3
@@ -0,0 +1,122 @@
+"""
+Read-replica routing, with a second SQLite file standing in for the replica.
+
+Nothing replicates between the two files, so where a row is found tells
+which database served the read: lookups go to the replica, except right
+after a write by the same session or client, or while the replica is down.
+"""
+
+import asyncio
+import uuid
+
+import pytest
+
+from src import crud, database
+from src.database import AsyncSessionLocal, Base
+
+pytestmark = pytest.mark.anyio
+
+
+def account() -> dict:
+    name = f"r{uuid.uuid4().hex[:10]}"
+    return {
+        "email": f"{name}@example.com", "username": name,
+        "first_name": "Primary", "last_name": "Row", "password": "Secret123!",
+    }
+
+
+async def use_replica(monkeypatch, url: str, **router_options):
+    read_engine = database.instrument(database.create_engine_from_env(url))
+    monkeypatch.setattr(database, "read_engine", read_engine)
+    monkeypatch.setattr(database, "ReadSessionLocal", database.sessionmaker(
+        read_engine, class_=database.AsyncSession, expire_on_commit=False
+    ))
+    monkeypatch.setattr(database, "router", database.ReplicaRouter(**router_options))
+    return read_engine
+
+
+@pytest.fixture
+async def replica(tables, tmp_path, monkeypatch):
+    read_engine = await use_replica(monkeypatch, f"sqlite+aiosqlite:///{tmp_path}/replica.db")
+    async with read_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield database.ReadSessionLocal
+    await read_engine.dispose()
+
+
+async def seed(data: dict, replica_session, replica_name: str = "Replica"):
+    """Create the user on the primary and a diverging copy on the replica."""
+    async with AsyncSessionLocal() as db:
+        user = await crud.create_user(db, dict(data))
+    async with replica_session() as db:
+        await crud.create_user(db, {**data, "first_name": replica_name})
+    return user
+
+
+async def test_lookups_are_served_by_the_replica(replica):
+    data = account()
+    await seed(data, replica)
+
+    async with AsyncSessionLocal() as db:
+        assert (await crud.get_user_by_email(db, data["email"])).first_name == "Replica"
+        assert (await crud.get_user_by_username(db, data["username"])).first_name == "Replica"
+
+    stats = database.router.stats()
+    assert (stats["enabled"], stats["replica"]) == (True, 2)
+    assert "replica" in database.pool_stats()
+
+
+async def test_session_reads_its_own_writes(replica):
+    data = account()
+    user = await seed(data, replica)
+
+    async with AsyncSessionLocal() as db:
+        await crud.update_user_interests(db, user.id, ["a", "b", "c"])
+        assert await crud.get_user_interests(db, user.id) == ["a", "b", "c"]
+
+    assert database.router.stats()["primary_sticky"] == 1
+
+
+async def test_client_sticks_to_the_primary_within_the_window(replica):
+    database.router.sticky_seconds = 0.2
+    data = account()
+    user = await seed(data, replica)
+    token = database.client_key.set("client-a")
+    try:
+        async with AsyncSessionLocal() as db:
+            await crud.update_user_interests(db, user.id, ["a", "b", "c"])
+
+        async with AsyncSessionLocal() as db:   # next request, same client
+            assert await crud.get_user_interests(db, user.id) == ["a", "b", "c"]
+
+        database.client_key.set("client-b")
+        async with AsyncSessionLocal() as db:
+            assert await crud.get_user_interests(db, user.id) is None   # replica lags
+
+        database.client_key.set("client-a")
+        await asyncio.sleep(0.25)
+        async with AsyncSessionLocal() as db:
+            assert await crud.get_user_interests(db, user.id) is None
+    finally:
+        database.client_key.reset(token)
+
+    stats = database.router.stats()
+    assert (stats["primary_sticky"], stats["replica"]) == (1, 2)
+
+
+async def test_unreachable_replica_falls_back_to_the_primary(tables, tmp_path, monkeypatch):
+    read_engine = await use_replica(
+        monkeypatch, f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db", retry_seconds=60
+    )
+    data = account()
+    async with AsyncSessionLocal() as db:
+        await crud.create_user(db, dict(data))
+
+    for _ in range(2):
+        async with AsyncSessionLocal() as db:
+            assert (await crud.get_user_by_email(db, data["email"])).first_name == "Primary"
+
+    stats = database.router.stats()
+    assert stats["healthy"] is False
+    assert (stats["replica_errors"], stats["primary_unhealthy"]) == (1, 1)
+    await read_engine.dispose()
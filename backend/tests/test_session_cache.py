@@ -0,0 +1,80 @@
+"""
+Active story sessions are served from a write-through cache; the version
+column guards every write, so a session moved on elsewhere is a 409 and
+never silently overwritten from a stale entry.
+"""
+
+import pytest
+from sqlalchemy import update
+
+from conftest import make_user
+from src import crud, session_cache
+from src.database import AsyncSessionLocal
+from src.models import StorySession
+from src.session_cache import SessionState
+
+pytestmark = pytest.mark.anyio
+
+
+def state(session_id: int = 1, version: int = 1, story: str = "") -> SessionState:
+    return SessionState(
+        id=session_id, user_id=None, interests=["a", "b", "c"], current_story=story,
+        current_choices={}, context_summary="", current_seq=version, version=version,
+    )
+
+
+def test_put_never_replaces_newer_state():
+    cache = session_cache.SessionCache()
+    cache.put(state(version=3, story="new"))
+
+    cache.put(state(version=2, story="old"))
+
+    assert cache.get(1).current_story == "new"
+    cache.put(state(version=4, story="newer"))
+    assert cache.get(1).current_story == "newer"
+
+
+def test_lru_and_ttl():
+    cache = session_cache.SessionCache(max_entries=2)
+    for session_id in (1, 2):
+        cache.put(state(session_id))
+    cache.get(1)
+    cache.put(state(3))
+
+    assert cache.get(2) is None
+    assert cache.get(1) and cache.get(3)
+    assert cache.stats()["evictions"] == 1
+
+    cache.ttl = -1
+    assert cache.get(1) is None
+
+
+async def test_version_conflict_is_a_409(client, fake_model, monkeypatch):
+    cache = session_cache.SessionCache()
+    monkeypatch.setattr(crud, "session_cache", cache)
+    user = await make_user(client)
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["owls", "maps", "tea"]}
+    )
+    story = r.json()
+    assert cache.get(story["session_id"]).version == 1
+
+    # Another worker writes the session; this process's entry is now stale.
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(StorySession).where(StorySession.id == story["session_id"])
+            .values(version=StorySession.version + 1)
+        )
+        await db.commit()
+
+    continuation = {
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    }
+    r = await client.post("/story/continue", json=continuation)
+    assert r.status_code == 409
+    assert cache.stats()["stale"] == 1
+    assert cache.get(story["session_id"]) is None
+
+    r = await client.post("/story/continue", json=continuation)   # re-read, same turn
+    assert r.status_code == 200, r.text
+    assert cache.get(story["session_id"]).version == 3
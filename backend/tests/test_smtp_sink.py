@@ -0,0 +1,152 @@
+"""
+The SMTP transport against a real relay: an aiosmtpd sink on 127.0.0.1
+that demands STARTTLS before AUTH and AUTH before mail, so smtplib, the
+connect/login order and batches over one connection run for real.
+"""
+
+import datetime
+import email
+import socket
+import ssl
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult, LoginPassword
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from src import mailer
+
+USERNAME, PASSWORD = "no-reply@example.com", "sink-password"
+
+
+def tls_context(tmp_path) -> ssl.SSLContext:
+    """A server context with a throwaway self-signed certificate for localhost."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .sign(key, hashes.SHA256())
+    )
+    (tmp_path / "cert.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    (tmp_path / "key.pem").write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(tmp_path / "cert.pem", tmp_path / "key.pem")
+    return context
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Sink:
+    """Records what each connection did, in order, and keeps delivered mail."""
+
+    def __init__(self) -> None:
+        self.events = []
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        self.events.append(("EHLO", session.peer, session.ssl is not None))
+        return responses
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        ok = isinstance(auth_data, LoginPassword) and (auth_data.login, auth_data.password) == (
+            USERNAME.encode(), PASSWORD.encode()
+        )
+        self.events.append(("AUTH", session.peer, session.ssl is not None))
+        return AuthResult(success=ok, handled=False)   # let aiosmtpd send the 535
+
+    async def handle_DATA(self, server, session, envelope):
+        self.events.append(("DATA", session.peer, session.ssl is not None))
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return "250 OK"
+
+    def connections(self) -> set:
+        return {peer for _, peer, _ in self.events}
+
+
+@pytest.fixture
+def smtp_sink(tmp_path, monkeypatch):
+    """A STARTTLS relay with AUTH on a free port, with mailer pointed at it.
+
+    The standard ports on 127.0.0.1 are closed, so a probe settles on
+    SMTP_PORT.
+    """
+    sink = Sink()
+    port = free_port()
+    controller = Controller(
+        sink, hostname="127.0.0.1", port=port,
+        tls_context=tls_context(tmp_path), require_starttls=True,
+        authenticator=sink.authenticate, auth_require_tls=True,
+    )
+    controller.start()
+    monkeypatch.setattr(mailer, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", port)
+    monkeypatch.setattr(mailer, "SMTP_USE_TLS", True)
+    monkeypatch.setattr(mailer, "SMTP_USE_SSL", False)
+    monkeypatch.setattr(mailer, "SMTP_USERNAME", USERNAME)
+    monkeypatch.setattr(mailer, "SMTP_PASSWORD", PASSWORD)
+    monkeypatch.setattr(mailer, "transport", mailer.SmtpTransport())
+    sink.port = port
+    yield sink
+    mailer.transport.close()
+    controller.stop()
+
+
+def message(to: str):
+    return mailer.render(to, "verification", {"otp": "123456", "otp_expiry_minutes": 10})
+
+
+def test_starttls_comes_before_login(smtp_sink):
+    config = {"server": "127.0.0.1", "port": smtp_sink.port, "use_tls": True, "use_ssl": False}
+
+    mailer._connect(config, timeout=5).quit()
+
+    assert [(verb, tls) for verb, _, tls in smtp_sink.events] == [
+        ("EHLO", False), ("EHLO", True), ("AUTH", True),
+    ]
+
+
+def test_batch_is_sent_over_one_logged_in_connection(smtp_sink):
+    recipients = [f"user{n}@example.com" for n in range(3)]
+
+    results = mailer.transport.send_batch([message(to) for to in recipients])
+
+    assert results == [None, None, None]
+    assert [m["To"] for m in smtp_sink.messages] == recipients
+    assert smtp_sink.messages[0]["Subject"]
+    assert len(smtp_sink.connections()) == 1
+    assert [verb for verb, _, _ in smtp_sink.events] == ["EHLO", "EHLO", "AUTH", "DATA", "DATA", "DATA"]
+    assert all(tls for verb, _, tls in smtp_sink.events if verb != "EHLO")
+    stats = mailer.transport.stats()
+    assert stats["preferred"].startswith(f"127.0.0.1:{smtp_sink.port} ")
+    assert (stats["sent"], stats["opened"], stats["idle"]) == (3, 1, 1)
+
+    # The next batch reuses the pooled connection: no new EHLO or login.
+    assert mailer.transport.send_batch([message("later@example.com")]) == [None]
+    assert len(smtp_sink.connections()) == 1
+    assert mailer.transport.stats()["reused"] == 1
+
+
+def test_wrong_password_fails_the_batch(smtp_sink, monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_PASSWORD", "wrong")
+
+    results = mailer.transport.send_batch([message("a@example.com"), message("b@example.com")])
+
+    assert all(isinstance(r, mailer.SmtpDeliveryError) for r in results)
+    assert smtp_sink.messages == []
+    assert mailer.transport.stats()["preferred"] is None
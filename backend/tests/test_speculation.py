@@ -0,0 +1,102 @@
+"""
+Speculative branches: the budget belongs to the client address (never to
+anything in the body), a taken branch skips the model, and the branch not
+taken gives back its queued TTS job unless another segment still wants it.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from conftest import make_user
+from src import speculation, story_engine, tts_jobs
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def manager(monkeypatch, fake_model):
+    manager = speculation.SpeculationManager(user_budget=2, with_tts=False)
+    monkeypatch.setattr(speculation, "STORY_SPECULATION_ENABLED", True)
+    monkeypatch.setattr(speculation, "manager", manager)
+    return manager
+
+
+async def start(client, user_id: int):
+    r = await client.post("/story/start", json={
+        "user_id": user_id, "interests": ["space", "cats", "pirates"], "speculate": True,
+    })
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+async def test_budget_is_per_client_not_per_body_user_id(client, manager):
+    alice, bob = await make_user(client), await make_user(client)
+
+    await start(client, alice["id"])
+    await start(client, bob["id"])   # same address, different user_id in the body
+
+    stats = manager.stats()
+    assert (stats["launched"], stats["skipped_budget"]) == (2, 2)
+
+
+async def test_taken_branch_skips_the_model(client, manager, fake_model):
+    user = await make_user(client)
+    story = await start(client, user["id"])
+    await asyncio.gather(*manager._tasks.values())
+    calls = fake_model.calls
+
+    r = await client.post("/story/continue", json={
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 2,
+    })
+
+    assert r.status_code == 200
+    assert fake_model.calls == calls
+    stats = manager.stats()
+    assert (stats["hits"], stats["wasted"]) == (1, 1)
+    assert manager._tasks == {}
+
+
+@pytest.fixture
+def blocked_tts(monkeypatch):
+    """One TTS worker whose jobs wait for the returned event."""
+    release = threading.Event()
+    monkeypatch.setattr(
+        tts_jobs, "_executor", tts_jobs.ThreadPoolExecutor(max_workers=1)
+    )
+    monkeypatch.setattr(story_engine, "generate_tts_audio", lambda text, filename: release.wait(5))
+    yield release
+    release.set()
+
+
+async def test_tts_cancel_waits_for_every_submitter(blocked_tts):
+    running = tts_jobs.submit("first", "audio/running.mp3")
+    await asyncio.sleep(0.05)
+    queued = tts_jobs.submit("second", "audio/queued.mp3")
+    tts_jobs.submit("second", "audio/queued.mp3")   # another segment, same content
+
+    assert tts_jobs.cancel(queued) is False    # still wanted once
+    assert tts_jobs.status(queued) == tts_jobs.PENDING
+    assert tts_jobs.cancel(queued) is True
+    assert tts_jobs.cancel(running) is False   # a worker already has it
+
+    blocked_tts.set()
+    assert await tts_jobs.wait(running, 5) == tts_jobs.READY
+
+
+async def test_dropped_branch_cancels_its_queued_tts(client, monkeypatch, fake_model, blocked_tts):
+    manager = speculation.SpeculationManager(with_tts=True)
+    monkeypatch.setattr(speculation, "STORY_SPECULATION_ENABLED", True)
+    monkeypatch.setattr(speculation, "manager", manager)
+    user = await make_user(client)
+    tts_jobs.submit("occupies the worker", "audio/occupied.mp3")   # later jobs stay queued
+    story = await start(client, user["id"])
+    await asyncio.gather(*manager._tasks.values())
+
+    r = await client.post("/story/continue", json={
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    })
+
+    assert r.status_code == 200
+    assert manager.stats()["tts_cancelled"] == 1
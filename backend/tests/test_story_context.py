@@ -0,0 +1,86 @@
+"""
+The rolling story summary and the prompt context stay within their token
+budgets however long a session runs, keeping the newest turns in detail.
+"""
+
+import pytest
+
+from src import story_context
+from src.story_context import (
+    STORY_CONTEXT_TOKEN_BUDGET, STORY_SUMMARY_TOKEN_BUDGET, build_context, clamp,
+    estimate_tokens, update_summary,
+)
+
+
+@pytest.mark.parametrize("max_tokens", [0, 1, 2, 5, 50])
+@pytest.mark.parametrize("keep", ["start", "end"])
+def test_clamp_bounds(max_tokens, keep):
+    text = "abcdefghij" * 10
+
+    clamped = clamp(text, max_tokens, keep)
+
+    assert len(clamped) <= max(max_tokens * 4, 0)
+    if clamped and len(clamped) < len(text):
+        marker_at = -1 if keep == "start" else 0
+        assert clamped[marker_at] == "…"
+        assert text.startswith(clamped[:-1]) if keep == "start" else text.endswith(clamped[1:])
+
+
+def test_clamp_leaves_short_text_alone():
+    assert clamp("short", 10) == "short"
+
+
+def test_turn_is_folded_into_one_line():
+    summary = update_summary("", "Narrator: The fox ran. It was late.\nChoice 1: x", "Follow")
+    summary = update_summary(summary, "Protagonist: A door! Behind it, stairs.", "")
+
+    assert summary == "The fox ran. → Follow\nA door!"
+
+
+def test_summary_stays_within_budget_and_keeps_recent_turns():
+    summary = ""
+    for turn in range(200):
+        summary = update_summary(
+            summary, f"Narrator: Scene {turn} begins here. More text.", f"choice {turn}"
+        )
+
+    lines = summary.splitlines()
+    assert estimate_tokens(summary) <= STORY_SUMMARY_TOKEN_BUDGET
+    assert lines[0].startswith("Earlier choices: ")
+    assert lines[0].endswith(f"; choice {200 - len(lines)}")   # newest demoted turn
+    assert lines[-1] == "Scene 199 begins here. → choice 199"
+    assert "Scene 0 " not in summary
+
+
+def test_context_stays_within_budget():
+    summary = "\n".join(f"Scene {i}. → choice {i}" for i in range(300))
+    story = "Narrator: " + "A very long scene. " * 500
+
+    context = build_context(summary, story, "Open the door")
+
+    assert estimate_tokens(context) <= STORY_CONTEXT_TOKEN_BUDGET
+    assert context.endswith("User chose: Open the door")
+    assert context.startswith("Previous story: …")   # no room left for the summary
+
+
+def test_long_summary_is_cut_from_the_front():
+    summary = "\n".join(f"Scene {i}. → choice {i}" for i in range(300))
+
+    context = build_context(summary, "The fox ran.", "Follow")
+
+    assert estimate_tokens(context) <= STORY_CONTEXT_TOKEN_BUDGET
+    assert context.startswith("Story so far:\n…")
+    assert "Scene 299. → choice 299\nPrevious story: The fox ran.\nUser chose: Follow" in context
+
+
+def test_short_context_is_untouched():
+    assert build_context("", "The fox ran.", "Follow") == (
+        "Previous story: The fox ran.\nUser chose: Follow"
+    )
+    assert build_context("Earlier.", "The fox ran.", "Follow").startswith("Story so far:\nEarlier.\n")
+
+
+def test_tokens_are_estimated_at_four_characters():
+    assert story_context.estimate_tokens("") == 0
+    assert story_context.estimate_tokens("abcd") == 1
+    assert story_context.estimate_tokens("abcde") == 2
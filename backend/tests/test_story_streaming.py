@@ -0,0 +1,89 @@
+"""
+SSE story streaming: `text` events carry the story as it arrives, then one
+`done` event carries the saved segment. `Choice N:` lines never leak into
+the text, however the model's chunks happen to split them.
+"""
+
+import json
+
+import pytest
+
+from conftest import make_user
+from src import story_engine
+
+pytestmark = pytest.mark.anyio
+
+RAW = "Narrator: The fox ran.\nProtagonist: Wait!\nChoice 1: Follow\nChoice 2: Stay"
+
+
+def events(body: str) -> list:
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        parsed.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return parsed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 13, len(RAW)])
+def test_filter_holds_back_split_choice_lines(size):
+    text_filter = story_engine.StoryTextFilter()
+    shown = "".join(text_filter.feed(RAW[i:i + size]) for i in range(0, len(RAW), size))
+
+    assert shown == "Narrator: The fox ran.\nProtagonist: Wait!\n"
+    assert shown.strip() == story_engine.parse_story_segment(RAW)[0]
+
+
+def test_filter_releases_lines_that_only_look_like_a_choice():
+    text_filter = story_engine.StoryTextFilter()
+
+    assert text_filter.feed("The fox ran.\nCho") == "The fox ran.\n"
+    assert text_filter.feed("irs sang.\n") == "Choirs sang.\n"
+
+
+async def test_start_stream_event_order(client, fake_model):
+    user = await make_user(client)
+
+    r = await client.post(
+        "/story/start/stream", json={"user_id": user["id"], "interests": ["fox", "moon", "bells"]}
+    )
+
+    assert r.headers["content-type"].startswith("text/event-stream")
+    stream = events(r.text)
+    names = [name for name, _ in stream]
+    assert names[-1] == "done" and set(names[:-1]) == {"text"}
+    assert len(names) > 2   # streamed, not sent in one piece
+    done = stream[-1][1]
+    assert "".join(data["delta"] for _, data in stream[:-1]).strip() == done["story_text"]
+    assert done["choices"] == {"1": "Go left", "2": "Go right"}
+    assert done["context_token"] and done["audio_id"]
+
+
+async def test_continue_stream(client, fake_model):
+    user = await make_user(client)
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["fox", "moon", "bells"]}
+    )
+    story = r.json()
+
+    r = await client.post("/story/continue/stream", json={
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    })
+
+    name, done = events(r.text)[-1]
+    assert name == "done"
+    assert done["session_id"] == story["session_id"]
+    assert done["context_token"] != story["context_token"]
+
+
+async def test_generation_failure_ends_with_an_error_event(client, fake_model, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(fake_model, "generate_content_async", broken)
+    user = await make_user(client)
+
+    r = await client.post(
+        "/story/start/stream", json={"user_id": user["id"], "interests": ["fox", "moon", "bells"]}
+    )
+
+    assert events(r.text) == [("error", {"detail": "Story generation failed"})]
@@ -0,0 +1,141 @@
+"""
+Signed context tokens: only the latest turn of a session can be continued,
+and bad tokens are refused before the database is touched.
+"""
+
+import asyncio
+import time
+import timeit
+
+import pytest
+
+from conftest import make_user
+from src import story_tokens
+
+pytestmark = pytest.mark.anyio
+
+
+def queries(response) -> int:
+    return int(response.headers["X-DB-Queries"])
+
+
+async def start(client) -> dict:
+    user = await make_user(client)
+    r = await client.post(
+        "/story/start", json={"user_id": user["id"], "interests": ["space", "cats", "pirates"]}
+    )
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def resign(token: str, **fields) -> str:
+    claims = story_tokens.verify_context_token(token)._replace(**fields)
+    payload = f"{claims.session_id}.{claims.seq}.{claims.expires_at}"
+    return f"{payload}.{story_tokens._sign(payload)}"
+
+
+def test_round_trip():
+    token = story_tokens.create_context_token(42, 7)
+    claims = story_tokens.verify_context_token(token)
+    assert (claims.session_id, claims.seq) == (42, 7)
+
+
+@pytest.mark.parametrize("token", [
+    "1.1.9999999999.AAAAAAAAAAAAAAAAAAAAAA",   # forged signature
+    "1.1.9999999999",                          # no signature
+    "1.1.9999999999.sig\n",                    # trailing newline
+    "1.١.9999999999.AAAAAAAAAAAAAAAAAAAAAA",   # non-ASCII digit
+    "1.1.9999999999.é",                        # non-ASCII signature
+])
+def test_bad_tokens_are_refused(token):
+    with pytest.raises(story_tokens.InvalidContextToken):
+        story_tokens.verify_context_token(token)
+
+
+def test_expired_token_is_refused():
+    token = story_tokens.create_context_token(1, 1, ttl=-1)
+    with pytest.raises(story_tokens.InvalidContextToken, match="expired"):
+        story_tokens.verify_context_token(token)
+
+
+async def test_replayed_token_conflicts(client, fake_model):
+    story = await start(client)
+    continuation = {
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    }
+
+    first = await client.post("/story/continue", json=continuation)
+    assert first.status_code == 200
+    replay = await client.post("/story/continue", json={**continuation, "choice": 2})
+    assert replay.status_code == 409
+    assert replay.json()["detail"] == "Context token is no longer current"
+    assert fake_model.calls == 2   # the replay never reached the model
+
+    latest = {**continuation, "context_token": first.json()["context_token"]}
+    assert (await client.post("/story/continue", json=latest)).status_code == 200
+
+
+async def test_concurrent_continues_save_one_turn(client, fake_model):
+    story = await start(client)
+    continuation = {
+        "session_id": story["session_id"], "context_token": story["context_token"], "choice": 1,
+    }
+
+    responses = await asyncio.gather(
+        *(client.post("/story/continue", json=continuation) for _ in range(5))
+    )
+
+    assert sorted(r.status_code for r in responses) == [200] + [409] * 4
+
+
+def bump_seq(token: str) -> str:
+    session_id, seq, rest = token.split(".", 2)
+    return f"{session_id}.{int(seq) + 1}.{rest}"   # not re-signed
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda token: token[:-1] + ("A" if token[-1] != "A" else "B"),
+    bump_seq,
+    lambda token: "١" + token,
+    lambda token: token + "é",
+])
+async def test_invalid_token_is_refused_without_db(client, fake_model, mangle):
+    story = await start(client)
+    r = await client.post("/story/continue", json={
+        "session_id": story["session_id"], "context_token": mangle(story["context_token"]),
+        "choice": 1,
+    })
+    assert r.status_code == 400
+    assert queries(r) == 0
+
+
+async def test_token_for_another_session_is_refused(client, fake_model):
+    story = await start(client)
+    other = resign(story["context_token"], session_id=story["session_id"] + 1000)
+    r = await client.post("/story/continue", json={
+        "session_id": story["session_id"], "context_token": other, "choice": 1,
+    })
+    assert r.status_code == 400
+    assert queries(r) == 0
+
+
+async def test_expired_token_is_refused_without_db(client, fake_model):
+    story = await start(client)
+    expired = resign(story["context_token"], expires_at=int(time.time()) - 1)
+    r = await client.post("/story/continue", json={
+        "session_id": story["session_id"], "context_token": expired, "choice": 1,
+    })
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Context token expired"
+    assert queries(r) == 0
+
+
+def test_benchmark_create_and_verify():
+    runs = 20000
+    token = story_tokens.create_context_token(123456, 42)
+    create = timeit.timeit(lambda: story_tokens.create_context_token(123456, 42), number=runs)
+    verify = timeit.timeit(lambda: story_tokens.verify_context_token(token), number=runs)
+    print(f"\ncreate {create / runs * 1e6:.1f} µs/token, verify {verify / runs * 1e6:.1f} µs/token")
+    # Far below a DB round trip, even on a slow CI box.
+    assert create / runs < 100e-6
+    assert verify / runs < 100e-6
@@ -0,0 +1,81 @@
+"""
+Story audio is synthesized in the background: responses carry an audio id
+whose state GET /story/audio/{id} reports, optionally long-polling for it.
+"""
+
+import threading
+import uuid
+
+import pytest
+
+from src import story_engine, tts_jobs
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def gate(monkeypatch, fake_model):
+    """Synthesis waits for the returned event (it writes the real fake MP3)."""
+    release = threading.Event()
+    synthesize = story_engine.generate_tts_audio
+
+    def gated(text, filename):
+        release.wait(5)
+        synthesize(text, filename)
+
+    monkeypatch.setattr(story_engine, "generate_tts_audio", gated)
+    yield release
+    release.set()
+
+
+def text() -> str:
+    return f"The owl said {uuid.uuid4().hex}."
+
+
+async def test_job_goes_from_pending_to_ready(gate):
+    story = text()
+    audio_id = tts_jobs.submit(story, tts_jobs.story_audio_filename(story))
+    assert tts_jobs.status(audio_id) == tts_jobs.PENDING
+    assert await tts_jobs.wait(audio_id, 0.05) == tts_jobs.PENDING   # timed out
+
+    gate.set()
+    assert await tts_jobs.wait(audio_id, 5) == tts_jobs.READY
+
+    tts_jobs._jobs.pop(audio_id)   # dropped from the history: the file still counts
+    assert tts_jobs.status(audio_id) == tts_jobs.READY
+
+
+async def test_failed_synthesis_is_reported(monkeypatch):
+    def broken(text, filename):
+        raise RuntimeError("gTTS is down")
+
+    monkeypatch.setattr(story_engine, "generate_tts_audio", broken)
+    story = text()
+    audio_id = tts_jobs.submit(story, tts_jobs.story_audio_filename(story))
+
+    assert await tts_jobs.wait(audio_id, 5) == tts_jobs.FAILED
+
+
+async def test_audio_endpoint_long_polls(client, gate):
+    story = text()
+    audio_id = tts_jobs.submit(story, tts_jobs.story_audio_filename(story))
+
+    r = await client.get(f"/story/audio/{audio_id}")
+    assert r.json()["status"] == "pending"
+
+    gate.set()
+    r = await client.get(f"/story/audio/{audio_id}", params={"wait": 5})
+    assert r.json() == {
+        "audio_id": audio_id, "status": "ready", "audio_url": f"/audio/{audio_id}.mp3",
+    }
+    assert (await client.get(r.json()["audio_url"])).status_code == 200
+
+
+@pytest.mark.parametrize("audio_id", ["does-not-exist", "..%2F..%2Fetc%2Fpasswd", "a.b"])
+async def test_unknown_audio_is_a_404(client, audio_id):
+    assert (await client.get(f"/story/audio/{audio_id}")).status_code == 404
+
+
+async def test_wait_is_bounded(client):
+    r = await client.get("/story/audio/x", params={"wait": 31})
+    assert r.status_code == 422